@@ -0,0 +1,221 @@
+import asyncio
+import json
+import time
+import httpx
+import legod
+import ratelimit
+import singleflight
+import tracing
+
+
+def create_client(pool_size: int = None) -> httpx.AsyncClient:
+    """
+    创建带连接池的异步 HTTP 客户端, 供 FastAPI 路由使用, 不阻塞事件循环
+    连接池大小与同步版本共用环境变量 LEIGOD_POOL_SIZE
+    """
+    if pool_size is None:
+        pool_size = legod._env_int("LEIGOD_POOL_SIZE", 10)
+    limits = httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+    return httpx.AsyncClient(limits=limits)
+
+
+class aiolegod(legod.legod):
+    """
+    legod 的异步版本, 方法名与返回值与 legod 保持一致, 调用时需要 await
+    """
+
+    singleflight = singleflight.AsyncSingleFlight()
+    limiter = ratelimit.AsyncRateLimiter.from_env()
+    breaker = ratelimit.CircuitBreaker.from_env()
+
+    def __init__(self, token = "", session: httpx.AsyncClient = None, notifier = None, account_name: str = "", base_url: str = None):
+        """
+        notifier 为 notifier.NotificationDispatcher, 设置后通知进入后台队列发送, account_name 用于通知去重与摘要
+        """
+        super().__init__(token, session=session, base_url=base_url)
+        self.notifier = notifier
+        self.account_name = account_name
+
+    def _create_session(self):
+        return create_client()
+
+    async def _post(self, endpoint: str, url: str, payload: dict, priority: int = None) -> tuple:
+        """
+        发送请求并返回 (解析后的响应, 是否为真正发出请求的调用者), 相同的并发请求会被合并
+        限流、退避重试与熔断同 legod._post; priority 为 None 时按接口决定
+        """
+        if priority is None:
+            priority = self._priority(endpoint)
+
+        async def send():
+            attempt = 0
+            while True:
+                if not self._breaker_allows(endpoint, priority):
+                    raise httpx.TransportError(self._breaker_message())
+                await self.limiter.acquire(priority)
+                started = time.perf_counter()
+                code = "network_error"
+                try:
+                    response = await self.session.post(url, data=payload, timeout=self._httpx_timeout())
+                    response.raise_for_status()
+                    res = json.loads(response.text)
+                    code = str(res.get("code"))
+                    self._record_success()
+                    return res
+                except httpx.HTTPStatusError as e:
+                    code = f"http_{e.response.status_code}"
+                    if not self._should_retry(endpoint, code, attempt, self._is_retryable(endpoint, e.response.status_code)):
+                        raise
+                except httpx.TransportError as e:
+                    sent = not isinstance(e, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout))
+                    if not self._should_retry(endpoint, code, attempt, self._is_retryable(endpoint, sent=sent)):
+                        raise
+                except json.JSONDecodeError:
+                    code = "invalid_json"
+                    self._record_success()
+                    raise
+                finally:
+                    legod.observe_upstream(endpoint, started, code)
+                await asyncio.sleep(ratelimit.backoff_delay(attempt))
+                attempt += 1
+        with tracing.span("upstream", endpoint):
+            return await self.singleflight.do(endpoint, self._request_key(url, payload), send)
+
+    def _httpx_timeout(self) -> httpx.Timeout:
+        connect_timeout, read_timeout = self.timeout
+        return httpx.Timeout(read_timeout, connect=connect_timeout)
+
+    async def update_token(self, token: str) -> tuple:
+        """
+        重置token信息, 初始化也需要用此方法
+        """
+        self._reset_token(token)
+        if token:
+            return await self.get_account_info()
+        return False, "Token 为空，无法更新。"
+
+    async def get_account_info(self) -> tuple:
+        """
+        获取账号信息
+        Returns
+        --------
+        :class:`tuple`
+            (True,账号信息) or (False,错误信息)
+        """
+        if self.token == "":
+            return False, "token信息无效, 请检查后再试"
+
+        token = self.token
+        try:
+            res, _ = await self._post("info", self.info_url, self._account_payload())
+            return self._handle_account_info(res, token)
+        except httpx.HTTPError as e:
+            self._token_expired(token)
+            return False, f"请求账号信息失败: {e}"
+        except json.JSONDecodeError:
+            self._token_expired(token)
+            return False, "解析账号信息响应失败。"
+
+    async def probe_status(self) -> tuple:
+        """
+        轻量的状态探测: 只请求 /api/user/info 读取暂停状态, 不请求和解析使用记录
+        返回 (True, 是否暂停) or (False, 错误信息); 网络错误不清空 token, 下次检查时重试
+        """
+        if not self.token:
+            return False, "Token 信息无效，无法获取账号状态。"
+
+        token = self.token
+        try:
+            res, _ = await self._post("info", self.info_url, self._account_payload())
+            return self._handle_status_probe(res, token)
+        except httpx.HTTPError as e:
+            return False, f"请求账号状态失败: {e}"
+        except json.JSONDecodeError:
+            return False, "解析账号状态响应失败。"
+
+    async def pause(self) -> tuple:
+        """
+        暂停加速,调用官网api
+        """
+        if self.token == "":
+            return False, "token信息无效, 请使用update_token方法更新后再试"
+        if self.stopp:
+            return False, "当前用户已经暂停加速"
+
+        token = self.token
+        try:
+            res, leader = await self._post("pause", self.pause_url, self._account_payload())
+            success, msg, should_notify = self._handle_pause(res, token)
+            # 合并的暂停请求只由真正发出请求的调用者发送通知
+            if should_notify and leader:
+                await self.notify("账号已成功暂停", "paused")
+            return success, msg
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code == 403:
+                return False, "未知错误，可能是请求频繁或者是网址更新"
+            return False, f"请求暂停失败: {e}"
+        except httpx.HTTPError as e:
+            return False, f"请求暂停失败: {e}"
+        except json.JSONDecodeError:
+            return False, "解析暂停响应失败。"
+
+    async def notify(self, message: str, kind: str = "message", dedup_key = None):
+        """
+        有通知队列时只入队, 不等待发送; 否则 sc_send 是同步请求, 放到线程中执行
+        """
+        if self.notifier is not None:
+            self.notifier.submit(self.account_name, kind, message, dedup_key)
+        else:
+            await asyncio.to_thread(legod.legod.notify, self, message)
+
+    async def get_usage_details_and_full_data(self) -> tuple:
+        """
+        获取雷神加速器使用明细，并返回完整的数据列表，以及当前加速时长。
+        返回 (bool, message, duration_minutes, full_data_dict)
+        """
+        if not self.token:
+            return False, "Token 信息无效，无法获取使用明细。", 0, None
+
+        token = self.token
+        try:
+            res, _ = await self._post("time_log", self.usage_detail_url, self._usage_payload())
+            return self._handle_usage_details(res, token)
+        except httpx.HTTPError as e:
+            return False, f"请求使用明细失败: {e}", 0, None
+        except json.JSONDecodeError:
+            return False, "解析使用明细响应失败。", 0, None
+        except Exception as e:
+            return False, f"处理使用明细时发生未知错误: {e}", 0, None
+
+    async def get_usage_page(self, page: int = 1, size: int = 5, background: bool = False) -> tuple:
+        """
+        获取指定页的使用记录 (最新的在前), background 为 True 时以低优先级取限流令牌 (后台回填)
+        返回 (bool, message, records_list)
+        """
+        if not self.token:
+            return False, "Token 信息无效，无法获取使用明细。", []
+
+        token = self.token
+        try:
+            priority = ratelimit.LOW if background else None
+            res, _ = await self._post("time_log", self.usage_detail_url, self._usage_payload(page, size), priority)
+            success, message, full_data = self._handle_usage_page(res, token)
+            return success, message, (full_data or {}).get("list") or []
+        except httpx.HTTPError as e:
+            return False, f"请求使用明细失败: {e}", []
+        except json.JSONDecodeError:
+            return False, "解析使用明细响应失败。", []
+
+    async def get_usage_details(self) -> tuple:
+        """
+        获取雷神加速器使用明细，并计算当前加速时长。
+        返回 (bool, message, duration_minutes)
+        """
+        success, message, duration_minutes, _ = await self.get_usage_details_and_full_data()
+        return success, message, duration_minutes
+
+    async def close(self):
+        """
+        关闭连接池
+        """
+        await self.session.aclose()
@@ -0,0 +1,205 @@
+"""
+使用时长统计: 按账号预先汇总每天/每周/每月的加速时长和自动暂停节省的时长, 查询只读汇总表, 耗时与记录总数无关
+- 历史回填在 SQLite 中用 GROUP BY 一次性聚合全部记录
+- 新记录写入时只重新计算其所在的桶
+- 加速时长按加速开始时间 (recover_time) 归入对应的桶, 已结束的加速才计入汇总, 进行中的加速在查询时实时加上
+  (是否进行中与 policy 的判断相同, 见 RUNNING_SQL)
+- 自动暂停节省的时长: 从自动暂停到下一次恢复加速, 尚未恢复的按当前时间计算
+"""
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import policy
+import store as usage_store
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS usage_rollups (
+    account TEXT NOT NULL,
+    period TEXT NOT NULL,
+    bucket TEXT NOT NULL,
+    sessions INTEGER NOT NULL,
+    accelerated_seconds INTEGER NOT NULL,
+    auto_pauses INTEGER NOT NULL,
+    saved_seconds INTEGER NOT NULL,
+    PRIMARY KEY (account, period, bucket)
+);
+CREATE TABLE IF NOT EXISTS auto_pauses (
+    account TEXT NOT NULL,
+    recover_time TEXT NOT NULL,
+    paused_at TEXT NOT NULL,
+    resumed_at TEXT,
+    PRIMARY KEY (account, recover_time)
+);
+CREATE INDEX IF NOT EXISTS usage_records_running ON usage_records (account) WHERE pause_time IS NULL OR pause_time = recover_time;
+"""
+
+# 进行中的加速, 与 policy.status_from_records 相同: 没有暂停时间, 或暂停时间等于恢复时间
+RUNNING_SQL = "(pause_time IS NULL OR pause_time = recover_time)"
+
+# 各统计周期的桶: SQL 表达式 (桶的名称) 与日期格式
+# 天: 2024-01-31, 周: 当周周一 2024-01-29, 月: 2024-01
+BUCKET_SQL = {
+    "day": "substr({column}, 1, 10)",
+    "week": "date({column}, '-6 days', 'weekday 1')",
+    "month": "substr({column}, 1, 7)",
+}
+PERIODS = tuple(BUCKET_SQL)
+
+
+def bucket_range(period: str, moment: datetime) -> Tuple[str, str, str]:
+    """
+    时间所在的桶, 返回 (桶名称, 开始时间, 结束时间), 时间范围为 [开始, 结束)
+    """
+    day = datetime(moment.year, moment.month, moment.day)
+    if period == "day":
+        start, end, name = day, day + timedelta(days=1), day.strftime("%Y-%m-%d")
+    elif period == "week":
+        start = day - timedelta(days=day.weekday())
+        end, name = start + timedelta(days=7), start.strftime("%Y-%m-%d")
+    elif period == "month":
+        start = day.replace(day=1)
+        end = (start + timedelta(days=32)).replace(day=1)
+        name = start.strftime("%Y-%m")
+    else:
+        raise ValueError(f"不支持的统计周期: {period}")
+    return name, start.strftime(policy.RECORD_TIME_FORMAT), end.strftime(policy.RECORD_TIME_FORMAT)
+
+
+def _aggregate_sql(period: str, condition: str = "") -> str:
+    """
+    聚合已结束的加速记录和已恢复的自动暂停, 写入汇总表
+    condition 中的 {column} 会替换为各自的时间列, 用于只计算部分桶
+    """
+    return f"""
+INSERT INTO usage_rollups (account, period, bucket, sessions, accelerated_seconds, auto_pauses, saved_seconds)
+SELECT account, '{period}', bucket, SUM(sessions), SUM(seconds), SUM(pauses), SUM(saved) FROM (
+    SELECT account, {BUCKET_SQL[period].format(column="recover_time")} AS bucket,
+           COUNT(*) AS sessions, SUM(COALESCE(reduce_pause_time, 0)) AS seconds, 0 AS pauses, 0 AS saved
+    FROM usage_records WHERE NOT {RUNNING_SQL} {condition.format(column="recover_time")}
+    GROUP BY account, bucket
+    UNION ALL
+    SELECT account, {BUCKET_SQL[period].format(column="paused_at")} AS bucket, 0, 0, COUNT(*),
+           SUM(CAST(strftime('%s', resumed_at) AS INTEGER) - CAST(strftime('%s', paused_at) AS INTEGER))
+    FROM auto_pauses WHERE resumed_at IS NOT NULL {condition.format(column="paused_at")}
+    GROUP BY account, bucket
+) GROUP BY account, bucket
+"""
+
+
+def attach(store: usage_store.UsageStore):
+    """
+    创建统计表并在记录写入时增量更新; 已有记录但还没有汇总时 (首次升级) 回填全部历史
+    """
+    with store.transaction() as conn:
+        # 旧版本的索引只包含 pause_time IS NULL, 汇总时把暂停时间等于恢复时间的记录算作已结束, 需要重新汇总
+        outdated = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'usage_records_open'").fetchone() is not None
+        conn.execute("DROP INDEX IF EXISTS usage_records_open")
+        conn.executescript(SCHEMA)
+        has_records = conn.execute("SELECT 1 FROM usage_records LIMIT 1").fetchone() is not None
+        has_rollups = conn.execute("SELECT 1 FROM usage_rollups LIMIT 1").fetchone() is not None
+    if has_records and (outdated or not has_rollups):
+        rebuild(store)
+    store.listeners.append(lambda account, records: _on_records(store, account, records))
+
+
+def rebuild(store: usage_store.UsageStore):
+    """
+    从全部记录重新计算所有汇总, 每个统计周期一条语句
+    """
+    with store.transaction() as conn:
+        conn.execute("DELETE FROM usage_rollups")
+        for period in PERIODS:
+            conn.execute(_aggregate_sql(period))
+
+
+def _refresh_buckets(conn, account: str, moments: Iterable[datetime]):
+    condition = "AND account = ? AND {column} >= ? AND {column} < ?"
+    moments = set(moments)
+    for period in PERIODS:
+        sql = _aggregate_sql(period, condition)
+        for name, start, end in {bucket_range(period, moment) for moment in moments}:
+            conn.execute("DELETE FROM usage_rollups WHERE account = ? AND period = ? AND bucket = ?", (account, period, name))
+            conn.execute(sql, (account, start, end, account, start, end))
+
+
+def _on_records(store: usage_store.UsageStore, account: str, records: List[dict]):
+    moments = [policy.parse_record_time(record.get("recover_time")) for record in records]
+    with store.transaction() as conn:
+        # 出现更晚的加速记录时, 之前的自动暂停视为已恢复
+        pending = conn.execute(
+            "SELECT recover_time, paused_at, "
+            "(SELECT MIN(r.recover_time) FROM usage_records r WHERE r.account = p.account AND r.recover_time > p.paused_at) AS resumed_at "
+            "FROM auto_pauses p WHERE account = ? AND resumed_at IS NULL",
+            (account,),
+        ).fetchall()
+        for row in pending:
+            if row["resumed_at"]:
+                conn.execute(
+                    "UPDATE auto_pauses SET resumed_at = ? WHERE account = ? AND recover_time = ?",
+                    (row["resumed_at"], account, row["recover_time"]),
+                )
+                moments.append(policy.parse_record_time(row["paused_at"]))
+        _refresh_buckets(conn, account, [moment for moment in moments if moment is not None])
+
+
+def record_auto_pause(store: usage_store.UsageStore, account: str, recover_time: str, paused_at: datetime):
+    """
+    记录一次成功的自动暂停, recover_time 为被暂停的那次加速的开始时间
+    """
+    with store.transaction() as conn:
+        conn.execute(
+            "INSERT INTO auto_pauses (account, recover_time, paused_at) VALUES (?, ?, ?) "
+            "ON CONFLICT (account, recover_time) DO NOTHING",
+            (account, recover_time, paused_at.strftime(policy.RECORD_TIME_FORMAT)),
+        )
+
+
+def query(store: usage_store.UsageStore, account: str, period: str = "day", limit: int = 30, now: Optional[datetime] = None) -> List[dict]:
+    """
+    最近 limit 个桶的统计 (按时间顺序), 进行中的加速和尚未恢复的自动暂停按 now 计算
+    """
+    if period not in BUCKET_SQL:
+        raise ValueError(f"不支持的统计周期: {period}")
+    now = now or datetime.now()
+    with store.transaction() as conn:
+        rows = conn.execute(
+            "SELECT bucket, sessions, accelerated_seconds, auto_pauses, saved_seconds FROM usage_rollups "
+            "WHERE account = ? AND period = ? ORDER BY bucket DESC LIMIT ?",
+            (account, period, limit),
+        ).fetchall()
+        running = conn.execute(
+            f"SELECT recover_time FROM usage_records WHERE account = ? AND {RUNNING_SQL}", (account,)
+        ).fetchall()
+        open_pauses = conn.execute(
+            "SELECT paused_at FROM auto_pauses WHERE account = ? AND resumed_at IS NULL", (account,)
+        ).fetchall()
+
+    buckets: Dict[str, dict] = {
+        row["bucket"]: {
+            "bucket": row["bucket"],
+            "sessions": row["sessions"],
+            "accelerated_seconds": row["accelerated_seconds"],
+            "auto_pauses": row["auto_pauses"],
+            "saved_seconds": row["saved_seconds"],
+        }
+        for row in rows
+    }
+
+    def live_bucket(moment: datetime) -> dict:
+        name = bucket_range(period, moment)[0]
+        return buckets.setdefault(name, {"bucket": name, "sessions": 0, "accelerated_seconds": 0, "auto_pauses": 0, "saved_seconds": 0})
+
+    for row in running:
+        started = policy.parse_record_time(row["recover_time"])
+        if started is not None and started <= now:
+            bucket = live_bucket(started)
+            bucket["sessions"] += 1
+            bucket["accelerated_seconds"] += int((now - started).total_seconds())
+    for row in open_pauses:
+        paused_at = policy.parse_record_time(row["paused_at"])
+        if paused_at is not None and paused_at <= now:
+            bucket = live_bucket(paused_at)
+            bucket["auto_pauses"] += 1
+            bucket["saved_seconds"] += int((now - paused_at).total_seconds())
+
+    return [buckets[name] for name in sorted(buckets)][-limit:]
@@ -0,0 +1,255 @@
+"""
+端到端基准测试, 全部请求发往本地模拟服务 (bench/mock_leigod.py), 不访问真实接口
+
+测量内容:
+- FastAPI 路由 (GET /, POST /update-token, POST /pause) 的 p50/p99 延迟与吞吐
+- 1~1000 个账号时一轮定时检查的耗时 (首次回填与增量两种情况)
+- 每个账号占用的内存
+- 无界面模式 (daemon.py --once) 的峰值内存与启动耗时, 与 DAEMON_TARGETS 比较
+
+用法:
+    python bench/benchmark.py --accounts 1,10,100,1000 --latency-ms 50 --output bench_results.json
+
+    python bench/benchmark.py --daemon-only    # 只测无界面模式, 适合在路由器/NAS 上运行
+
+结果以 JSON 输出, 可保存后在不同提交之间比较
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import uvicorn
+import httpx
+
+import mock_leigod
+
+# 无界面模式的目标: 峰值常驻内存 (MB) 与启动耗时 (进程启动到导入完成, 秒)
+DAEMON_TARGETS = {"max_rss_mb": 32, "startup_s": 0.3}
+
+# 在子进程中运行 daemon.py, 最后输出导入耗时和峰值内存
+DAEMON_RUNNER = """
+import resource, runpy, sys, time
+started = time.perf_counter()
+sys.argv = ["daemon.py", "--once"]
+module = runpy.run_path("daemon.py")
+# daemon.py 载入配置文件后才导入 legod, 一并计入导入耗时
+import legod
+imported = time.perf_counter()
+module["main"]()
+finished = time.perf_counter()
+# ru_maxrss 在 Linux 上会继承 fork 时父进程的峰值, 优先读取 /proc 中本进程的峰值 (KB)
+try:
+    max_rss_kb = next(int(line.split()[1]) for line in open("/proc/self/status") if line.startswith("VmHWM:"))
+except OSError:
+    max_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 if sys.platform == "darwin" else 1)
+print("BENCH", imported - started, finished - imported, max_rss_kb)
+"""
+
+
+class ServerThread(object):
+    """
+    在后台线程中运行 uvicorn
+    """
+
+    def __init__(self, app, port: int):
+        self.server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc):
+        self.server.should_exit = True
+        self.thread.join(10)
+
+
+def summarize(latencies: list, elapsed: float) -> dict:
+    latencies = sorted(latencies)
+    quantiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+    return {
+        "requests": len(latencies),
+        "p50_ms": round(quantiles[49] * 1000, 3),
+        "p99_ms": round(quantiles[98] * 1000, 3),
+        "mean_ms": round(statistics.mean(latencies) * 1000, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else None,
+    }
+
+
+async def load(client: httpx.AsyncClient, method: str, path: str, total: int, concurrency: int, data_factory=None) -> dict:
+    latencies = []
+    counter = iter(range(total))
+
+    async def worker():
+        for index in counter:
+            data = data_factory(index) if data_factory else None
+            started = time.perf_counter()
+            response = await client.request(method, path, data=data)
+            latencies.append(time.perf_counter() - started)
+            if response.status_code >= 400:
+                raise RuntimeError(f"{method} {path} -> {response.status_code}")
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, time.perf_counter() - started)
+
+
+def bench_routes(main, port: int, total: int, concurrency: int) -> dict:
+    async def run():
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", follow_redirects=False, timeout=60) as client:
+            await client.get("/")
+            return {
+                "GET /": await load(client, "GET", "/", total, concurrency),
+                "POST /update-token": await load(
+                    client, "POST", "/update-token", max(1, total // 4), concurrency,
+                    lambda index: {"account": f"route{index % concurrency}", "token": f"route-token-{index % concurrency:04d}"},
+                ),
+                "POST /pause": await load(
+                    client, "POST", "/pause", max(1, total // 4), concurrency,
+                    lambda index: {"account": f"route{index % concurrency}"},
+                ),
+            }
+
+    with ServerThread(main.app, port):
+        return asyncio.run(run())
+
+
+def bench_check_cycles(main, account_counts: list) -> list:
+    async def run(count: int) -> dict:
+        # 每轮使用新的本地库, 不恢复上一轮保存的账号
+        os.environ["HISTORY_DB_PATH"] = os.path.join(tempfile.mkdtemp(prefix="leigod-bench-"), "leigod.db")
+        tracemalloc.start()
+        baseline = tracemalloc.take_snapshot()
+        state = main.AppState()
+        # 不经过 lifespan, 直接取得主节点租约才能运行定时检查
+        state.lease.try_acquire()
+        main.app.state = state
+        for index in range(count):
+            state.add_account(f"bench{index:06d}", f"bench-token-{index:06d}")
+
+        started = time.perf_counter()
+        await main.check_due_accounts()
+        cold = time.perf_counter() - started
+
+        for account in state.accounts.values():
+            account.next_check_at = 0
+        started = time.perf_counter()
+        await main.check_due_accounts()
+        warm = time.perf_counter() - started
+
+        snapshot = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        allocated = sum(stat.size_diff for stat in snapshot.compare_to(baseline, "filename"))
+        await state.client.aclose()
+        state.store.close()
+        return {
+            "accounts": count,
+            "cold_cycle_s": round(cold, 4),
+            "warm_cycle_s": round(warm, 4),
+            "memory_per_account_kb": round(allocated / count / 1024, 2),
+        }
+
+    return [asyncio.run(run(count)) for count in account_counts]
+
+
+def bench_daemon(account_counts: list) -> list:
+    """
+    无界面模式检查 N 个账号一次的峰值内存与耗时
+    """
+    results = []
+    for count in account_counts:
+        env = dict(os.environ, tokens=",".join(f"daemon{index}:daemon-token-{index:06d}" for index in range(count)))
+        output = subprocess.check_output([sys.executable, "-c", DAEMON_RUNNER], cwd=ROOT, env=env, stderr=subprocess.DEVNULL)
+        line = next(line for line in output.decode().splitlines() if line.startswith("BENCH "))
+        import_s, check_s, max_rss_kb = (float(value) for value in line.split()[1:])
+        max_rss_mb = max_rss_kb / 1024
+        results.append({
+            "accounts": count + 1,
+            "startup_s": round(import_s, 4),
+            "check_s": round(check_s, 4),
+            "max_rss_mb": round(max_rss_mb, 1),
+            "within_target": max_rss_mb <= DAEMON_TARGETS["max_rss_mb"] and import_s <= DAEMON_TARGETS["startup_s"],
+        })
+    return results
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=ROOT, stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return ""
+
+
+def main():
+    parser = argparse.ArgumentParser(description="雷神加速器暂停服务基准测试")
+    parser.add_argument("--accounts", default="1,10,100,1000", help="检查周期测试的账号数, 逗号分隔")
+    parser.add_argument("--requests", type=int, default=200, help="GET / 的请求数, 其余路由为其 1/4")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--latency-ms", type=float, default=50, help="模拟接口延迟")
+    parser.add_argument("--jitter-ms", type=float, default=10)
+    parser.add_argument("--mock-port", type=int, default=19000)
+    parser.add_argument("--app-port", type=int, default=19001)
+    parser.add_argument("--daemon-accounts", default="0,9,99", help="无界面模式测试的额外账号数 (另有 token 默认账号), 逗号分隔")
+    parser.add_argument("--daemon-only", action="store_true", help="只测无界面模式")
+    parser.add_argument("--output", help="结果 JSON 保存路径, 不指定时输出到标准输出")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="leigod-bench-")
+    os.environ["LEIGOD_API_BASE_URL"] = f"http://127.0.0.1:{args.mock_port}"
+    os.environ["HISTORY_DB_PATH"] = os.path.join(workdir, "leigod.db")
+    os.environ["serverchan_sendkey"] = ""
+    os.environ["token"] = "bench-route-token"
+    os.environ["tokens"] = ""
+    os.environ.setdefault("MAX_CONCURRENT_CHECKS", str(max(args.concurrency, 10)))
+    os.environ.setdefault("LEIGOD_POOL_SIZE", os.environ["MAX_CONCURRENT_CHECKS"])
+    # 默认不限流, 测量服务本身的开销; 需要时可通过环境变量指定
+    os.environ.setdefault("LEIGOD_RATE_LIMIT", "0")
+    os.chdir(ROOT)
+
+    config = mock_leigod.MockConfig(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms)
+    routes, cycles = {}, []
+    with ServerThread(mock_leigod.create_app(config), args.mock_port):
+        # 先在干净的子进程中测无界面模式, 不受本进程已加载模块的影响
+        daemon = bench_daemon([int(count) for count in args.daemon_accounts.split(",") if count])
+        if not args.daemon_only:
+            import main as service
+            service.logger.setLevel(logging.WARNING)
+            routes = bench_routes(service, args.app_port, args.requests, args.concurrency)
+            cycles = bench_check_cycles(service, [int(count) for count in args.accounts.split(",") if count])
+
+    result = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "params": vars(args),
+        },
+        "routes": routes,
+        "check_cycle": cycles,
+        "daemon": {"targets": DAEMON_TARGETS, "results": daemon},
+    }
+    output = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
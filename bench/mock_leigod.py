@@ -0,0 +1,195 @@
+"""
+雷神加速器接口的本地模拟服务, 实现 /api/user/info, /api/user/pause, /api/user/time/log
+
+用法:
+    python bench/mock_leigod.py --port 9000 --latency-ms 150 --error-rate 0.01 --throttle-rate 0.01
+    LEIGOD_API_BASE_URL=http://127.0.0.1:9000 python main.py
+
+token 以 "expired" 开头时接口返回 400006 (token 失效)
+"""
+import argparse
+import asyncio
+import random
+from datetime import datetime, timedelta
+from typing import List
+
+from fastapi import FastAPI, Form, Request
+from fastapi.responses import JSONResponse
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+class MockConfig(object):
+    def __init__(
+        self,
+        latency_ms: float = 0,
+        jitter_ms: float = 0,
+        error_rate: float = 0,
+        throttle_rate: float = 0,
+        expire_rate: float = 0,
+        history_size: int = 20,
+        accelerating_minutes: float = 60,
+    ):
+        # 每次请求的延迟 (毫秒) 及随机抖动
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        # 返回 HTTP 500 的概率
+        self.error_rate = error_rate
+        # 返回 HTTP 403 (请求频繁) 的概率
+        self.throttle_rate = throttle_rate
+        # 返回 400006 (token 失效) 的概率
+        self.expire_rate = expire_rate
+        # 每个 token 初始生成的历史记录条数
+        self.history_size = history_size
+        # 初始状态下最新一次加速已持续的分钟数
+        self.accelerating_minutes = accelerating_minutes
+
+
+class MockAccount(object):
+    def __init__(self, token: str, config: MockConfig):
+        self.token = token
+        now = datetime.now()
+        started = now - timedelta(minutes=config.accelerating_minutes)
+        # 最新的在前, 最新一条为加速中
+        self.records: List[dict] = [{"recover_time": started.strftime(TIME_FORMAT), "pause_time": None, "reduce_pause_time": 0}]
+        cursor = started
+        for _ in range(config.history_size - 1):
+            pause_time = cursor - timedelta(hours=random.randint(1, 48))
+            recover_time = pause_time - timedelta(minutes=random.randint(10, 600))
+            self.records.append({
+                "recover_time": recover_time.strftime(TIME_FORMAT),
+                "pause_time": pause_time.strftime(TIME_FORMAT),
+                "reduce_pause_time": int((pause_time - recover_time).total_seconds()),
+            })
+            cursor = recover_time
+
+    @property
+    def paused(self) -> bool:
+        latest = self.records[0]
+        return latest["pause_time"] is not None
+
+    def pause(self):
+        latest = self.records[0]
+        now = datetime.now()
+        latest["pause_time"] = now.strftime(TIME_FORMAT)
+        latest["reduce_pause_time"] = int((now - datetime.strptime(latest["recover_time"], TIME_FORMAT)).total_seconds())
+
+    def resume(self):
+        self.records.insert(0, {"recover_time": datetime.now().strftime(TIME_FORMAT), "pause_time": None, "reduce_pause_time": 0})
+
+
+def create_app(config: MockConfig = None) -> FastAPI:
+    config = config or MockConfig()
+    app = FastAPI()
+    app.state.config = config
+    app.state.accounts = {}
+    app.state.request_count = 0
+
+    def get_account(token: str) -> MockAccount:
+        account = app.state.accounts.get(token)
+        if account is None:
+            account = MockAccount(token, app.state.config)
+            app.state.accounts[token] = account
+        return account
+
+    @app.middleware("http")
+    async def simulate_network(request: Request, call_next):
+        cfg = app.state.config
+        app.state.request_count += 1
+        delay = cfg.latency_ms + random.uniform(0, cfg.jitter_ms)
+        if delay:
+            await asyncio.sleep(delay / 1000)
+        if not request.url.path.startswith("/api/"):
+            return await call_next(request)
+        if random.random() < cfg.error_rate:
+            return JSONResponse({"code": -1, "msg": "internal error"}, status_code=500)
+        if random.random() < cfg.throttle_rate:
+            return JSONResponse({"code": -1, "msg": "forbidden"}, status_code=403)
+        return await call_next(request)
+
+    def token_error(token: str):
+        if token.startswith("expired") or random.random() < app.state.config.expire_rate:
+            return {"code": 400006, "msg": "账号登录信息已失效，请重新登录"}
+        return None
+
+    @app.post("/api/user/info")
+    async def info(account_token: str = Form("")):
+        error = token_error(account_token)
+        if error:
+            return error
+        account = get_account(account_token)
+        return {
+            "code": 0,
+            "msg": "ok",
+            "data": {
+                "nickname": f"mock-{account_token[:6]}",
+                "pause_status_id": 1 if account.paused else 0,
+                "pause_status": "已暂停" if account.paused else "加速中",
+            },
+        }
+
+    @app.post("/api/user/pause")
+    async def pause(account_token: str = Form("")):
+        error = token_error(account_token)
+        if error:
+            return error
+        account = get_account(account_token)
+        if account.paused:
+            return {"code": 400803, "msg": "当前已是暂停状态"}
+        account.pause()
+        return {"code": 0, "msg": "暂停成功"}
+
+    @app.post("/api/user/time/log")
+    async def time_log(account_token: str = Form(""), page: int = Form(1), size: int = Form(5)):
+        error = token_error(account_token)
+        if error:
+            return error
+        account = get_account(account_token)
+        start = (page - 1) * size
+        return {
+            "code": 0,
+            "msg": "ok",
+            "data": {"list": [dict(record) for record in account.records[start:start + size]], "total": len(account.records)},
+        }
+
+    @app.post("/mock/resume")
+    async def resume(account_token: str = Form("")):
+        """
+        模拟用户在客户端恢复加速
+        """
+        account = get_account(account_token)
+        if account.paused:
+            account.resume()
+        return {"code": 0}
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="雷神加速器接口模拟服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--error-rate", type=float, default=0)
+    parser.add_argument("--throttle-rate", type=float, default=0)
+    parser.add_argument("--expire-rate", type=float, default=0)
+    parser.add_argument("--history-size", type=int, default=20)
+    parser.add_argument("--accelerating-minutes", type=float, default=60)
+    args = parser.parse_args()
+
+    import uvicorn
+    config = MockConfig(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        expire_rate=args.expire_rate,
+        history_size=args.history_size,
+        accelerating_minutes=args.accelerating_minutes,
+    )
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
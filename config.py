@@ -0,0 +1,43 @@
+"""
+账号相关的环境变量配置, 网页服务 (main.py) 与无界面模式 (daemon.py) 共用, 只依赖标准库
+"""
+import logging
+import os
+from typing import Dict
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ACCOUNT = "default"
+
+
+def mask_token(token: str, visible_chars: int = 6) -> str:
+    """
+    对Token进行脱敏处理，只显示开头和结尾的指定字符数，中间用星号代替。
+    """
+    if not token or len(token) <= visible_chars * 2:
+        return token  # Token 太短，不进行脱敏
+
+    start = token[:visible_chars]
+    end = token[-visible_chars:]
+    return f"{start}***{end}"
+
+
+def parse_env_accounts() -> Dict[str, str]:
+    """
+    从环境变量读取账号:
+    token 为默认账号, tokens 为额外账号, 格式 "名称1:token1,名称2:token2"
+    """
+    accounts = {}
+    default_token = os.getenv('token', "")
+    if default_token:
+        accounts[DEFAULT_ACCOUNT] = default_token
+    for item in os.getenv('tokens', "").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        name, sep, token = item.partition(":")
+        if not sep or not name.strip() or not token.strip():
+            logger.warning(f"环境变量 tokens 中的账号配置无效，已忽略: {mask_token(item)}")
+            continue
+        accounts[name.strip()] = token.strip()
+    return accounts
@@ -0,0 +1,211 @@
+"""
+无界面模式: 只运行定时检查、自动暂停和通知, 不加载 FastAPI / uvicorn / Jinja2 / pydantic, 适合路由器、NAS 等内存较小的设备
+使用同步的 legod.legod 请求接口, 阈值判断和检查时间的计算与网页服务相同 (policy)
+
+用法:
+    python daemon.py                              # 从环境变量和当前目录的 .env 读取配置
+    python daemon.py --config /etc/leigod.env     # 从指定文件读取配置, 已设置的环境变量优先
+    python daemon.py --once                       # 检查所有账号一次后退出, 可配合 cron 使用
+
+配置项与网页服务相同: token / tokens (多个账号) / serverchan_sendkey / WARNING_THRESHOLD_MINUTES /
+PAUSE_THRESHOLD_MINUTES / CHECK_INTERVAL_MINUTES / DEADLINE_MARGIN_SECONDS / PAUSE_RETRY_SECONDS / USAGE_REFRESH_MINUTES / LEIGOD_* 等
+不使用本地库, 通知去重记录只保存在内存中, 重启后同一次加速的警告可能再发送一次
+"""
+import argparse
+import logging
+import os
+import signal
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import List, Optional
+
+import config
+import policy
+
+logger = logging.getLogger("daemon")
+
+# 每个账号保留的通知去重记录数, 只需覆盖最近几次加速, 长期运行时内存不增长
+NOTIFIED_KEYS = 16
+# 休眠后晚于计划时间超过该秒数才醒来 (设备休眠、进程被挂起) 时, 下次检查请求使用明细
+OVERSLEEP_SECONDS = 60
+
+
+class DaemonAccount(object):
+    """
+    单个账号的检查状态
+    """
+
+    def __init__(self, name: str, client):
+        """
+        client 为 legod.legod 实例
+        """
+        self.name = name
+        self.client = client
+        # True: 暂停, False: 加速中, None: 尚未确定
+        self.paused: Optional[bool] = None
+        # 加速中时本次加速的开始时间, 只探测状态时用于计算加速时长和截止时间
+        self.accelerating_since: Optional[datetime] = None
+        # 最后一次请求使用明细的时间戳
+        self.last_checked_at: float = 0
+        # 下次检查必须请求使用明细 (不只探测状态): 启动时和长时间挂起后置位, 期间的恢复加速和暂停只能从使用明细发现
+        self.force_usage: bool = True
+        # 下次检查的时间戳, 0 表示立即检查
+        self.next_check_at: float = 0
+        # 最近发送的通知 (类型, 去重键), 同一次加速的同类通知只发送一次; 最多保留 NOTIFIED_KEYS 条
+        self.notified: "OrderedDict[tuple, None]" = OrderedDict()
+
+    def notify(self, kind: str, dedup_key: str, message: str):
+        if (kind, dedup_key) in self.notified:
+            return
+        self.notified[(kind, dedup_key)] = None
+        if len(self.notified) > NOTIFIED_KEYS:
+            self.notified.popitem(last=False)
+        logger.info(f"账号 {self.name} 通知: {message}")
+        try:
+            self.client.notify(f"[{self.name}] {message}")
+        except Exception as e:
+            logger.error(f"账号 {self.name} 发送通知失败: {e}")
+
+
+def fetch_status(account: DaemonAccount) -> tuple:
+    """
+    两级请求 (与网页服务相同): policy.usage_due 和 force_usage 都为 False 时先探测账号状态, 与上次相同就不再请求使用明细
+    返回 (True, policy.AccountStatus) or (False, 错误信息)
+    """
+    now = datetime.now()
+    if not account.force_usage and not policy.usage_due(account.paused, account.accelerating_since, now, account.last_checked_at):
+        success, probed = account.client.probe_status()
+        if success and probed == account.paused:
+            return True, policy.status_from_probe(probed, account.accelerating_since, now)
+        if not success and not account.client.token:
+            return False, probed
+    success, message, _, full_data = account.client.get_usage_details_and_full_data()
+    if not success:
+        return False, message
+    account.force_usage = False
+    return True, policy.status_from_records(full_data["list"])
+
+
+def check(account: DaemonAccount):
+    """
+    检查一个账号: 提醒恢复加速, 超过警告阈值发送通知, 超过暂停阈值自动暂停, 然后计算下次检查时间
+    """
+    success, result = fetch_status(account)
+    if not success:
+        logger.error(f"账号 {account.name} 获取使用明细失败: {result}")
+        if not account.client.token:
+            logger.error(f"账号 {account.name} Token 已失效，不再检查，请更新配置后重启。")
+        # 沿用已知的加速开始时间, 已超过暂停阈值时按 PAUSE_RETRY_SECONDS 重试
+        schedule_next_check(account)
+        return
+
+    status: policy.AccountStatus = result
+    if status.records is None:
+        # 只探测了状态: 与上次相同且未到阈值截止时间
+        logger.info(f"账号 {account.name}: {status.message}")
+    else:
+        decision = policy.decide(account.paused, account.last_checked_at, status, previous_since=account.accelerating_since)
+        for kind, dedup_key, notification in decision.notifications:
+            account.notify(kind, dedup_key, notification)
+        if decision.paused is not None:
+            account.paused = decision.paused
+        account.last_checked_at = time.time()
+
+        if decision.action == "auto_pause":
+            pause_success, pause_msg = account.client.pause()
+            logger.info(f"账号 {account.name} 自动暂停{'成功' if pause_success else '失败'}: {pause_msg}")
+            if pause_success:
+                account.paused = True
+        elif decision.action is None:
+            logger.info(f"账号 {account.name}: {status.message}")
+        account.accelerating_since = status.accelerating_since if account.paused is False else None
+    schedule_next_check(account)
+
+
+def schedule_next_check(account: DaemonAccount):
+    """
+    下次检查时间与网页服务相同: 阈值截止时间后几秒, 超过暂停阈值仍在加速时短间隔重试, 否则兜底轮询
+    """
+    now = datetime.now()
+    next_check = policy.next_check_time(account.accelerating_since, now)
+    account.next_check_at = time.time() + (next_check - now).total_seconds()
+    logger.info(f"账号 {account.name} 下次检查时间: {next_check.strftime('%Y-%m-%d %H:%M:%S')}")
+
+
+def run(accounts: List[DaemonAccount], stop: threading.Event, once: bool = False):
+    """
+    依次检查已到检查时间的账号, 然后休眠到最早的下次检查时间; stop 被设置时退出
+    """
+    while not stop.is_set():
+        now = time.time()
+        for account in accounts:
+            if stop.is_set():
+                return
+            if not account.client.token or account.next_check_at > now:
+                continue
+            try:
+                check(account)
+            except Exception as e:
+                logger.error(f"账号 {account.name} 检查异常: {e}")
+                account.next_check_at = time.time() + policy.get_check_interval_minutes() * 60
+        next_check_times = [account.next_check_at for account in accounts if account.client.token]
+        if once or not next_check_times:
+            if not next_check_times:
+                logger.warning("没有有效的 Token，退出。")
+            return
+        wake_at = max(time.time() + 1.0, min(next_check_times))
+        stop.wait(wake_at - time.time())
+        if time.time() - wake_at > OVERSLEEP_SECONDS:
+            logger.warning(f"休眠比计划晚 {time.time() - wake_at:.0f} 秒结束，下次检查重新请求使用明细。")
+            for account in accounts:
+                account.force_usage = True
+
+
+def load_config(path: Optional[str]):
+    """
+    从文件 (格式同 .env) 读取配置, 已设置的环境变量优先; 未指定时读取当前目录的 .env (如果存在)
+    """
+    if path and not os.path.exists(path):
+        raise SystemExit(f"配置文件不存在: {path}")
+    path = path or ".env"
+    if not os.path.exists(path):
+        return
+    from dotenv import load_dotenv
+
+    load_dotenv(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="雷神加速器自动暂停 (无界面模式)")
+    parser.add_argument("--config", help="配置文件路径, 格式同 .env")
+    parser.add_argument("--once", action="store_true", help="检查所有账号一次后退出")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    load_config(args.config)
+    # 限流器、熔断器和追踪开关在导入时读取配置, 载入配置文件之后再导入
+    import legod
+
+    tokens = config.parse_env_accounts()
+    if not tokens:
+        logger.error("未配置 token 或 tokens，退出。")
+        raise SystemExit(1)
+    # 所有账号共用一个连接池
+    session = legod.create_session()
+    accounts = [DaemonAccount(name, legod.legod(token=token, session=session)) for name, token in tokens.items()]
+    logger.info(f"无界面模式已启动，共 {len(accounts)} 个账号: {', '.join(tokens)}")
+
+    stop = threading.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: stop.set())
+    try:
+        run(accounts, stop, once=args.once)
+    finally:
+        session.close()
+        logger.info("无界面模式已退出。")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+import asyncio
+import json
+import logging
+from collections import deque
+from typing import Deque, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+
+class EventBroker(object):
+    """
+    服务端推送 (SSE) 的事件分发: 后台检查任务发布一次, 所有连接的页面共享同一份已编码的消息
+    - 每个订阅者一个有界队列, 消费太慢时断开, 浏览器重连后通过 Last-Event-ID 补发
+    - 保留最近 history_size 条事件用于补发
+    """
+
+    def __init__(self, history_size: int = 200, queue_size: int = 256):
+        self.queue_size = queue_size
+        self._history: Deque[tuple] = deque(maxlen=history_size)
+        self._subscribers: Set[asyncio.Queue] = set()
+        self._next_id = 1
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def publish(self, event: str, data: dict):
+        """
+        发布事件, 不阻塞; 必须在事件循环线程中调用
+        """
+        event_id = self._next_id
+        self._next_id += 1
+        frame = f"id: {event_id}\nevent: {event}\ndata: {json.dumps(data, ensure_ascii=False, separators=(',', ':'))}\n\n"
+        self._history.append((event_id, frame))
+        for queue in list(self._subscribers):
+            try:
+                queue.put_nowait(frame)
+            except asyncio.QueueFull:
+                logger.warning("事件订阅者消费过慢，已断开连接。")
+                self._drop(queue)
+
+    def subscribe(self, last_event_id: Optional[str] = None) -> asyncio.Queue:
+        """
+        订阅事件, 返回的队列中为已编码的 SSE 消息, 收到 None 表示连接需要关闭
+        last_event_id 为浏览器重连时带上的 Last-Event-ID, 会先补发之后的事件
+        """
+        queue: asyncio.Queue = asyncio.Queue(self.queue_size)
+        for frame in self._missed(last_event_id):
+            queue.put_nowait(frame)
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._subscribers.discard(queue)
+
+    def close(self):
+        """
+        关闭所有连接, 服务停止时调用
+        """
+        for queue in list(self._subscribers):
+            self._drop(queue)
+
+    def _missed(self, last_event_id: Optional[str]) -> List[str]:
+        try:
+            last = int(last_event_id) if last_event_id else None
+        except ValueError:
+            last = None
+        if last is None:
+            return []
+        missed = [frame for event_id, frame in self._history if event_id > last]
+        return missed[-self.queue_size + 1:]
+
+    def _drop(self, queue: asyncio.Queue):
+        self._subscribers.discard(queue)
+        # 清空后放入结束标记, 保证标记一定能放入
+        while not queue.empty():
+            queue.get_nowait()
+        queue.put_nowait(None)
@@ -0,0 +1,88 @@
+"""
+多进程 / 多副本部署时的主节点租约, 保存在共享的本地 SQLite 库中
+只有持有租约的进程运行后台定时检查 (请求雷神接口、自动暂停、发送通知), 其他进程只提供页面和接口读取
+持有者每 ttl/3 秒续约一次; 持有者退出时主动释放, 异常退出时其他进程最迟在 ttl + ttl/3 秒后接管
+"""
+import os
+import socket
+import time
+
+import store as usage_store
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS leases (
+    name TEXT PRIMARY KEY,
+    holder TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+"""
+
+
+def get_lease_seconds() -> float:
+    try:
+        return max(1.0, float(os.getenv("LEADER_LEASE_SECONDS", "15")))
+    except ValueError:
+        return 15.0
+
+
+class LeaderLease(object):
+    """
+    基于 SQLite 的租约: 获取和续约是同一条 UPSERT 语句, 只有租约属于自己或已过期时才会写入,
+    多个进程同时竞争时由 SQLite 的写锁保证只有一个成功
+    """
+
+    def __init__(self, store: usage_store.UsageStore, name: str = "checker", ttl: float = None):
+        self.store = store
+        self.name = name
+        self.ttl = get_lease_seconds() if ttl is None else ttl
+        # 同一主机上同时运行的进程 pid 不同; 容器重启后主机名和 pid 通常不变, 可以立即取回上次未释放的租约
+        self.holder = f"{socket.gethostname()}:{os.getpid()}"
+        # 本进程持有的租约到期时间, 0 表示未持有
+        self.expires_at = 0.0
+        with store.transaction() as conn:
+            conn.executescript(SCHEMA)
+
+    @property
+    def renew_interval(self) -> float:
+        return self.ttl / 3
+
+    def is_held(self) -> bool:
+        """
+        本进程当前是否持有租约 (按上次续约的到期时间判断, 不访问数据库)
+        """
+        return time.time() < self.expires_at
+
+    def try_acquire(self) -> bool:
+        """
+        获取或续约, 返回本进程是否持有租约
+        """
+        now = time.time()
+        expires_at = now + self.ttl
+        with self.store.transaction() as conn:
+            conn.execute(
+                "INSERT INTO leases (name, holder, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (name) DO UPDATE SET holder = excluded.holder, expires_at = excluded.expires_at "
+                "WHERE leases.holder = excluded.holder OR leases.expires_at < ?",
+                (self.name, self.holder, expires_at, now),
+            )
+            row = conn.execute("SELECT holder FROM leases WHERE name = ?", (self.name,)).fetchone()
+        self.expires_at = expires_at if row is not None and row["holder"] == self.holder else 0.0
+        return self.expires_at > 0
+
+    def current_holder(self) -> str:
+        """
+        当前未过期的租约持有者, 没有时返回空字符串
+        """
+        with self.store.transaction() as conn:
+            row = conn.execute(
+                "SELECT holder FROM leases WHERE name = ? AND expires_at >= ?", (self.name, time.time())
+            ).fetchone()
+        return row["holder"] if row is not None else ""
+
+    def release(self):
+        """
+        主动释放租约, 其他进程下一次续约时即可接管
+        """
+        self.expires_at = 0.0
+        with self.store.transaction() as conn:
+            conn.execute("DELETE FROM leases WHERE name = ? AND holder = ?", (self.name, self.holder))
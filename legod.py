@@ -1,22 +1,95 @@
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
 import json
 from datetime import datetime, timedelta
-from serverchan_sdk import sc_send
 import os
+import time
+import metrics
+import policy
+import ratelimit
+import singleflight
+import tracing
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        value = int(os.getenv(name, default))
+        return value if value > 0 else default
+    except ValueError:
+        return default
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        value = float(os.getenv(name, default))
+        return value if value > 0 else default
+    except ValueError:
+        return default
+
+
+def create_session(pool_size: int = None) -> requests.Session:
+    """
+    创建带连接池的 Session, 复用 TCP/TLS 连接 (keep-alive), 响应的 gzip 由 requests 自动解压
+    连接池大小由环境变量 LEIGOD_POOL_SIZE 控制
+    """
+    if pool_size is None:
+        pool_size = _env_int("LEIGOD_POOL_SIZE", 10)
+    session = requests.Session()
+    # 不在适配器层重试, 失败直接交由调用方处理, 保证单次调用耗时有上限
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+def observe_upstream(endpoint: str, started: float, code: str):
+    """
+    记录一次真正发出的接口请求的耗时与结果
+    """
+    metrics.UPSTREAM_LATENCY.observe(time.perf_counter() - started, endpoint=endpoint, code=code)
+    if code != "0":
+        metrics.UPSTREAM_ERRORS.inc(endpoint=endpoint, code=code)
+
+
+def send_notification(sendkey: str, message: str, title: str = "雷神加速器 提示"):
+    """
+    通过 Server酱 发送通知并记录耗时, 返回 Server酱 的响应
+    """
+    # 只在真正发送时导入, 未配置 sendkey 时不需要安装 serverchan_sdk
+    from serverchan_sdk import sc_send
+
+    started = time.perf_counter()
+    result = "error"
+    try:
+        with tracing.span("notify", "serverchan"):
+            response = sc_send(sendkey, title, message, { "tags": "雷神加速器"})
+        result = "ok"
+        return response
+    finally:
+        metrics.NOTIFICATION_LATENCY.observe(time.perf_counter() - started, result=result)
+
 
 class legod(object):
-    def __init__(self, token = ""):
+    # 所有实例共用, 同一 token 对同一接口的并发请求只发出一次
+    singleflight = singleflight.SingleFlight()
+    # 所有实例共用的令牌桶限流与熔断器
+    limiter = ratelimit.RateLimiter.from_env()
+    breaker = ratelimit.CircuitBreaker.from_env()
+
+    def __init__(self, token = "", session: requests.Session = None, base_url: str = None):
         self.version = "v2.2.5"
-        self.pause_url = "https://webapi.leigod.com/api/user/pause"
-        self.info_url = "https://webapi.leigod.com/api/user/info"
-        self.usage_detail_url = "https://webapi.leigod.com/api/user/time/log"
+        # 接口地址, 可通过 LEIGOD_API_BASE_URL 指向本地模拟服务 (bench/mock_leigod.py)
+        self.base_url = (base_url or os.getenv("LEIGOD_API_BASE_URL", "https://webapi.leigod.com")).rstrip("/")
+        self.pause_url = f"{self.base_url}/api/user/pause"
+        self.info_url = f"{self.base_url}/api/user/info"
+        self.usage_detail_url = f"{self.base_url}/api/user/time/log"
         self.key = "5C5A639C20665313622F51E93E3F2783"
         self.header = {
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/88.0.4324.96 Safari/537.36 Edg/88.0.705.53",
             "Content-Type": "application/x-www-form-urlencoded; charset=UTF-8",
             "Connection": "keep-alive",
             "Accept": "application/json, text/javascript, */*; q=0.01",
-            "Accept-Encoding": "gzip, deflate, br",
+            "Accept-Encoding": "gzip, deflate",
             "Accept-Language": "zh-CN,zh;q=0.9,en;q=0.8,en-GB;q=0.7,en-US;q=0.6",
             "DNT": "1",
             "Referer": "https://www.leigod.com/",
@@ -24,6 +97,14 @@ class legod(object):
             "Sec-Fetch-Mode": "cors",
             "Sec-Fetch-Site": "same-site",
         }
+        # (连接超时, 读取超时) 单位秒, 避免上游无响应时定时任务被永久卡住
+        self.timeout = (
+            _env_float("LEIGOD_CONNECT_TIMEOUT", 5),
+            _env_float("LEIGOD_READ_TIMEOUT", 10),
+        )
+        self.max_retries = ratelimit.get_max_retries()
+        self.session = session if session is not None else self._create_session()
+        self.session.headers.update(self.header)
         self.stopp = None
         self.token = token
         self.account_info = None
@@ -38,17 +119,223 @@ class legod(object):
             % self.version
         )
 
-    def update_token(self, token: str) -> tuple:
+    def _create_session(self):
+        return create_session()
+
+    @staticmethod
+    def _request_key(url: str, payload: dict) -> tuple:
+        return url, tuple(sorted(payload.items()))
+
+    @staticmethod
+    def _priority(endpoint: str) -> int:
+        # 暂停走优先通道, 不排在页面刷新等查询请求之后
+        return ratelimit.HIGH if endpoint == "pause" else ratelimit.NORMAL
+
+    def _breaker_allows(self, endpoint: str, priority: int) -> bool:
+        if self.breaker.allow(bypass=priority == ratelimit.HIGH):
+            return True
+        metrics.UPSTREAM_ERRORS.inc(endpoint=endpoint, code="circuit_open")
+        return False
+
+    def _breaker_message(self) -> str:
+        return f"雷神接口连续请求失败，已暂停请求，{max(1.0, self.breaker.retry_after()):.0f} 秒后重试"
+
+    @staticmethod
+    def _is_retryable(endpoint: str, status_code: int = None, sent: bool = True) -> bool:
         """
-        重置token信息, 初始化也需要用此方法
+        403 (请求频繁)、5xx、超时和网络错误可以重试
+        暂停不是幂等操作, 只在确定未被处理 (403 或连接失败) 时重试
         """
+        if status_code is not None:
+            return status_code == 403 or (status_code >= 500 and endpoint != "pause")
+        return not sent or endpoint != "pause"
+
+    @staticmethod
+    def _request_not_sent(e: Exception) -> bool:
+        """
+        请求是否确定没有发出 (连接超时或建立连接失败), 与 aiolegod 相同;
+        连接建立后出错 (读取超时、连接被重置等) 时服务端可能已处理请求
+        """
+        if isinstance(e, requests.exceptions.ConnectTimeout):
+            return True
+        reason = e.args[0] if e.args else None
+        # requests 把 urllib3 的 MaxRetryError 包装为 ConnectionError, 具体原因在 reason 中
+        return isinstance(getattr(reason, "reason", reason), NewConnectionError)
+
+    def _should_retry(self, endpoint: str, code: str, attempt: int, retryable: bool) -> bool:
+        """
+        记录一次失败的结果, 返回是否需要退避后重试
+        """
+        if retryable:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        metrics.CIRCUIT_OPEN.set(0 if self.breaker.state == self.breaker.CLOSED else 1)
+        if not retryable or attempt >= self.max_retries:
+            return False
+        metrics.UPSTREAM_RETRIES.inc(endpoint=endpoint, code=code)
+        return True
+
+    def _record_success(self):
+        self.breaker.record_success()
+        metrics.CIRCUIT_OPEN.set(0)
+
+    def _post(self, endpoint: str, url: str, payload: dict) -> tuple:
+        """
+        发送请求并返回 (解析后的响应, 是否为真正发出请求的调用者)
+        相同的并发请求会被合并, 所有调用者共享同一次请求的结果
+        请求经过共用的限流器, 403/5xx/超时按指数退避重试, 连续失败时熔断
+        """
+        priority = self._priority(endpoint)
+
+        def send():
+            attempt = 0
+            while True:
+                if not self._breaker_allows(endpoint, priority):
+                    raise requests.exceptions.ConnectionError(self._breaker_message())
+                self.limiter.acquire(priority)
+                started = time.perf_counter()
+                code = "network_error"
+                try:
+                    response = self.session.post(url, data=payload, timeout=self.timeout)
+                    response.raise_for_status()
+                    res = json.loads(response.text)
+                    code = str(res.get("code"))
+                    self._record_success()
+                    return res
+                except requests.exceptions.HTTPError as e:
+                    code = f"http_{e.response.status_code}"
+                    if not self._should_retry(endpoint, code, attempt, self._is_retryable(endpoint, e.response.status_code)):
+                        raise
+                except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                    sent = not self._request_not_sent(e)
+                    if not self._should_retry(endpoint, code, attempt, self._is_retryable(endpoint, sent=sent)):
+                        raise
+                except json.JSONDecodeError:
+                    code = "invalid_json"
+                    self._record_success()
+                    raise
+                finally:
+                    observe_upstream(endpoint, started, code)
+                time.sleep(ratelimit.backoff_delay(attempt))
+                attempt += 1
+        with tracing.span("upstream", endpoint):
+            return self.singleflight.do(endpoint, self._request_key(url, payload), send)
+
+    def _reset_token(self, token: str):
         self.stopp = None
         self.token = token
         self.account_info = None
+
+    def _token_expired(self, token: str):
+        """
+        发出请求时使用的 token (token) 失效, 清空 token; 请求期间已通过 update_token 换成新 token 时保留新 token
+        """
+        if self.token == token:
+            self._reset_token("")
+
+    def update_token(self, token: str) -> tuple:
+        """
+        重置token信息, 初始化也需要用此方法
+        """
+        self._reset_token(token)
         if token:
             return self.get_account_info()
         return False, "Token 为空，无法更新。"
 
+    def _account_payload(self) -> dict:
+        return {
+            "account_token": self.token,
+            "lang": "zh_CN",
+            "os_type": 4,
+        }
+
+    def _usage_payload(self, page: int = 1, size: int = 5) -> dict:
+        return {
+            "account_token": self.token,
+            "page": page,
+            "size": size, # 可以根据需要调整获取的记录数量
+            "lang": "zh_CN",
+            "region_code": 1,
+            "src_channel": "guanwang",
+            "os_type": 4
+        }
+
+    def _handle_account_info(self, msg: dict, token: str) -> tuple:
+        if msg["code"] == 0:
+            self.account_info = msg["data"]
+            self.stopp = self.account_info["pause_status_id"] == 1
+            return True, self.account_info
+        else:
+            self._token_expired(token)
+            return False, msg["msg"]
+
+    def _handle_status_probe(self, res: dict, token: str) -> tuple:
+        """
+        解析状态探测 (/api/user/info) 的结果, 返回 (bool, 是否暂停 或 错误信息)
+        与 _handle_account_info 不同, 只有 token 失效 (400006) 时才清空 token
+        """
+        data = res.get("data") or {}
+        if res["code"] == 0 and "pause_status_id" in data:
+            self.account_info = data
+            self.stopp = data["pause_status_id"] == 1
+            return True, self.stopp
+        if res["code"] == 400006:
+            self._token_expired(token)
+            return False, "Token 已失效，请重新登录获取。"
+        return False, f"获取账号状态失败: {res.get('msg', '缺少 pause_status_id')}"
+
+    def _handle_pause(self, res: dict, token: str) -> tuple:
+        """
+        返回 (bool, message, 是否需要发送暂停成功通知)
+        """
+        if res["code"] == 0:
+            self.stopp = True
+            return True, res["msg"], True
+        elif res["code"] == 400006:
+            self._token_expired(token)
+            return False, res["msg"], False
+        else:
+            return False, res["msg"], False
+
+    def _handle_usage_page(self, res: dict, token: str) -> tuple:
+        """
+        解析一页使用记录, 返回 (bool, message, full_data_dict)
+        """
+
+        if res["code"] != 0:
+            if res["code"] == 400006:
+                self._token_expired(token)
+                return False, "Token 已失效，请重新登录获取。", None
+            return False, f"获取使用明细失败: {res['msg']}", None
+
+        full_data = res["data"] if "data" in res else {"list": []}
+
+        # Inject 'duration' into each record from 'reduce_pause_time'
+        if full_data and 'list' in full_data:
+            for record in full_data['list']:
+                # Ensure 'duration' key exists for consistency with frontend expectation
+                # Use 'reduce_pause_time' if available, otherwise default to 0 or None
+                record['duration'] = record.get('reduce_pause_time', 0) 
+        return True, "", full_data
+
+    @staticmethod
+    def summarize_usage(full_data: dict, now: datetime = None) -> tuple:
+        """
+        根据使用记录 (最新的在前) 计算当前状态和加速时长
+        now: 当前时间, 默认为 datetime.now(), 模拟 (simulate.py) 时传入虚拟时钟的时间
+        返回 (bool, message, duration_minutes, full_data_dict); 需要结构化的结果时使用 policy.status_from_records
+        """
+        status = policy.status_from_records((full_data or {}).get("list"), now)
+        if status is None:
+            return False, "未获取到使用明细数据。", 0, full_data
+        return True, status.message, status.duration_minutes, full_data
+
+    def _handle_usage_details(self, res: dict, token: str) -> tuple:
+        success, message, full_data = self._handle_usage_page(res, token)
+        if not success:
+            return False, message, 0, None
+        return self.summarize_usage(full_data)
 
     def get_account_info(self) -> tuple:
         """
@@ -61,30 +348,34 @@ class legod(object):
         if self.token == "":
             return False, "token信息无效, 请检查后再试"
 
-        payload = {
-            "account_token": self.token,
-            "lang": "zh_CN",
-            "os_type": 4,
-        }
-        
+        token = self.token
         try:
-            r = requests.post(self.info_url, data=payload, headers=self.header)
-            r.raise_for_status()
-            msg = json.loads(r.text)
-            if msg["code"] == 0:
-                self.account_info = msg["data"]
-                self.stopp = self.account_info["pause_status_id"] == 1
-                return True, self.account_info
-            else:
-                self.update_token("")
-                return False, msg["msg"]
+            res, _ = self._post("info", self.info_url, self._account_payload())
+            return self._handle_account_info(res, token)
         except requests.exceptions.RequestException as e:
-            self.update_token("")
+            self._token_expired(token)
             return False, f"请求账号信息失败: {e}"
         except json.JSONDecodeError:
-            self.update_token("")
+            self._token_expired(token)
             return False, "解析账号信息响应失败。"
 
+    def probe_status(self) -> tuple:
+        """
+        轻量的状态探测: 只请求 /api/user/info 读取暂停状态, 不请求和解析使用记录
+        返回 (True, 是否暂停) or (False, 错误信息); 网络错误不清空 token, 下次检查时重试
+        """
+        if not self.token:
+            return False, "Token 信息无效，无法获取账号状态。"
+
+        token = self.token
+        try:
+            res, _ = self._post("info", self.info_url, self._account_payload())
+            return self._handle_status_probe(res, token)
+        except requests.exceptions.RequestException as e:
+            return False, f"请求账号状态失败: {e}"
+        except json.JSONDecodeError:
+            return False, "解析账号状态响应失败。"
+
 
     def pause(self) -> tuple:
         """
@@ -94,39 +385,36 @@ class legod(object):
             return False, "token信息无效, 请使用update_token方法更新后再试"
         if self.stopp:
             return False, "当前用户已经暂停加速"
-            
-        payload = {
-            "account_token": self.token,
-            "lang": "zh_CN",
-            "os_type": 4,
-        }
+
+        token = self.token
         try:
-            response = requests.post(self.pause_url, data=payload, headers=self.header)
-            response.raise_for_status()
-            if response.status_code == 403:
-                msg = "未知错误，可能是请求频繁或者是网址更新"
-                return False, msg
-            res = json.loads(response.text)
-            if res["code"] == 0:
-                self.stopp = True 
+            res, leader = self._post("pause", self.pause_url, self._account_payload())
+            success, msg, should_notify = self._handle_pause(res, token)
+            # 合并的暂停请求只由真正发出请求的调用者发送通知
+            if should_notify and leader:
                 self.notify("账号已成功暂停")
-                return True, res["msg"]
-            elif res["code"] == 400006:
-                self.update_token("")
-                return False, res["msg"]
-            else:
-                return False, res["msg"]
+            return success, msg
+        except requests.exceptions.HTTPError as e:
+            if e.response.status_code == 403:
+                return False, "未知错误，可能是请求频繁或者是网址更新"
+            return False, f"请求暂停失败: {e}"
         except requests.exceptions.RequestException as e:
             return False, f"请求暂停失败: {e}"
         except json.JSONDecodeError:
             return False, "解析暂停响应失败。"
 
+    def close(self):
+        """
+        关闭连接池
+        """
+        self.session.close()
+
     def notify(self, message: str):
         """
         通知方法 (占位符，可扩展为邮件、微信等通知)
         """
         if self.serverchan_sendkey:
-            sc_send(self.serverchan_sendkey, "雷神加速器 提示", message, { "tags": "雷神加速器"})
+            send_notification(self.serverchan_sendkey, message)
 
     def get_usage_details_and_full_data(self) -> tuple:
         """
@@ -137,63 +425,10 @@ class legod(object):
         if not self.token:
             return False, "Token 信息无效，无法获取使用明细。", 0, None
 
-        payload = {
-            "account_token": self.token,
-            "page": 1,
-            "size": 5, # 可以根据需要调整获取的记录数量
-            "lang": "zh_CN",
-            "region_code": 1,
-            "src_channel": "guanwang",
-            "os_type": 4
-        }
-        
+        token = self.token
         try:
-            response = requests.post(self.usage_detail_url, data=payload, headers=self.header)
-            response.raise_for_status()
-            res = json.loads(response.text)
-
-            if res["code"] != 0:
-                if res["code"] == 400006:
-                    self.update_token("")
-                    return False, "Token 已失效，请重新登录获取。", 0, None
-                return False, f"获取使用明细失败: {res['msg']}", 0, None
-
-            full_data = res["data"] if "data" in res else {"list": []}
-
-            # Inject 'duration' into each record from 'reduce_pause_time'
-            if full_data and 'list' in full_data:
-                for record in full_data['list']:
-                    # Ensure 'duration' key exists for consistency with frontend expectation
-                    # Use 'reduce_pause_time' if available, otherwise default to 0 or None
-                    record['duration'] = record.get('reduce_pause_time', 0) 
-            
-            if not full_data or not full_data["list"]:
-                return False, "未获取到使用明细数据。", 0, full_data
-
-            latest_record = full_data["list"][0]
-            
-            is_paused_last_action = latest_record.get('pause_time') is not None and \
-                                    latest_record.get('pause_time') != latest_record.get('recover_time')
-
-            duration_minutes = 0
-            message = "当前账号处于已暂停状态，无需操作。"
-
-            if not is_paused_last_action:
-                recover_time_str = latest_record.get('recover_time')
-                if recover_time_str:
-                    try:
-                        recover_dt = datetime.strptime(recover_time_str, "%Y-%m-%d %H:%M:%S")
-                        current_dt = datetime.now()
-                        time_elapsed = current_dt - recover_dt
-                        duration_minutes = time_elapsed.total_seconds() / 60 
-                        message = f"当前账号处于未暂停状态，已持续 {duration_minutes:.2f} 分钟。"
-                    except ValueError:
-                        message = "解析恢复时间失败，格式不正确。"
-                else:
-                    message = "最新记录为恢复状态，但未找到恢复时间。"
-            
-            return True, message, duration_minutes, full_data
-        
+            res, _ = self._post("time_log", self.usage_detail_url, self._usage_payload())
+            return self._handle_usage_details(res, token)
         except requests.exceptions.RequestException as e:
             return False, f"请求使用明细失败: {e}", 0, None
         except json.JSONDecodeError:
@@ -201,6 +436,24 @@ class legod(object):
         except Exception as e:
             return False, f"处理使用明细时发生未知错误: {e}", 0, None
 
+    def get_usage_page(self, page: int = 1, size: int = 5) -> tuple:
+        """
+        获取指定页的使用记录 (最新的在前)
+        返回 (bool, message, records_list)
+        """
+        if not self.token:
+            return False, "Token 信息无效，无法获取使用明细。", []
+
+        token = self.token
+        try:
+            res, _ = self._post("time_log", self.usage_detail_url, self._usage_payload(page, size))
+            success, message, full_data = self._handle_usage_page(res, token)
+            return success, message, (full_data or {}).get("list") or []
+        except requests.exceptions.RequestException as e:
+            return False, f"请求使用明细失败: {e}", []
+        except json.JSONDecodeError:
+            return False, "解析使用明细响应失败。", []
+
     def get_usage_details(self) -> tuple:
         """
         获取雷神加速器使用明细，并计算当前加速时长。
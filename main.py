@@ -1,19 +1,39 @@
-from fastapi import FastAPI, Request, Form
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi import FastAPI, Request, Form, HTTPException
+from fastapi.responses import HTMLResponse, RedirectResponse, StreamingResponse, PlainTextResponse, Response, JSONResponse
 from fastapi.templating import Jinja2Templates
+from dotenv import load_dotenv
+
+# 先加载 .env, 其他模块在导入时读取的配置 (限流、追踪开关等) 才能生效
+load_dotenv()
+
 import logging
 import uvicorn
 import time
-import legod # 确保 legod.py 已经修改为使用 logger
+import aiolegod
+import analytics
+import events
+import lease
+import metrics
+import notifier
+import pagecache
+import policy
+import scheduler
+import store
+import tracing
+import asyncio
 import os
+import io
+import csv
 import json
-import threading
+import sqlite3
+import hashlib
+import hmac
 from contextlib import asynccontextmanager
-from typing import Optional, Dict, List
-from dotenv import load_dotenv
-
-load_dotenv()
-
+from datetime import datetime, timedelta
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Optional, Dict, List, Iterable, Iterator
+from urllib.parse import quote
+from config import DEFAULT_ACCOUNT, mask_token, parse_env_accounts
 # 配置日志
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO) # 默认设置为 INFO 级别
@@ -25,373 +45,1320 @@ if not logger.handlers:
     handler.setFormatter(formatter)
     logger.addHandler(handler)
 
-# --- 新增：脱敏 Token 的函数 ---
-def mask_token(token: str, visible_chars: int = 6) -> str:
-    """
-    对Token进行脱敏处理，只显示开头和结尾的指定字符数，中间用星号代替。
-    """
-    if not token or len(token) <= visible_chars * 2:
-        return token  # Token 太短，不进行脱敏
-    
-    start = token[:visible_chars]
-    end = token[-visible_chars:]
-    return f"{start}***{end}"
-# --- 结束新增 ---
+# 进程开始加载的时间, 用于统计启动耗时
+PROCESS_STARTED_AT = time.time()
 
+# 页面上展示的最近使用记录条数
+DASHBOARD_RECORD_COUNT = 5
 
-class AppState:
-    def __init__(self):
-        self.current_token: str = os.getenv('token', "")
-        self.last_update_time: str = self.get_current_time() if self.current_token else "从未更新"
+
+def get_current_time() -> str:
+    return time.strftime("%Y-%m-%d %H:%M:%S")
+
+def get_max_concurrent_checks() -> int:
+    value_env = os.getenv("MAX_CONCURRENT_CHECKS", "10")
+    try:
+        value = int(value_env)
+        if value > 0:
+            return value
+    except ValueError:
+        pass
+    logger.warning(f"MAX_CONCURRENT_CHECKS 值 ({value_env}) 无效，已重置为10。")
+    return 10
+
+
+class AccountState:
+    """
+    单个账号的状态, 所有账号共用同一个 HTTP 连接池
+    """
+    def __init__(self, name: str, token: str, client, dispatcher: Optional[notifier.NotificationDispatcher] = None):
+        self.name: str = name
+        self.current_token: str = token
+        self.last_update_time: str = get_current_time() if self.current_token else "从未更新"
         self.nickname: str = ""
         self.status_message: str = "服务启动中..."
-        self.usage_records: List[Dict] = [] 
-        self.usage_timer: Optional[threading.Timer] = None
-        self.leigod_obj = legod.legod(token=self.current_token)
+        self.usage_records: List[Dict] = []
+        self.leigod_obj = aiolegod.aiolegod(token=self.current_token, session=client, notifier=dispatcher, account_name=name)
         # 新增：用于跟踪上一次定时器检测时账号是否为暂停状态
         self.is_last_known_state_paused: Optional[bool] = None # True: paused, False: accelerating, None: undetermined
-    
+        # 本次加速开始时间 (最新记录的 recover_time), 用于计算阈值截止时间
+        self.accelerating_since: Optional[datetime] = None
+        # 下次检查的时间戳 (time.time()), 0 表示尽快检查
+        self.next_check_at: float = 0
+        # 页面展示数据 (使用记录/状态) 的最后刷新时间戳, 0 表示从未刷新
+        self.data_updated_at: float = 0
+        # 页面触发的后台刷新任务, 同一时间只保留一个
+        self.refresh_task: Optional[asyncio.Task] = None
+        # 后台回填更早的使用记录的任务, 同一时间只保留一个
+        self.backfill_task: Optional[asyncio.Task] = None
+        # 启动预热 (验证 Token、加载初始数据) 尚未完成
+        self.warming_up: bool = False
+        # 最后一次成功检查的时间戳, 用于发现两次检查之间 (包括服务停止期间) 发生的恢复加速
+        self.last_checked_at: float = 0
+        # 状态是否从本地库恢复, 恢复的账号启动时不需要重新初始化
+        self.restored: bool = False
+        # 下次检查必须请求使用记录 (不只探测状态): 从本地库恢复后置位, 服务停止期间的恢复加速和暂停探测不到, 只能从使用记录发现
+        self.force_usage: bool = False
+        # 最近一次推送给页面的状态和使用记录, 有变化时才再次推送
+        self.published_status: Optional[dict] = None
+        self.published_records: Optional[List[Dict]] = None
+        # 本地库中该账号状态的保存时间, 0 表示尚未保存; 多进程部署时用于发现其他进程保存的修改
+        self.saved_at: float = 0
+
+    def data_age_seconds(self) -> Optional[float]:
+        if not self.data_updated_at:
+            return None
+        return time.time() - self.data_updated_at
+
+    def snapshot(self) -> dict:
+        """
+        需要在重启后恢复的状态
+        """
+        return {
+            "token": self.current_token,
+            "nickname": self.nickname,
+            "status_message": self.status_message,
+            "last_update_time": self.last_update_time,
+            "paused": self.is_last_known_state_paused,
+            "accelerating_since": self.accelerating_since.strftime(policy.RECORD_TIME_FORMAT) if self.accelerating_since else None,
+            "data_updated_at": self.data_updated_at,
+            "last_checked_at": self.last_checked_at,
+        }
+
+    def restore(self, snapshot: dict, usage_records: List[Dict]):
+        token = snapshot.get("token") or ""
+        if token != self.current_token:
+            self.current_token = token
+            self.leigod_obj._reset_token(token)
+        self.nickname = snapshot.get("nickname") or ""
+        self.status_message = snapshot.get("status_message") or self.status_message
+        self.last_update_time = snapshot.get("last_update_time") or self.last_update_time
+        self.is_last_known_state_paused = snapshot.get("paused")
+        self.accelerating_since = policy.parse_record_time(snapshot.get("accelerating_since"))
+        # 服务停止期间状态可能有变化, 启动后立即做一次增量检查 (只请求一页使用记录)
+        self.next_check_at = 0
+        self.data_updated_at = snapshot.get("data_updated_at") or 0
+        self.last_checked_at = snapshot.get("last_checked_at") or 0
+        self.usage_records = usage_records
+        self.restored = True
+        self.force_usage = True
+        self.warming_up = False
+
+
+class AppState:
+    def __init__(self):
+        # 所有账号共用的连接池
+        self.client = aiolegod.create_client()
+        # 本地使用记录库, 同时保存账号状态
+        self.store = store.UsageStore()
+        # 使用时长统计, 记录写入时增量更新
+        analytics.attach(self.store)
+        # 后台通知队列, 所有账号共用
+        self.notifier = notifier.NotificationDispatcher(store=self.store)
+        self.accounts: Dict[str, AccountState] = {}
+        # 状态版本号, 页面上展示的任何数据变化时加一, 首页渲染结果按版本缓存
+        self.version: int = 0
+        self.page_cache = pagecache.PageCache()
+        # 环境变量中配置的账号 {名称: token}
+        self.env_accounts = parse_env_accounts()
+        self.load_accounts()
+        # 主节点租约: 多进程/多副本共用本地库时, 只有持有租约的进程运行定时检查
+        self.lease = lease.LeaderLease(self.store)
+        self.is_leader: bool = False
+        self.coordinator_task: Optional[asyncio.Task] = None
+        # 定时检查的调度任务, 在 lifespan 中启动和停止
+        self.scheduler = scheduler.CheckScheduler(check_due_accounts, get_next_check_delay, policy.get_check_jitter_seconds())
+        # 同一时间只允许一轮检查, 慢检查不会被重复执行
+        self.check_lock = asyncio.Lock()
+        # 限制同时请求雷神接口的账号数量
+        self.check_semaphore = asyncio.Semaphore(get_max_concurrent_checks())
+        # JSON 接口的 {缓存键: (ETag, 内容最近变化的时间戳)}
+        self.api_validators: Dict[tuple, tuple] = {}
+        # 推送给页面的事件 (SSE)
+        self.events = events.EventBroker()
+        # 后台预热任务, 完成后服务才算就绪
+        self.warmup_task: Optional[asyncio.Task] = None
+        self.ready: bool = False
+
+    def add_account(self, name: str, token: str = "") -> AccountState:
+        account = AccountState(name, token, self.client, self.notifier)
+        self.accounts[name] = account
+        self.bump_version()
+        return account
+
+    def bump_version(self):
+        self.version += 1
+
+    def load_accounts(self):
+        """
+        先恢复上次保存的账号, 再加入环境变量中的其他账号
+        环境变量中的 token 与保存时相同则沿用保存的状态 (包括在页面上更新过的 token), 否则以环境变量为准重新初始化
+        """
+        for name, (snapshot, updated_at) in self.store.load_account_states().items():
+            if not self.matches_env(name, snapshot):
+                continue
+            account = self.add_account(name, snapshot.get("token") or "")
+            account.restore(snapshot, self.store.recent_records(name, DASHBOARD_RECORD_COUNT))
+            account.saved_at = updated_at
+        for name, token in self.env_accounts.items():
+            if name not in self.accounts:
+                self.add_account(name, token)
+
+    def matches_env(self, name: str, snapshot: dict) -> bool:
+        """
+        保存的状态是否仍然适用: 环境变量中的 token 变化后以环境变量为准
+        """
+        env_token = self.env_accounts.get(name)
+        return not env_token or env_token == snapshot.get("env_token")
+
+    def save_account(self, account: AccountState):
+        snapshot = account.snapshot()
+        snapshot["env_token"] = self.env_accounts.get(account.name, "")
+        account.saved_at = time.time()
+        self.store.save_account_state(account.name, snapshot, account.saved_at)
+
+    def get_account(self, name: str) -> AccountState:
+        """
+        获取账号, 不存在时创建空账号
+        """
+        account = self.accounts.get(name)
+        if account is None:
+            account = self.add_account(name)
+        return account
+
+    def has_active_token(self) -> bool:
+        return any(account.current_token for account in self.accounts.values())
+
     @staticmethod
     def get_current_time() -> str:
-        return time.strftime("%Y-%m-%d %H:%M:%S")
+        return get_current_time()
 
-def check_usage_details_task():
-    state = app.state
+def get_dashboard_cache_ttl_seconds() -> float:
+    value_env = os.getenv("DASHBOARD_CACHE_TTL_SECONDS", "60")
+    try:
+        return max(0.0, float(value_env))
+    except ValueError:
+        logger.warning(f"DASHBOARD_CACHE_TTL_SECONDS 值 ({value_env}) 无效，已重置为60秒。")
+        return 60.0
+
+def get_history_backfill_interval_seconds() -> float:
+    value_env = os.getenv("HISTORY_BACKFILL_INTERVAL_SECONDS", "2")
+    try:
+        return max(0.0, float(value_env))
+    except ValueError:
+        logger.warning(f"HISTORY_BACKFILL_INTERVAL_SECONDS 值 ({value_env}) 无效，已重置为2秒。")
+        return 2.0
+
+async def sync_recent_records(account: AccountState) -> tuple:
+    """
+    增量同步账号最新的使用记录到本地库 (通常只请求一页), 再从本地库读取最新的记录, 返回 (bool, message, records)
+    所有获取使用明细的地方都经过这里, 同时记录刷新时间供页面缓存判断数据新旧; 更早的记录在后台回填
+    """
+    success, message, _ = await store.sync_recent_usage(app.state.store, account.leigod_obj, account.name)
+    account.data_updated_at = time.time()
+    if not success:
+        return False, message, []
+    schedule_history_backfill(account)
+    return True, "", app.state.store.recent_records(account.name, DASHBOARD_RECORD_COUNT)
+
+async def backfill_account_history(account: AccountState):
+    """
+    以低优先级逐页回填账号更早的使用记录, 每页之间等待 HISTORY_BACKFILL_INTERVAL_SECONDS; 失败时下次同步后继续
+    """
+    success, message, written = await store.backfill_usage_history(
+        app.state.store, account.leigod_obj, account.name,
+        background=True, interval=get_history_backfill_interval_seconds())
+    if success:
+        logger.info(f"账号 {account.name} 回填使用记录 {written} 条。")
+    else:
+        logger.warning(f"账号 {account.name} 回填使用记录失败, 下次同步后继续: {message}")
+
+def schedule_history_backfill(account: AccountState):
+    """
+    本地库中的记录不完整时在后台回填, 不阻塞检查和页面请求; 已有回填任务在进行时不重复创建
+    """
+    if account.backfill_task is not None and not account.backfill_task.done():
+        return
+    if not app.state.is_leader or app.state.store.backfill_complete(account.name):
+        return
+    account.backfill_task = asyncio.get_running_loop().create_task(backfill_account_history(account))
 
-    if not state.current_token:
-        logger.warning("定时任务：Token 无效，停止定时检查。")
-        stop_usage_timer() # Ensure timer stops if token becomes invalid
+def cancel_history_backfill(accounts: Iterable[AccountState]):
+    for account in accounts:
+        if account.backfill_task is not None:
+            account.backfill_task.cancel()
+
+async def fetch_usage_snapshot(account: AccountState) -> tuple:
+    """
+    同步使用记录并计算状态, 返回值与 get_usage_details_and_full_data 相同
+    """
+    success, message, records = await sync_recent_records(account)
+    if not success:
+        return False, message, 0, None
+    return account.leigod_obj.summarize_usage({"list": records})
+
+async def fetch_account_status(account: AccountState) -> tuple:
+    """
+    定时检查的两级请求: policy.usage_due 为 False 时先用 /api/user/info 探测暂停状态 (响应小, 不解析使用记录),
+    状态与上次相同就不再请求使用记录; 状态变化、探测失败 (Token 失效除外)、usage_due 或 force_usage 时同步使用记录
+    返回 (True, policy.AccountStatus) or (False, 错误信息)
+    """
+    now = datetime.now()
+    previous = account.is_last_known_state_paused
+    if not account.force_usage and not policy.usage_due(previous, account.accelerating_since, now, account.last_checked_at):
+        success, probed = await account.leigod_obj.probe_status()
+        if success and probed == previous:
+            metrics.CHECK_REQUESTS.inc(kind="probe")
+            return True, policy.status_from_probe(probed, account.accelerating_since, now)
+        if not success:
+            if not account.leigod_obj.token:
+                return False, probed
+            logger.warning(f"定时任务：账号 {account.name} 探测状态失败，改为请求使用明细: {probed}")
+    metrics.CHECK_REQUESTS.inc(kind="usage")
+    success, message, records = await sync_recent_records(account)
+    if not success:
+        return False, message
+    status = policy.status_from_records(records)
+    if status is None:
+        return False, "未获取到使用明细数据。"
+    account.force_usage = False
+    return True, status
+
+async def run_bounded(coro):
+    """
+    在并发上限内执行协程
+    """
+    async with app.state.check_semaphore:
+        return await coro
+
+async def check_usage_details_task(account: AccountState):
+    if not account.current_token:
+        logger.warning(f"定时任务：账号 {account.name} Token 无效，跳过检查。")
         return
 
-    success, message, duration_minutes, full_data = state.leigod_obj.get_usage_details_and_full_data()
+    token = account.current_token
+    success, result = await fetch_account_status(account)
+    if account.current_token != token:
+        # 检查期间 Token 已更新, 结果属于旧 Token; 更新 Token 后会重新安排检查
+        logger.info(f"定时任务：账号 {account.name} 检查期间 Token 已更新，丢弃本次检查结果。")
+        return
+    # 本次检查中接口返回的错误信息, Token 失效时展示在页面上
+    error_message = ""
 
-    current_is_determined_to_be_paused: Optional[bool] = None
+    if success and result.records is None:
+        # 只探测了状态: 与上次相同且未到阈值截止时间, 不会有通知或自动暂停, 使用记录保持不变
+        status: policy.AccountStatus = result
+        metrics.LAST_SUCCESSFUL_CHECK.set(time.time(), account=account.name)
+        metrics.ACCELERATION_MINUTES.set(status.duration_minutes if status.paused is False else 0, account=account.name)
+        apply_usage_status_message(account, status.message)
+        schedule_next_check(account)
 
-    if success:
-        # Determine current pause state primarily from the message
-        if "已暂停状态" in message:
-            current_is_determined_to_be_paused = True
-        elif "未暂停状态" in message: # Covers "未暂停状态" and "最新记录为恢复状态，但未找到恢复时间"
-            current_is_determined_to_be_paused = False
-        elif full_data and 'list' in full_data and full_data['list']: # Fallback if message is not clear
-            latest_record = full_data['list'][0]
-            pause_time = latest_record.get('pause_time')
-            recover_time = latest_record.get('recover_time')
-            if pause_time and (not recover_time or pause_time >= recover_time):
-                current_is_determined_to_be_paused = True
-            elif recover_time and (not pause_time or recover_time > pause_time):
-                current_is_determined_to_be_paused = False
-            elif duration_minutes > 0 : # If time has elapsed and not clearly paused/recovered by times
-                 current_is_determined_to_be_paused = False
-        # If message was "未获取到使用明细数据。", full_data['list'] would be empty, current_is_determined_to_be_paused remains None.
+    elif success:
+        status = result
+        decision = policy.decide(account.is_last_known_state_paused, account.last_checked_at, status,
+                                 previous_since=account.accelerating_since)
+        current_is_determined_to_be_paused = decision.paused
 
+        if current_is_determined_to_be_paused is not None and account.is_last_known_state_paused != current_is_determined_to_be_paused:
+            publish_transition(account, current_is_determined_to_be_paused)
+        # 同一次加速的恢复/警告/自动暂停通知只发送一次, 重启后也不重复
+        for kind, dedup_key, notification_message in decision.notifications:
+            await account.leigod_obj.notify(notification_message, kind, dedup_key)
         if current_is_determined_to_be_paused is not None:
-            if state.is_last_known_state_paused is True and current_is_determined_to_be_paused is False:
-                notification_message = f"检测到状态从暂停变为加速, 请确认是本人操作"
-                state.leigod_obj.notify(notification_message)
-            
-            state.is_last_known_state_paused = current_is_determined_to_be_paused # Update state for next check
+            account.is_last_known_state_paused = current_is_determined_to_be_paused # Update state for next check
+
+        account.last_checked_at = time.time()
+        metrics.LAST_SUCCESSFUL_CHECK.set(account.last_checked_at, account=account.name)
+        metrics.ACCELERATION_MINUTES.set(status.duration_minutes if current_is_determined_to_be_paused is False else 0, account=account.name)
 
         # Original auto-pause logic
-        pause_minutes_env = os.getenv("PAUSE_THRESHOLD_MINUTES")
-        warning_minutes_env = os.getenv("WARNING_THRESHOLD_MINUTES")
+        if decision.action == "auto_pause":
+            metrics.AUTO_PAUSE_ATTEMPTS.inc(account=account.name)
+            pause_success, pause_msg = await account.leigod_obj.pause()
+            logger.info(f"定时任务：账号 {account.name} 自动暂停{'成功' if pause_success else '失败'}: {pause_msg}")
+            app.state.events.publish("auto_pause", {"name": account.name, "success": pause_success, "message": pause_msg})
+            if not pause_success:
+                error_message = pause_msg
+            if pause_success:
+                metrics.AUTO_PAUSE_SUCCESSES.inc(account=account.name)
+                if status.accelerating_since is not None:
+                    analytics.record_auto_pause(app.state.store, account.name, status.accelerating_since.strftime(policy.RECORD_TIME_FORMAT), datetime.now())
+                publish_transition(account, True)
+                account.is_last_known_state_paused = True # Update state immediately after successful pause
 
-        # Ensure values from env are valid integers, otherwise use defaults or skip
-        try:
-            pause_threshold_minutes = int(pause_minutes_env) if pause_minutes_env is not None else 1440 # Default 24h
-        except ValueError:
-            logger.warning(f"无效的 PAUSE_THRESHOLD_MINUTES值: {pause_minutes_env}，将使用默认值或不触发自动暂停。")
-            pause_threshold_minutes = float('inf') # Effectively disable if invalid
+        apply_usage_status_message(account, status.message)
+        account.usage_records = status.records
+        plan_next_check(account, account.is_last_known_state_paused is False, status.full_data)
 
-        try:
-            warning_threshold_minutes = int(warning_minutes_env) if warning_minutes_env is not None else 1440 # Default 24h
-        except ValueError:
-            logger.warning(f"无效的 WARNING_THRESHOLD_MINUTES值: {warning_minutes_env}，将使用默认值或不触发警告。")
-            warning_threshold_minutes = float('inf') # Effectively disable if invalid
-
-        if current_is_determined_to_be_paused is False: # Only consider auto-pause if currently accelerating
-            if duration_minutes > pause_threshold_minutes:
-                state.leigod_obj.notify(f"账号已加速超过 {pause_threshold_minutes} 分钟并尝试自动暂停: {message}")
-                pause_success, pause_msg = state.leigod_obj.pause()
-                logger.info(f"定时任务：自动暂停{'成功' if pause_success else '失败'}: {pause_msg}")
-                if pause_success:
-                    state.is_last_known_state_paused = True # Update state immediately after successful pause
-            elif duration_minutes > warning_threshold_minutes:
-                state.leigod_obj.notify(f"账号已加速超过 {warning_threshold_minutes} 分钟: {message}")
-        
-        if full_data and 'list' in full_data:
-            state.usage_records = full_data['list']
-        else:
-            state.usage_records = []
-            if success: # Only log if API call was successful but no list data
-                 logger.info("定时任务：未获取到使用明细列表，记录已清空。")
-
-    else: # get_usage_details_and_full_data failed
-        logger.error(f"定时任务：获取使用明细失败: {message}")
-        state.usage_records = []
-        # Do not change state.is_last_known_state_paused if API call fails, keep last known state.
-        logger.info(f"定时任务：获取使用明细失败，上次记录的暂停状态 ({state.is_last_known_state_paused}) 将保持不变。")
-
-
-def start_usage_timer():
-    stop_usage_timer() 
-    
-    if app.state.current_token:
-        check_usage_details_task() 
-        interval_env = os.getenv("CHECK_INTERVAL_MINUTES", "60")
-        try:
-            interval = int(interval_env)
-            if interval <= 0:
-                interval = 60 # Default to 60 if non-positive
-                logger.warning(f"CHECK_INTERVAL_MINUTES 值 ({interval_env}) 无效，已重置为60分钟。")
-        except ValueError:
-            interval = 60 # Default to 60 if not a valid integer
-            logger.warning(f"CHECK_INTERVAL_MINUTES 值 ({interval_env}) 无效，已重置为60分钟。")
-
-        app.state.usage_timer = threading.Timer(interval * 60, start_usage_timer)
-        app.state.usage_timer.daemon = True
-        app.state.usage_timer.start()
-        logger.info(f"定时检查任务已启动，间隔: {interval} 分钟。")
-    else:
-        logger.info("Token 为空，未启动定时检查任务。")
+    else: # 探测和获取使用明细都失败
+        error_message = result
+        logger.error(f"定时任务：账号 {account.name} 获取使用明细失败: {error_message}")
+        account.usage_records = []
+        # Do not change is_last_known_state_paused if API call fails, keep last known state.
+        logger.info(f"定时任务：账号 {account.name} 获取使用明细失败，上次记录的暂停状态 ({account.is_last_known_state_paused}) 将保持不变。")
+        # 沿用已知的加速开始时间, 已超过暂停阈值时按 PAUSE_RETRY_SECONDS 重试
+        schedule_next_check(account)
 
-def stop_usage_timer():
-    if app.state.usage_timer and app.state.usage_timer.is_alive():
-        app.state.usage_timer.cancel()
-        app.state.usage_timer = None
-    elif app.state.usage_timer: # Timer exists but not alive (already finished/cancelled)
-        app.state.usage_timer = None # Clear it
-    # else: No timer was running or set
+    if not account.leigod_obj.token and account.current_token:
+        # 接口返回 token 失效时 leigod_obj 已清空 token, 同步到账号状态, 后续不再检查
+        account.current_token = ""
+        account.status_message = f"Token 已失效，请重新更新: {error_message}" if error_message else "Token 已失效，请重新更新。"
+    account_updated(account)
 
-@asynccontextmanager
-async def lifespan(app_instance: FastAPI): # Renamed app to app_instance to avoid conflict
-    app_instance.state = AppState()
-    state = app_instance.state # Use local variable for convenience
+def publish_transition(account: AccountState, paused: Optional[bool]):
+    """
+    推送账号暂停/加速状态的变化
+    """
+    app.state.events.publish("transition", {
+        "name": account.name,
+        "from": pause_state_name(account.is_last_known_state_paused),
+        "to": pause_state_name(paused),
+    })
+
+def account_updated(account: AccountState):
+    """
+    账号数据变化后调用: 保存到本地库, 并在内容变化时推送给页面
+    """
+    app.state.save_account(account)
+    publish_account_update(account)
+
+def publish_account_update(account: AccountState):
+    """
+    账号状态或使用记录与上次推送的不同时推送给页面
+    """
+    app.state.bump_version()
+    status = account_status_payload(account)
+    if status != account.published_status:
+        account.published_status = status
+        app.state.events.publish("status", status)
+    if account.usage_records != account.published_records:
+        account.published_records = list(account.usage_records)
+        app.state.events.publish("records", {"name": account.name, "records": account.usage_records})
+
+def plan_next_check(account: AccountState, accelerating: bool, full_data: Optional[dict], allow_immediate: bool = False):
+    """
+    计算账号的下次检查时间:
+    加速中且能确定开始时间时, 在下一个阈值 (警告/暂停) 截止时间后几秒检查, 超过暂停阈值 (自动暂停失败) 后按 PAUSE_RETRY_SECONDS 重试;
+    否则按 CHECK_INTERVAL_MINUTES 做兜底轮询
+    allow_immediate: 数据不是由定时检查获取的 (例如更新 Token 时), 已超过警告或暂停阈值则立即安排检查
+    (通知按加速开始时间去重, 已发送过的警告不会重复发送)
+    """
+    account.accelerating_since = policy.accelerating_since(full_data) if accelerating else None
+    schedule_next_check(account, allow_immediate)
+
+def schedule_next_check(account: AccountState, allow_immediate: bool = False):
+    """
+    按已知的加速开始时间 (account.accelerating_since) 计算下次检查时间, 只探测了状态或检查失败时使用
+    """
+    now = datetime.now()
+    next_check = policy.next_check_time(account.accelerating_since, now, allow_immediate)
+    account.next_check_at = time.time() + (next_check - now).total_seconds()
+    logger.info(f"定时任务：账号 {account.name} 下次检查时间: {next_check.strftime('%Y-%m-%d %H:%M:%S')}")
+
+async def check_due_accounts():
+    """
+    检查所有已到检查时间的账号, 同时请求的账号数不超过 MAX_CONCURRENT_CHECKS
+    只由调度任务 (app.state.scheduler) 调用, 请求处理函数不直接检查
+    """
+    if not app.state.lease.is_held():
+        # 租约已过期 (例如事件循环长时间阻塞), 其他进程可能已接管, 不再检查
+        logger.warning("定时任务：本进程未持有主节点租约，跳过检查。")
+        return
+    if app.state.check_lock.locked():
+        logger.warning("定时任务：上一轮检查尚未结束，跳过。")
+        return
+    async with app.state.check_lock:
+        now = time.time()
+        accounts = [
+            account for account in list(app.state.accounts.values())
+            if account.current_token and account.next_check_at <= now
+        ]
+        started = time.perf_counter()
+        results = await asyncio.gather(
+            *(run_bounded(check_usage_details_task(account)) for account in accounts),
+            return_exceptions=True,
+        )
+        for account, result in zip(accounts, results):
+            if isinstance(result, Exception):
+                logger.error(f"定时任务：账号 {account.name} 检查异常: {result}")
+                account.next_check_at = time.time() + policy.get_check_interval_minutes() * 60
+        elapsed = time.perf_counter() - started
+        if accounts:
+            metrics.CHECK_CYCLE_DURATION.observe(elapsed)
+        logger.info(f"定时任务：已检查 {len(accounts)} 个账号，耗时 {elapsed:.2f} 秒。")
+
+def get_next_check_delay() -> Optional[float]:
+    """
+    距离最早一个账号检查时间的秒数, 供调度任务计算等待时间
+    不是主节点、预热未完成或没有有效 Token 时返回 None, 等待 wake_scheduler() 唤醒
+    """
+    state = app.state
+    if not state.is_leader or state.warmup_task is None or not state.warmup_task.done():
+        return None
+    if not state.lease.is_held():
+        # 仍是主节点但租约已过期, 等待下一次续约
+        return state.lease.renew_interval
+    next_check_times = [account.next_check_at for account in state.accounts.values() if account.current_token]
+    if not next_check_times:
+        return None
+    return max(0.0, min(next_check_times) - time.time())
 
-    if state.current_token:
-        success, message = state.leigod_obj.update_token(state.current_token)
+def wake_scheduler():
+    """
+    账号的检查时间、Token 或主节点状态变化后调用, 调度任务重新计算下一次检查时间
+    """
+    app.state.scheduler.wake()
+
+def schedule_account_check(account: AccountState, usage_result: tuple):
+    """
+    账号 Token 更新后根据刚获取的使用明细安排下次检查, 不额外请求接口;
+    已超过暂停阈值时由调度任务立即检查
+    """
+    success, _, _, full_data = usage_result
+    plan_next_check(account, success and account.is_last_known_state_paused is False, full_data, allow_immediate=True)
+    wake_scheduler()
+
+class UpstreamContext:
+    """
+    单个请求内的上游结果缓存: 同一请求中账号信息和使用明细各最多请求一次, 之后直接复用
+    """
+    def __init__(self, account: AccountState):
+        self.account = account
+        self._account_info: Optional[tuple] = None
+        self._usage: Optional[tuple] = None
+
+    async def update_token(self, token: str) -> tuple:
+        # update_token 内部已获取账号信息, 结果直接作为本次请求的账号信息
+        self._account_info = await self.account.leigod_obj.update_token(token)
+        return self._account_info
+
+    async def account_info(self) -> tuple:
+        if self._account_info is None:
+            self._account_info = await self.account.leigod_obj.get_account_info()
+        return self._account_info
+
+    async def usage(self) -> tuple:
+        if self._usage is None:
+            self._usage = await fetch_usage_snapshot(self.account)
+        return self._usage
+
+async def initialize_account(account: AccountState):
+    ctx = UpstreamContext(account)
+    if account.current_token:
+        success, message = await ctx.update_token(account.current_token)
         if success:
-            account_info_tuple = state.leigod_obj.get_account_info()
+            account_info_tuple = await ctx.account_info()
             if account_info_tuple[0]:
                 account_data = account_info_tuple[1]
-                state.status_message = f"Token 初始化成功！账号状态: {account_data.get('pause_status', '未知')}"
-                state.nickname = account_data.get('nickname', '')
-                
+                account.status_message = f"Token 初始化成功！账号状态: {account_data.get('pause_status', '未知')}"
+                account.nickname = account_data.get('nickname', '')
+
                 # Initialize is_last_known_state_paused
                 if 'pause_status_id' in account_data:
-                    state.is_last_known_state_paused = (account_data['pause_status_id'] == 1)
-                    logger.info(f"Lifespan: 初始暂停状态根据 account_info 设置为: {state.is_last_known_state_paused} (ID: {account_data['pause_status_id']})")
+                    account.is_last_known_state_paused = (account_data['pause_status_id'] == 1)
+                    logger.info(f"Lifespan: 账号 {account.name} 初始暂停状态根据 account_info 设置为: {account.is_last_known_state_paused} (ID: {account_data['pause_status_id']})")
                 else:
                     # Fallback: Try to infer from initial usage details
-                    s_usage, m_usage, _, fd_usage = state.leigod_obj.get_usage_details_and_full_data()
+                    s_usage, m_usage, _, fd_usage = await ctx.usage()
                     if s_usage:
-                        if "已暂停状态" in m_usage: state.is_last_known_state_paused = True
-                        elif "未暂停状态" in m_usage: state.is_last_known_state_paused = False
-                        else: state.is_last_known_state_paused = None
-                        logger.info(f"Lifespan: 初始暂停状态根据 usage_details 设置为: {state.is_last_known_state_paused} (消息: '{m_usage}')")
+                        account.is_last_known_state_paused = policy.status_from_records(fd_usage["list"]).paused
+                        logger.info(f"Lifespan: 账号 {account.name} 初始暂停状态根据 usage_details 设置为: {account.is_last_known_state_paused} (消息: '{m_usage}')")
                     else:
-                        state.is_last_known_state_paused = None
-                        logger.warning(f"Lifespan: 获取初始使用明细失败 ({m_usage})，无法确定初始暂停状态。")
-                
-                success_usage, msg_usage, _, full_data_usage = state.leigod_obj.get_usage_details_and_full_data()
+                        account.is_last_known_state_paused = None
+                        logger.warning(f"Lifespan: 账号 {account.name} 获取初始使用明细失败 ({m_usage})，无法确定初始暂停状态。")
+
+                usage_result = await ctx.usage()
+                success_usage, msg_usage, _, full_data_usage = usage_result
                 if success_usage and full_data_usage and 'list' in full_data_usage:
-                    state.usage_records = full_data_usage['list']
+                    account.usage_records = full_data_usage['list']
                 else:
-                    logger.warning(f"初始使用明细获取失败: {msg_usage}")
+                    logger.warning(f"账号 {account.name} 初始使用明细获取失败: {msg_usage}")
+                plan_next_check(account, success_usage and account.is_last_known_state_paused is False, full_data_usage, allow_immediate=True)
             else:
-                state.status_message = f"Token 初始化成功，但获取账号信息失败: {account_info_tuple[1]}"
-                state.is_last_known_state_paused = None
-                logger.error(f"Lifespan: 获取账号信息失败, 初始暂停状态未确定: {account_info_tuple[1]}")
+                account.status_message = f"Token 初始化成功，但获取账号信息失败: {account_info_tuple[1]}"
+                account.is_last_known_state_paused = None
+                logger.error(f"Lifespan: 账号 {account.name} 获取账号信息失败, 初始暂停状态未确定: {account_info_tuple[1]}")
         else:
-            state.status_message = f"Token 初始化失败: {message}"
-            state.is_last_known_state_paused = None
-            logger.error(f"Lifespan: Token 初始化失败, 初始暂停状态未确定: {message}")
+            account.current_token = ""
+            account.status_message = f"Token 初始化失败: {message}"
+            account.is_last_known_state_paused = None
+            logger.error(f"Lifespan: 账号 {account.name} Token 初始化失败, 初始暂停状态未确定: {message}")
     else:
-        state.status_message = "当前token为空，请更新token。"
-        state.is_last_known_state_paused = None
-        logger.info("Lifespan: Token 为空, 初始暂停状态未确定。")
+        account.status_message = "当前token为空，请更新token。"
+        account.is_last_known_state_paused = None
+        logger.info(f"Lifespan: 账号 {account.name} Token 为空, 初始暂停状态未确定。")
+
+    logger.info(f"Lifespan: 账号 {account.name} 服务状态: {account.status_message}, 初始暂停检测状态: {account.is_last_known_state_paused}")
+    account.warming_up = False
+    account_updated(account)
+
+async def warm_up(state: AppState):
+    """
+    后台预热: 验证所有账号的 Token 并加载初始数据, 完成后启动定时检查
+    上游慢或不可用时服务照常接受请求, 只是暂未就绪
+    """
+    accounts = [account for account in state.accounts.values() if account.warming_up]
+    results = await asyncio.gather(
+        *(run_bounded(initialize_account(account)) for account in accounts),
+        return_exceptions=True,
+    )
+    for account, result in zip(accounts, results):
+        if isinstance(result, Exception):
+            logger.error(f"Lifespan: 账号 {account.name} 初始化异常: {result}")
+    for account in state.accounts.values():
+        if account.warming_up:
+            account.warming_up = False
+            account.status_message = "启动时初始化失败，请更新 Token 或等待下次检查。"
+            # 与初始化成功时相同, 保存并更新页面版本; 非主节点接管后重新预热时服务已就绪, mark_ready 不会再更新版本
+            account_updated(account)
+    mark_ready(state)
+    # 预热完成后开始定时检查
+    wake_scheduler()
 
-    logger.info(f"Lifespan: 服务状态: {state.status_message}, 初始暂停检测状态: {state.is_last_known_state_paused}")
-    start_usage_timer()
+def mark_ready(state: AppState):
+    if state.ready:
+        return
+    state.ready = True
+    state.bump_version()
+    elapsed = time.time() - PROCESS_STARTED_AT
+    metrics.STARTUP_DURATION.set(elapsed, phase="ready")
+    logger.info(f"服务已就绪，距进程启动 {elapsed:.2f} 秒。")
+    state.events.publish("ready", {"startup_seconds": round(elapsed, 3)})
+
+def forget_account(state: AppState, name: str):
+    """
+    从内存中移除账号及其指标/缓存, 并通知页面
+    """
+    account = state.accounts.pop(name, None)
+    if account is None:
+        return
+    cancel_history_backfill([account])
+    state.notifier.forget(name)
+    metrics.LAST_SUCCESSFUL_CHECK.remove(account=name)
+    metrics.ACCELERATION_MINUTES.remove(account=name)
+    for key in [key for key in state.api_validators if key[1:2] == (name,)]:
+        del state.api_validators[key]
+    state.events.publish("removed", {"name": name})
+    state.bump_version()
+    if not state.accounts:
+        state.add_account(DEFAULT_ACCOUNT).status_message = "当前token为空，请更新token。"
+
+def sync_accounts_from_store(state: AppState) -> bool:
+    """
+    载入其他进程保存到本地库的账号修改 (检查结果、更新 Token、新增和移除账号), 返回是否有变化
+    单进程部署时只有一次很小的查询, 不会有变化
+    """
+    versions = state.store.account_state_versions()
+    changed = [
+        name for name, updated_at in versions.items()
+        if name not in state.accounts or updated_at > state.accounts[name].saved_at
+    ]
+    updated = False
+    for name, (snapshot, updated_at) in state.store.load_account_states(changed).items():
+        if not state.matches_env(name, snapshot):
+            # 环境变量中的 token 已变化, 等待主节点重新初始化后再载入
+            continue
+        account = state.get_account(name)
+        if snapshot.get("paused") != account.is_last_known_state_paused:
+            publish_transition(account, snapshot.get("paused"))
+        account.restore(snapshot, state.store.recent_records(name, DASHBOARD_RECORD_COUNT))
+        account.saved_at = updated_at
+        publish_account_update(account)
+        updated = True
+    for name, account in list(state.accounts.items()):
+        # 保存过但已从库中删除, 说明在其他进程中被移除
+        if account.saved_at and name not in versions:
+            forget_account(state, name)
+            logger.info(f"账号 {name} 已在其他进程中移除。")
+            updated = True
+    return updated
+
+async def coordinate(state: AppState):
+    """
+    每 LEADER_LEASE_SECONDS/3 秒执行一次: 续约或竞争主节点租约, 并载入其他进程保存的账号修改
+    成为主节点后预热并启动定时检查, 失去租约后立即停止; 非主节点不请求雷神接口, 启动后直接就绪
+    主节点同时执行非主节点提交的更新 Token / 暂停请求 (submit_to_leader)
+    """
+    metrics.LEADER.set(0)
+    while True:
+        try:
+            leader = state.lease.try_acquire()
+        except sqlite3.Error as e:
+            # 本地库暂时不可写时沿用上次续约的结果, 到期后自动放弃
+            logger.error(f"续约主节点租约失败: {e}")
+            leader = state.lease.is_held()
+        if leader and not state.is_leader:
+            state.is_leader = True
+            metrics.LEADER.set(1)
+            logger.info("已获得主节点租约，由本进程运行定时检查。")
+            state.warmup_task = asyncio.get_running_loop().create_task(warm_up(state))
+        elif not leader and state.is_leader:
+            state.is_leader = False
+            metrics.LEADER.set(0)
+            if state.warmup_task is not None and not state.warmup_task.done():
+                state.warmup_task.cancel()
+            cancel_history_backfill(state.accounts.values())
+            wake_scheduler()
+            logger.warning("主节点租约已被其他进程接管，停止定时检查。")
+        elif not leader and not state.ready:
+            mark_ready(state)
+        try:
+            if sync_accounts_from_store(state) and state.is_leader:
+                # 其他进程更新了 Token 等, 按新的检查时间重新安排
+                wake_scheduler()
+            if state.is_leader and state.warmup_task is not None and state.warmup_task.done():
+                await run_submitted_commands(state)
+        except sqlite3.Error as e:
+            logger.error(f"从本地库同步账号状态失败: {e}")
+        await asyncio.sleep(state.lease.renew_interval)
+
+@asynccontextmanager
+async def lifespan(app_instance: FastAPI): # Renamed app to app_instance to avoid conflict
+    app_instance.state = AppState()
+    state = app_instance.state # Use local variable for convenience
+
+    if not state.accounts:
+        state.add_account(DEFAULT_ACCOUNT)
+    for account in state.accounts.values():
+        # 从本地库恢复的账号直接使用保存的状态, 到期的检查在预热完成后立即执行
+        account.warming_up = not account.restored
+
+    state.notifier.start()
+    # 不等待上游接口, 立即开始接受请求; 获得主节点租约后在后台验证 Token 和加载初始数据
+    state.coordinator_task = asyncio.get_running_loop().create_task(coordinate(state))
+    # 唯一的定时检查任务, 成为主节点且预热完成后才开始检查
+    state.scheduler.start()
+    metrics.STARTUP_DURATION.set(time.time() - PROCESS_STARTED_AT, phase="serving")
+    loop_monitor = asyncio.get_running_loop().create_task(tracing.monitor_event_loop()) if tracing.ENABLED else None
     yield
-    stop_usage_timer()
+    # 先停止调度 (取消进行中的检查), 再停止其他后台任务 (包括页面触发的刷新和历史记录回填), 全部结束后再释放租约和关闭连接
+    await state.scheduler.stop()
+    account_tasks = [task for account in state.accounts.values() for task in (account.refresh_task, account.backfill_task)]
+    background = [task for task in (loop_monitor, state.coordinator_task, state.warmup_task, *account_tasks) if task is not None]
+    for task in background:
+        task.cancel()
+    await asyncio.gather(*background, return_exceptions=True)
+    if state.is_leader:
+        # 主动释放, 其他进程无需等待租约过期即可接管
+        state.lease.release()
+    state.events.close()
+    await state.notifier.stop()
+    await state.client.aclose()
+    state.store.close()
 
 app = FastAPI(lifespan=lifespan)
+if tracing.ENABLED:
+    app.add_middleware(tracing.TimingMiddleware)
 templates = Jinja2Templates(directory="templates")
 
-@app.get("/", response_class=HTMLResponse)
-async def home_page(request: Request):
-    state = request.app.state
-    
-    if state.current_token:
-        success_usage, msg_usage, _, full_data_usage = state.leigod_obj.get_usage_details_and_full_data()
+def apply_usage_status_message(account: AccountState, msg_usage: str):
+    # Update status message based on latest usage details if not an error message already
+    if not ("失败" in account.status_message or "错误" in account.status_message): # Avoid overwriting error messages
+        if "已暂停状态" in msg_usage:
+            account.status_message = "当前账号处于已暂停状态。"
+        elif "未暂停状态" in msg_usage:
+             account.status_message = msg_usage # e.g., "当前账号处于未暂停状态，已持续 X 分钟。"
+        # else, keep existing status_message if usage message is ambiguous for main page display
+
+async def refresh_account_for_page(account: AccountState):
+    if account.current_token:
+        success_usage, msg_usage, _, full_data_usage = await fetch_usage_snapshot(account)
         if success_usage:
             if full_data_usage and 'list' in full_data_usage:
-                state.usage_records = full_data_usage['list']
+                account.usage_records = full_data_usage['list']
             else:
-                state.usage_records = [] # No list data even if call was success
-
-            # Update status message based on latest usage details if not an error message already
-            if not ("失败" in state.status_message or "错误" in state.status_message): # Avoid overwriting error messages
-                if "已暂停状态" in msg_usage:
-                    state.status_message = "当前账号处于已暂停状态。"
-                elif "未暂停状态" in msg_usage:
-                     state.status_message = msg_usage # e.g., "当前账号处于未暂停状态，已持续 X 分钟。"
-                # else, keep existing status_message if usage message is ambiguous for main page display
+                account.usage_records = [] # No list data even if call was success
+
+            apply_usage_status_message(account, msg_usage)
         else:
-            state.status_message = msg_usage # Reflect error from get_usage_details
-            state.usage_records = []
+            account.status_message = msg_usage # Reflect error from get_usage_details
+            account.usage_records = []
     else:
-        state.usage_records = []
-        state.status_message = "当前token为空，请更新token。"
-
-    masked_token_display = mask_token(state.current_token) if state.current_token else '未设置'
-
-    return templates.TemplateResponse("index.html", {
-        "request": request,
-        "current_token": masked_token_display,
-        "nickname": state.nickname,
-        "status_message": state.status_message,
-        "last_update_time": state.get_current_time(), 
-        "usage_records": state.usage_records 
-    })
+        account.usage_records = []
+        account.status_message = "当前token为空，请更新token。"
+    account_updated(account)
+
+def schedule_snapshot_refresh(account: AccountState):
+    """
+    在后台刷新账号的页面数据, 已有刷新任务在进行时不重复创建
+    """
+    if account.refresh_task is not None and not account.refresh_task.done():
+        return
+    account.refresh_task = asyncio.get_running_loop().create_task(run_bounded(refresh_account_for_page(account)))
+
+def refresh_stale_accounts(accounts: List[AccountState]):
+    """
+    数据超过 DASHBOARD_CACHE_TTL_SECONDS 的账号在后台刷新, 调用方直接使用缓存数据
+    """
+    cache_ttl = get_dashboard_cache_ttl_seconds()
+    for account in accounts:
+        data_age = account.data_age_seconds()
+        if account.warming_up or not app.state.is_leader:
+            # 预热任务正在加载该账号的数据; 非主节点的数据由主节点刷新后从本地库载入
+            continue
+        if not account.current_token:
+            if account.usage_records or account.status_message != "当前token为空，请更新token。":
+                account.usage_records = []
+                account.status_message = "当前token为空，请更新token。"
+                app.state.bump_version()
+        elif data_age is None or data_age > cache_ttl:
+            schedule_snapshot_refresh(account)
+
+@app.get("/", response_class=HTMLResponse)
+async def home_page(request: Request):
+    """
+    页面直接使用缓存的账号数据渲染, 数据超过 DASHBOARD_CACHE_TTL_SECONDS 时在后台刷新, 不等待上游接口
+    状态版本号不变时直接返回上次渲染 (及压缩) 的结果, 不执行模板
+    """
+    state = request.app.state
+    accounts = list(state.accounts.values())
+    refresh_stale_accounts(accounts)
+
+    page = state.page_cache.get(state.version, lambda: render_index(state))
+    if page.etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers={"ETag": page.etag})
+    body, encoding = page.encoded(request.headers.get("accept-encoding", ""))
+    headers = {"ETag": page.etag, "Vary": "Accept-Encoding", "Cache-Control": "no-cache"}
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(body, media_type="text/html; charset=utf-8", headers=headers)
+
+def render_index(state: AppState) -> str:
+    """
+    渲染首页, 结果只取决于 AppState 的内容 (不含当前时间等), 以便按版本号缓存
+    """
+    with tracing.span("render", "index.html"):
+        return templates.get_template("index.html").render({
+            "accounts": [
+                {
+                    "name": account.name,
+                    "current_token": mask_token(account.current_token) if account.current_token else '未设置',
+                    "nickname": account.nickname,
+                    "status_message": account.status_message,
+                    "last_update_time": account.last_update_time,
+                    "usage_records": account.usage_records,
+                    "data_updated_at": account.data_updated_at,
+                    "data_updated_text": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(account.data_updated_at)) if account.data_updated_at else "",
+                    "warming_up": account.warming_up,
+                }
+                for account in state.accounts.values()
+            ],
+            "warming_up": not state.ready,
+        })
+
+def submit_to_leader(state: AppState, account: AccountState, action: str, payload: dict, message: str):
+    """
+    非主节点不请求雷神接口: 把操作写入本地库, 由主节点在下一次协调时执行并保存结果, 再同步到本进程
+    """
+    state.store.enqueue_command(account.name, action, payload, time.time())
+    account.status_message = message
+    account.last_update_time = state.get_current_time()
+    publish_account_update(account)
+    logger.info(f"账号 {account.name} 的 {action} 请求已提交给主节点。")
+
+async def run_submitted_commands(state: AppState):
+    """
+    主节点执行其他进程提交的操作, 与本进程收到请求时的处理相同
+    """
+    for name, action, payload in state.store.take_commands():
+        try:
+            if action == "update_token":
+                await apply_token_update(state, state.get_account(name), payload.get("token", ""))
+            elif action == "pause" and name in state.accounts:
+                await apply_pause(state, state.accounts[name])
+            else:
+                continue
+            logger.info(f"已执行其他进程提交的 {action} 请求: 账号 {name}")
+        except Exception as e:
+            logger.error(f"执行其他进程提交的 {action} 请求失败: 账号 {name}: {e}")
 
 @app.post("/update-token", response_class=RedirectResponse)
-async def update_token(request: Request, token: str = Form(...)):
+async def update_token(request: Request, token: str = Form(...), account: str = Form(DEFAULT_ACCOUNT)):
     state = request.app.state
-    state.current_token = token # Store full token in state
-    logger.info(f"收到新 Token {mask_token(token)}") # Log masked token
+    account = state.get_account(account.strip() or DEFAULT_ACCOUNT)
+    if not state.is_leader:
+        submit_to_leader(state, account, "update_token", {"token": token}, "新 Token 已提交，等待主节点验证...")
+    else:
+        await apply_token_update(state, account, token)
+    return RedirectResponse("/", status_code=303)
+
+async def apply_token_update(state: AppState, account: AccountState, token: str):
+    account.current_token = token # Store full token in state
+    logger.info(f"账号 {account.name} 收到新 Token {mask_token(token)}") # Log masked token
+    ctx = UpstreamContext(account)
 
     if token:
-        success, message = state.leigod_obj.update_token(token)
+        success, message = await ctx.update_token(token)
         if success:
-            account_info_tuple = state.leigod_obj.get_account_info()
+            account_info_tuple = await ctx.account_info()
             if account_info_tuple[0]:
                 account_data = account_info_tuple[1]
-                state.nickname = account_data.get('nickname', '')
-                
+                account.nickname = account_data.get('nickname', '')
+
                 # Update is_last_known_state_paused
                 if 'pause_status_id' in account_data:
-                    state.is_last_known_state_paused = (account_data['pause_status_id'] == 1)
-                    logger.info(f"Token Update: 暂停状态根据 account_info 设置为: {state.is_last_known_state_paused} (ID: {account_data['pause_status_id']})")
+                    account.is_last_known_state_paused = (account_data['pause_status_id'] == 1)
+                    logger.info(f"Token Update: 账号 {account.name} 暂停状态根据 account_info 设置为: {account.is_last_known_state_paused} (ID: {account_data['pause_status_id']})")
                 else:
                     # Fallback if pause_status_id is missing
-                    s_usage, m_usage, _, _ = state.leigod_obj.get_usage_details_and_full_data()
+                    s_usage, m_usage, _, fd_usage = await ctx.usage()
                     if s_usage:
-                        if "已暂停状态" in m_usage: state.is_last_known_state_paused = True
-                        elif "未暂停状态" in m_usage: state.is_last_known_state_paused = False
-                        else: state.is_last_known_state_paused = None
-                        logger.info(f"Token Update: 暂停状态根据 usage_details 设置为: {state.is_last_known_state_paused} (消息: '{m_usage}')")
+                        account.is_last_known_state_paused = policy.status_from_records(fd_usage["list"]).paused
+                        logger.info(f"Token Update: 账号 {account.name} 暂停状态根据 usage_details 设置为: {account.is_last_known_state_paused} (消息: '{m_usage}')")
                     else:
-                        state.is_last_known_state_paused = None
-                        logger.warning(f"Token Update: 获取使用明细失败 ({m_usage})，无法确定暂停状态。")
+                        account.is_last_known_state_paused = None
+                        logger.warning(f"Token Update: 账号 {account.name} 获取使用明细失败 ({m_usage})，无法确定暂停状态。")
 
                 # Update status message and usage records
-                s_usage, m_usage, dur_min, fd_usage = state.leigod_obj.get_usage_details_and_full_data()
+                s_usage, m_usage, dur_min, fd_usage = await ctx.usage()
                 if s_usage:
-                    state.usage_records = fd_usage.get('list', [])
+                    account.usage_records = fd_usage.get('list', [])
                     if "已暂停状态" in m_usage:
-                        state.status_message = f"Token 更新成功！当前账号处于已暂停状态。"
+                        account.status_message = f"Token 更新成功！当前账号处于已暂停状态。"
                     elif "未暂停状态" in m_usage:
-                        state.status_message = f"Token 更新成功！{m_usage}"
+                        account.status_message = f"Token 更新成功！{m_usage}"
                     else: # Ambiguous or other message
-                        state.status_message = f"Token 更新成功！账号状态: {account_data.get('pause_status', '未知')}. 使用明细: {m_usage}"
-                    logger.info(f"Token 更新后，状态: {state.status_message}")
+                        account.status_message = f"Token 更新成功！账号状态: {account_data.get('pause_status', '未知')}. 使用明细: {m_usage}"
+                    logger.info(f"账号 {account.name} Token 更新后，状态: {account.status_message}")
                 else:
-                    state.usage_records = []
-                    state.status_message = f"Token 更新成功！但获取使用明细失败: {m_usage}"
-                    logger.warning(f"Token 更新成功，但获取使用明细失败: {m_usage}")
-                
-                start_usage_timer()
+                    account.usage_records = []
+                    account.status_message = f"Token 更新成功！但获取使用明细失败: {m_usage}"
+                    logger.warning(f"账号 {account.name} Token 更新成功，但获取使用明细失败: {m_usage}")
+
+                schedule_account_check(account, await ctx.usage())
             else:
-                state.status_message = f"Token 更新成功，但获取账号信息失败: {account_info_tuple[1]}"
-                state.nickname = ""
-                state.is_last_known_state_paused = None
-                stop_usage_timer()
-                state.usage_records = []
-                logger.error(f"Token 更新成功，但获取账号信息失败: {account_info_tuple[1]}")
+                account.current_token = ""
+                account.status_message = f"Token 更新成功，但获取账号信息失败: {account_info_tuple[1]}"
+                account.nickname = ""
+                account.is_last_known_state_paused = None
+                account.usage_records = []
+                logger.error(f"账号 {account.name} Token 更新成功，但获取账号信息失败: {account_info_tuple[1]}")
         else:
-            state.status_message = f"Token 更新失败: {message}"
-            state.nickname = ""
-            state.is_last_known_state_paused = None
-            stop_usage_timer()
-            state.usage_records = []
-            logger.error(f"Token 更新失败: {message}")
+            account.current_token = ""
+            account.status_message = f"Token 更新失败: {message}"
+            account.nickname = ""
+            account.is_last_known_state_paused = None
+            account.usage_records = []
+            logger.error(f"账号 {account.name} Token 更新失败: {message}")
     else: # Token is empty
-        state.nickname = ""
-        state.status_message = "Token 为空，未能更新。"
-        state.leigod_obj.update_token("")
-        state.is_last_known_state_paused = None
-        stop_usage_timer()
-        state.usage_records = []
-        logger.warning("Token 为空，未能更新，定时任务已停止。")
-
-    state.last_update_time = state.get_current_time()
-    return RedirectResponse("/", status_code=303)
+        account.nickname = ""
+        account.status_message = "Token 为空，未能更新。"
+        await account.leigod_obj.update_token("")
+        account.is_last_known_state_paused = None
+        account.usage_records = []
+        logger.warning(f"账号 {account.name} Token 为空，未能更新，已停止检查该账号。")
+
+    account.last_update_time = state.get_current_time()
+    account_updated(account)
 
 @app.post("/pause", response_class=RedirectResponse)
-async def pause_acceleration(request: Request):
+async def pause_acceleration(request: Request, account: str = Form(DEFAULT_ACCOUNT)):
     state = request.app.state
-    logger.info("收到暂停加速请求。")
-    
-    if not state.current_token:
-        state.status_message = "当前没有有效的Token，请先更新Token。"
-        # state.is_last_known_state_paused remains unchanged or could be set to None
-        state.usage_records = []
-        logger.warning("暂停加速请求：Token 无效。")
+    account = state.accounts.get(account)
+    if account is None:
+        return RedirectResponse("/", status_code=303)
+    logger.info(f"账号 {account.name} 收到暂停加速请求。")
+    if not state.is_leader:
+        submit_to_leader(state, account, "pause", {}, "暂停请求已提交，等待主节点处理...")
+    else:
+        await apply_pause(state, account)
+    return RedirectResponse("/", status_code=303)
+
+async def apply_pause(state: AppState, account: AccountState):
+    ctx = UpstreamContext(account)
+
+    if not account.current_token:
+        account.status_message = "当前没有有效的Token，请先更新Token。"
+        # is_last_known_state_paused remains unchanged or could be set to None
+        account.usage_records = []
+        logger.warning(f"暂停加速请求：账号 {account.name} Token 无效。")
     else:
-        success_check_login, msg_check_login = state.leigod_obj.update_token(state.current_token) # Re-validate token
+        success_check_login, msg_check_login = await ctx.update_token(account.current_token) # Re-validate token
         if not success_check_login:
-            state.status_message = f"Token 已失效或登录失败，请重新登录: {msg_check_login}"
-            state.nickname = ""
-            state.is_last_known_state_paused = None # Token invalid, state unknown
-            stop_usage_timer()
-            state.usage_records = []
-            logger.error(f"暂停加速请求：Token 已失效或登录失败: {msg_check_login}")
+            account.current_token = ""
+            account.status_message = f"Token 已失效或登录失败，请重新登录: {msg_check_login}"
+            account.nickname = ""
+            account.is_last_known_state_paused = None # Token invalid, state unknown
+            account.usage_records = []
+            logger.error(f"暂停加速请求：账号 {account.name} Token 已失效或登录失败: {msg_check_login}")
         else:
-            # Refresh account info to correctly set nickname and initial pause state before manual pause
-            account_info_tuple = state.leigod_obj.get_account_info()
+            # Account info was just fetched by update_token; reuse it to set nickname and pause state before manual pause
+            account_info_tuple = await ctx.account_info()
             if account_info_tuple[0]:
-                state.nickname = account_info_tuple[1].get('nickname', '')
+                account.nickname = account_info_tuple[1].get('nickname', '')
                 if 'pause_status_id' in account_info_tuple[1]:
-                     state.is_last_known_state_paused = (account_info_tuple[1]['pause_status_id'] == 1)
-            
-            success_pause, msg_pause = state.leigod_obj.pause()
-            logger.info(f"手动暂停操作结果: {'成功' if success_pause else '失败'}, 消息: {msg_pause}")
-            
+                     account.is_last_known_state_paused = (account_info_tuple[1]['pause_status_id'] == 1)
+
+            success_pause, msg_pause = await account.leigod_obj.pause()
+            logger.info(f"账号 {account.name} 手动暂停操作结果: {'成功' if success_pause else '失败'}, 消息: {msg_pause}")
+
             if success_pause:
-                state.is_last_known_state_paused = True # Successfully paused
-            
-            s_usage, m_usage, _, fd_usage = state.leigod_obj.get_usage_details_and_full_data()
+                account.is_last_known_state_paused = True # Successfully paused
+
+            s_usage, m_usage, _, fd_usage = await ctx.usage()
             if s_usage:
-                state.usage_records = fd_usage.get('list', [])
+                account.usage_records = fd_usage.get('list', [])
                 if "已暂停状态" in m_usage: # Expected after successful pause
-                    state.status_message = f"{msg_pause} 当前账号处于已暂停状态。"
+                    account.status_message = f"{msg_pause} 当前账号处于已暂停状态。"
                 elif "未暂停状态" in m_usage: # Pause might have failed or not reflected yet
-                     state.status_message = f"{msg_pause} 但状态仍为: {m_usage}"
+                     account.status_message = f"{msg_pause} 但状态仍为: {m_usage}"
                 else:
-                    state.status_message = f"{msg_pause} 使用明细: {m_usage}"
+                    account.status_message = f"{msg_pause} 使用明细: {m_usage}"
             else:
-                state.usage_records = []
-                state.status_message = f"{msg_pause} 但获取使用明细失败: {m_usage}"
-                logger.error(f"手动暂停后，获取使用明细失败: {m_usage}")
+                account.usage_records = []
+                account.status_message = f"{msg_pause} 但获取使用明细失败: {m_usage}"
+                logger.error(f"账号 {account.name} 手动暂停后，获取使用明细失败: {m_usage}")
 
-    state.last_update_time = state.get_current_time()
-    return RedirectResponse("/", status_code=303)
+    account.last_update_time = state.get_current_time()
+    account_updated(account)
 
 @app.post("/reset", response_class=RedirectResponse)
-async def reset_state(request: Request):
+async def reset_state(request: Request, account: str = Form(DEFAULT_ACCOUNT)):
+    state = request.app.state
+    account = state.accounts.get(account)
+    if account is None:
+        return RedirectResponse("/", status_code=303)
+    account.current_token = ""
+    account.nickname = ""
+    account.status_message = "状态已重置，请重新输入Token。"
+    account.last_update_time = state.get_current_time()
+    account.usage_records = []
+    await account.leigod_obj.update_token("")
+    account.is_last_known_state_paused = None # Reset pause state
+    logger.info(f"账号 {account.name} 状态已重置。")
+    account_updated(account)
+    return RedirectResponse("/", status_code=303)
+
+@app.post("/remove-account", response_class=RedirectResponse)
+async def remove_account(request: Request, account: str = Form(...)):
     state = request.app.state
-    state.current_token = ""
-    state.nickname = ""
-    state.status_message = "状态已重置，请重新输入Token。"
-    state.last_update_time = state.get_current_time()
-    state.usage_records = []
-    state.leigod_obj.update_token("")
-    state.is_last_known_state_paused = None # Reset pause state
-    stop_usage_timer()
-    logger.info("应用程序状态已重置。")
+    if account in state.accounts:
+        state.store.delete_account_state(account)
+        forget_account(state, account)
+        logger.info(f"账号 {account} 已移除。")
     return RedirectResponse("/", status_code=303)
 
+@app.get("/healthz")
+async def liveness():
+    """
+    存活检查: 进程能处理请求即返回 200, 不访问上游接口
+    """
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readiness(request: Request):
+    """
+    就绪检查: 启动预热完成前返回 503
+    """
+    state = request.app.state
+    if not state.ready:
+        return JSONResponse({"status": "warming_up"}, status_code=503)
+    return {
+        "status": "ready",
+        "startup_seconds": round(metrics.STARTUP_DURATION.get(phase="ready"), 3),
+        "role": "leader" if state.is_leader else "follower",
+    }
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    """
+    Prometheus 文本格式的运行指标
+    """
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+# --- 管理接口, 需要设置 ADMIN_TOKEN ---
+# 单次采样分析的最长时间 (秒)
+MAX_PROFILE_SECONDS = 30
+
+def require_admin(request: Request):
+    """
+    校验 Authorization: Bearer <ADMIN_TOKEN>, 未设置 ADMIN_TOKEN 时管理接口不可用
+    """
+    admin_token = os.getenv("ADMIN_TOKEN", "")
+    if not admin_token:
+        raise HTTPException(status_code=404, detail="Not Found")
+    scheme, _, supplied = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(supplied.strip().encode(), admin_token.encode()):
+        raise HTTPException(status_code=403, detail="需要管理员 Token")
+
+@app.get("/admin/profile", response_class=PlainTextResponse)
+async def admin_profile(request: Request, seconds: float = 5, interval_ms: float = 5):
+    """
+    对运行中的进程做 seconds 秒的采样分析, 返回折叠栈 (可用 flamegraph.pl / speedscope 查看)
+    采样在独立线程中进行, 不阻塞事件循环
+    """
+    require_admin(request)
+    seconds = min(max(seconds, 0.1), MAX_PROFILE_SECONDS)
+    interval = min(max(interval_ms, 1), 1000) / 1000
+    try:
+        result = await asyncio.to_thread(tracing.profile, seconds, interval)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return PlainTextResponse(result)
+
+@app.get("/admin/slow")
+async def admin_slow_operations(request: Request):
+    """
+    最近超过 TRACE_SLOW_MS 的操作 (TRACE_ENABLED=1 时记录)
+    """
+    require_admin(request)
+    return {
+        "enabled": tracing.ENABLED,
+        "threshold_ms": tracing.SLOW_SECONDS * 1000,
+        "operations": list(tracing.SLOW_OPERATIONS),
+    }
+
+# --- JSON 状态接口 ---
+# /api/accounts/{name}/records 单次最多返回的记录数
+API_MAX_RECORDS = 500
+
+def pause_state_name(paused: Optional[bool]) -> str:
+    if paused is True:
+        return "paused"
+    if paused is False:
+        return "accelerating"
+    return "unknown"
+
+def get_pause_state(account: AccountState) -> str:
+    """
+    账号状态: warming_up / no_token / paused / accelerating / unknown
+    """
+    if account.warming_up:
+        return "warming_up"
+    if not account.current_token:
+        return "no_token"
+    return pause_state_name(account.is_last_known_state_paused)
+
+def account_status_payload(account: AccountState) -> dict:
+    """
+    账号状态的 JSON 表示, 字段固定, 不需要解析中文状态文本
+    加速分钟数取整, 内容每分钟最多变化一次, 便于轮询方使用 ETag
+    """
+    pause_state = get_pause_state(account)
+    since = policy.accelerating_since({"list": account.usage_records}) if pause_state == "accelerating" else None
+    return {
+        "name": account.name,
+        "nickname": account.nickname,
+        "token": mask_token(account.current_token) if account.current_token else None,
+        "state": pause_state,
+        "paused": account.is_last_known_state_paused if account.current_token else None,
+        "accelerating_since": since.strftime(policy.RECORD_TIME_FORMAT) if since else None,
+        "acceleration_minutes": int((datetime.now() - since).total_seconds() // 60) if since else None,
+        "status_message": account.status_message,
+        "last_update_time": account.last_update_time,
+        "next_check_at": int(account.next_check_at) if account.current_token and account.next_check_at else None,
+    }
+
+def is_not_modified(request: Request, etag: str, last_modified: float) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        # If-None-Match 优先, 此时忽略 If-Modified-Since
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        return "*" in tags or etag in tags or f"W/{etag}" in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(last_modified) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+def conditional_json_response(request: Request, key: tuple, payload: dict) -> Response:
+    """
+    返回带 ETag / Last-Modified 的 JSON, 内容未变化时按 If-None-Match / If-Modified-Since 返回 304
+    Last-Modified 为该接口内容最近一次变化的时间
+    """
+    body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    etag = f'"{hashlib.sha1(body).hexdigest()}"'
+    validators = request.app.state.api_validators
+    cached = validators.get(key)
+    if cached is None or cached[0] != etag:
+        cached = (etag, time.time())
+        validators[key] = cached
+    headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(cached[1], usegmt=True),
+        "Cache-Control": "no-cache",
+    }
+    if is_not_modified(request, etag, cached[1]):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
+
+def get_account_or_404(state: AppState, name: str) -> AccountState:
+    account = state.accounts.get(name)
+    if account is None:
+        raise HTTPException(status_code=404, detail=f"账号不存在: {name}")
+    return account
+
+@app.get("/api/status")
+async def api_status(request: Request):
+    """
+    所有账号的状态, 使用缓存数据, 过期时在后台刷新
+    """
+    accounts = list(request.app.state.accounts.values())
+    refresh_stale_accounts(accounts)
+    return conditional_json_response(request, ("status",), {
+        "accounts": [account_status_payload(account) for account in accounts],
+    })
+
+@app.get("/api/accounts/{name}")
+async def api_account_status(request: Request, name: str):
+    account = get_account_or_404(request.app.state, name)
+    refresh_stale_accounts([account])
+    return conditional_json_response(request, ("account", name), account_status_payload(account))
+
+@app.get("/api/accounts/{name}/records")
+async def api_account_records(request: Request, name: str, limit: int = DASHBOARD_RECORD_COUNT):
+    """
+    账号最近的使用记录 (最新的在前), 从本地库读取
+    """
+    state = request.app.state
+    account = get_account_or_404(state, name)
+    refresh_stale_accounts([account])
+    limit = min(max(1, limit), API_MAX_RECORDS)
+    return conditional_json_response(request, ("records", name, limit), {
+        "name": name,
+        "records": state.store.recent_records(name, limit),
+    })
+
+# SSE 心跳间隔 (秒), 保持连接不被代理断开
+EVENTS_HEARTBEAT_SECONDS = 15
+
+@app.get("/events")
+async def event_stream(request: Request):
+    """
+    SSE 推送: status (账号状态), records (使用记录), transition (暂停/加速状态变化), auto_pause (自动暂停结果), removed (账号移除)
+    事件由后台检查任务产生, 连接的页面数量不影响请求雷神接口的次数
+    """
+    broker = request.app.state.events
+    queue = broker.subscribe(request.headers.get("last-event-id"))
+
+    async def stream():
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                try:
+                    frame = await asyncio.wait_for(queue.get(), EVENTS_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                if frame is None:
+                    return
+                yield frame
+        finally:
+            broker.unsubscribe(queue)
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
+
+# /api/accounts/{name}/analytics 单次最多返回的桶数
+API_MAX_BUCKETS = 366
+
+@app.get("/api/accounts/{name}/analytics")
+async def api_account_analytics(request: Request, name: str, period: str = "day", limit: int = 30):
+    """
+    按天/周/月统计的加速时长和自动暂停节省的时长, 读取预先汇总的数据
+    """
+    state = request.app.state
+    get_account_or_404(state, name)
+    if period not in analytics.PERIODS:
+        raise HTTPException(status_code=400, detail=f"period 只支持 {' / '.join(analytics.PERIODS)}")
+    limit = min(max(1, limit), API_MAX_BUCKETS)
+    buckets = [
+        {
+            "bucket": bucket["bucket"],
+            "sessions": bucket["sessions"],
+            "accelerated_hours": round(bucket["accelerated_seconds"] / 3600, 2),
+            "auto_pauses": bucket["auto_pauses"],
+            "saved_hours": round(bucket["saved_seconds"] / 3600, 2),
+        }
+        for bucket in analytics.query(state.store, name, period, limit)
+    ]
+    return conditional_json_response(request, ("analytics", name, period, limit), {
+        "name": name,
+        "period": period,
+        "buckets": buckets,
+        "totals": {
+            "sessions": sum(bucket["sessions"] for bucket in buckets),
+            "accelerated_hours": round(sum(bucket["accelerated_hours"] for bucket in buckets), 2),
+            "auto_pauses": sum(bucket["auto_pauses"] for bucket in buckets),
+            "saved_hours": round(sum(bucket["saved_hours"] for bucket in buckets), 2),
+        },
+    })
+
+EXPORT_FIELDS = ["recover_time", "pause_time", "reduce_pause_time", "duration"]
+
+def parse_export_time(value: Optional[str], is_end: bool = False) -> Optional[str]:
+    """
+    解析导出的时间范围参数, 支持 "YYYY-MM-DD" 和 "YYYY-MM-DD HH:MM:SS"
+    结束日期只给到天时包含当天
+    """
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, policy.RECORD_TIME_FORMAT).strftime(policy.RECORD_TIME_FORMAT)
+    except ValueError:
+        pass
+    try:
+        day = datetime.strptime(value, "%Y-%m-%d")
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"时间格式无效: {value}")
+    if is_end:
+        day += timedelta(days=1)
+    return day.strftime(policy.RECORD_TIME_FORMAT)
+
+def iter_export_csv(records: Iterator[dict]) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS, extrasaction="ignore")
+    writer.writeheader()
+    for record in records:
+        writer.writerow(record)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+    # 只有表头时也要输出
+    if buffer.getvalue():
+        yield buffer.getvalue()
+
+def iter_export_ndjson(records: Iterator[dict]) -> Iterator[str]:
+    for record in records:
+        yield json.dumps(record, ensure_ascii=False) + "\n"
+
+@app.get("/export")
+async def export_usage(account: str = DEFAULT_ACCOUNT, format: str = "csv", start: Optional[str] = None, end: Optional[str] = None):
+    """
+    导出账号的完整使用记录 (按时间顺序), 支持 csv / ndjson 与日期范围过滤
+    先增量同步一次, 再从本地库分批流式输出, 内存占用与记录数无关
+    """
+    state = app.state
+    if account not in state.accounts:
+        raise HTTPException(status_code=404, detail=f"账号不存在: {account}")
+    if format not in ("csv", "ndjson"):
+        raise HTTPException(status_code=400, detail="format 只支持 csv 或 ndjson")
+    start_time = parse_export_time(start)
+    end_time = parse_export_time(end, is_end=True)
+
+    leigod_obj = state.accounts[account].leigod_obj
+    if leigod_obj.token and state.is_leader:
+        success, message, _ = await store.sync_usage_history(state.store, leigod_obj, account)
+        if not success:
+            logger.warning(f"导出前同步账号 {account} 使用记录失败, 将导出本地已有记录: {message}")
+
+    records = state.store.iter_records(account, start_time, end_time)
+    if format == "csv":
+        # 加 BOM 方便 Excel 识别 UTF-8
+        body = iter_export_csv(records)
+        media_type = "text/csv; charset=utf-8"
+        content = (chunk for part in (["\ufeff"], body) for chunk in part)
+    else:
+        content = iter_export_ndjson(records)
+        media_type = "application/x-ndjson; charset=utf-8"
+    filename = f"leigod-usage-{account}.{format}"
+    return StreamingResponse(content, media_type=media_type, headers={
+        "Content-Disposition": f"attachment; filename*=UTF-8''{quote(filename)}",
+    })
+
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000, log_level="warning") # Changed log_level for uvicorn for more details if needed
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=8000, log_level="warning") # Changed log_level for uvicorn for more details if needed
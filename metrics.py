@@ -0,0 +1,205 @@
+"""
+轻量的 Prometheus 文本格式指标, 每次记录只是加锁后的一次字典更新, 可以常开
+"""
+import threading
+from typing import Dict, List, Sequence, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+REGISTRY: List["_Metric"] = []
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric(object):
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], object] = {}
+        REGISTRY.append(self)
+
+    def _key(self, labels: dict) -> Tuple[str, ...]:
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def remove(self, **labels):
+        with self._lock:
+            self._values.pop(self._key(labels), None)
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        with self._lock:
+            lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+            for key, value in self._values.items()
+        ]
+
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def get(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def _samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+            for key, value in self._values.items()
+        ]
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # [各桶计数..., 总和]
+                state = [0] * len(self.buckets) + [0.0]
+                self._values[key] = state
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[index] += 1
+                    break
+            state[-1] += value
+
+    def _samples(self) -> List[str]:
+        lines = []
+        bucket_names = self.label_names + ("le",)
+        for key, state in self._values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(bucket_names, key + (_format_value(bound),))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {_format_value(state[-1])}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {cumulative}")
+        return lines
+
+
+def render() -> str:
+    return "\n".join(metric.render() for metric in REGISTRY) + "\n"
+
+
+UPSTREAM_LATENCY = Histogram(
+    "leigod_upstream_request_duration_seconds",
+    "雷神接口请求耗时, code 为接口返回码或 http_<状态码> / network_error / invalid_json",
+    ["endpoint", "code"],
+)
+UPSTREAM_ERRORS = Counter(
+    "leigod_upstream_errors_total",
+    "雷神接口失败次数 (返回码非 0 或请求失败), 400006 为 token 失效, http_403 为请求频繁, circuit_open 为熔断期间被拒绝",
+    ["endpoint", "code"],
+)
+UPSTREAM_RETRIES = Counter(
+    "leigod_upstream_retries_total",
+    "雷神接口失败后退避重试的次数, code 为触发重试的失败类型",
+    ["endpoint", "code"],
+)
+CIRCUIT_OPEN = Gauge(
+    "leigod_circuit_open",
+    "雷神接口熔断器状态, 1 为熔断中 (含半开探测), 0 为正常",
+)
+LEADER = Gauge(
+    "leigod_leader",
+    "本进程是否持有主节点租约 (运行定时检查), 1 为主节点, 0 为只读",
+)
+STARTUP_DURATION = Gauge(
+    "leigod_startup_duration_seconds",
+    "进程启动到各阶段的耗时: serving 为开始接受请求, ready 为后台预热完成",
+    ["phase"],
+)
+CHECK_CYCLE_DURATION = Histogram(
+    "leigod_check_cycle_duration_seconds",
+    "一轮定时检查的耗时",
+)
+CHECK_REQUESTS = Counter(
+    "leigod_check_requests_total",
+    "定时检查的请求方式: probe 为只探测了账号状态, usage 为同步了使用记录",
+    ["kind"],
+)
+LAST_SUCCESSFUL_CHECK = Gauge(
+    "leigod_last_successful_check_timestamp_seconds",
+    "账号最后一次成功检查的时间戳",
+    ["account"],
+)
+ACCELERATION_MINUTES = Gauge(
+    "leigod_acceleration_minutes",
+    "账号当前已连续加速的分钟数, 已暂停时为 0",
+    ["account"],
+)
+AUTO_PAUSE_ATTEMPTS = Counter(
+    "leigod_auto_pause_attempts_total",
+    "自动暂停尝试次数",
+    ["account"],
+)
+AUTO_PAUSE_SUCCESSES = Counter(
+    "leigod_auto_pause_successes_total",
+    "自动暂停成功次数",
+    ["account"],
+)
+NOTIFICATION_LATENCY = Histogram(
+    "leigod_notification_duration_seconds",
+    "发送通知的耗时",
+    ["result"],
+)
+HTTP_REQUEST_DURATION = Histogram(
+    "leigod_http_request_duration_seconds",
+    "各路由的请求耗时 (TRACE_ENABLED=1 时记录), SSE 长连接不计入",
+    ["method", "route", "status"],
+)
+SPAN_DURATION = Histogram(
+    "leigod_span_duration_seconds",
+    "上游接口调用 (含限流等待和重试)、通知发送、页面渲染等操作的耗时 (TRACE_ENABLED=1 时记录)",
+    ["kind", "name"],
+)
+EVENT_LOOP_LAG = Gauge(
+    "leigod_event_loop_lag_seconds",
+    "最近一次检测到的事件循环阻塞时长 (TRACE_ENABLED=1 时记录)",
+)
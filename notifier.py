@@ -0,0 +1,152 @@
+import asyncio
+import logging
+import os
+import random
+import time
+from typing import Dict, Hashable, List, Optional, Tuple
+
+import legod
+
+logger = logging.getLogger(__name__)
+
+NOTIFY_TITLE = "雷神加速器 提示"
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return max(0.0, float(os.getenv(name, default)))
+    except ValueError:
+        return default
+
+
+class Notification(object):
+    def __init__(self, account: str, kind: str, message: str):
+        self.account = account
+        self.kind = kind
+        self.message = message
+
+
+class NotificationDispatcher(object):
+    """
+    后台通知队列: 调用方只负责入队, 由后台任务发送, Server酱慢或不可用时不影响自动暂停等主流程
+    - 带 dedup_key 的通知在 NOTIFY_DEDUP_MINUTES 内只发送一次 (例如同一次加速只警告一次)
+      传入 store 时去重记录写入本地库, 重启后不会重复发送
+    - 收到通知后等待 NOTIFY_BATCH_SECONDS, 期间的多条通知合并为一条摘要发送
+    - 发送失败时按指数退避重试 NOTIFY_MAX_RETRIES 次
+    """
+
+    def __init__(self, sendkey: str = None, store=None):
+        self.sendkey = os.getenv('serverchan_sendkey', "") if sendkey is None else sendkey
+        self.dedup_seconds = _env_float("NOTIFY_DEDUP_MINUTES", 720) * 60
+        self.batch_seconds = _env_float("NOTIFY_BATCH_SECONDS", 5)
+        self.max_retries = int(_env_float("NOTIFY_MAX_RETRIES", 3))
+        self.retry_base_seconds = _env_float("NOTIFY_RETRY_BASE_SECONDS", 2)
+        self.queue: "asyncio.Queue[Optional[Notification]]" = asyncio.Queue()
+        # store.UsageStore, 用于持久化去重记录
+        self.store = store
+        # {(账号, 类型, dedup_key): 上次入队时间 (time.time())}
+        self._recent: Dict[Tuple[str, str, Hashable], float] = {}
+        if store is not None:
+            for account, kind, dedup_key, sent_at in store.recent_notifications(time.time() - self.dedup_seconds):
+                self._recent[(account, kind, dedup_key)] = sent_at
+        self._worker: Optional[asyncio.Task] = None
+        self.stats = {"queued": 0, "deduplicated": 0, "sent": 0, "failed": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.sendkey)
+
+    def submit(self, account: str, kind: str, message: str, dedup_key: Hashable = None) -> bool:
+        """
+        通知入队, 不阻塞; 被去重或未启用时返回 False
+        """
+        if not self.enabled:
+            return False
+        if dedup_key is not None:
+            now = time.time()
+            key = (account, kind, dedup_key)
+            last = self._recent.get(key)
+            if last is not None and now - last < self.dedup_seconds:
+                self.stats["deduplicated"] += 1
+                return False
+            self._recent[key] = now
+            self._prune(now)
+            # 先记录再入队: 即使随后崩溃, 重启后也不会再次发送
+            if self.store is not None and isinstance(dedup_key, str):
+                self.store.record_notification(account, kind, dedup_key, now)
+        self.queue.put_nowait(Notification(account, kind, message))
+        self.stats["queued"] += 1
+        return True
+
+    def forget(self, account: str):
+        """
+        移除账号时清除其去重记录
+        """
+        for key in [key for key in self._recent if key[0] == account]:
+            del self._recent[key]
+
+    def _prune(self, now: float):
+        if len(self._recent) < 1024:
+            return
+        for key, last in list(self._recent.items()):
+            if now - last >= self.dedup_seconds:
+                del self._recent[key]
+
+    def start(self):
+        if self._worker is None:
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self, timeout: float = 5):
+        """
+        尽量发送完队列中的通知后停止
+        """
+        if self._worker is None:
+            return
+        self.queue.put_nowait(None)
+        try:
+            await asyncio.wait_for(self._worker, timeout)
+        except asyncio.TimeoutError:
+            logger.warning("通知队列未能在超时前发送完毕，剩余通知已丢弃。")
+        self._worker = None
+
+    async def _run(self):
+        stopping = False
+        while not stopping:
+            first = await self.queue.get()
+            if first is None:
+                return
+            batch = [first]
+            if self.batch_seconds:
+                await asyncio.sleep(self.batch_seconds)
+            while not self.queue.empty():
+                item = self.queue.get_nowait()
+                if item is None:
+                    stopping = True
+                    continue
+                batch.append(item)
+            await self._send_with_retry(*self._format(batch))
+
+    @staticmethod
+    def _format(batch: List[Notification]) -> Tuple[str, str]:
+        if len(batch) == 1:
+            item = batch[0]
+            prefix = f"[{item.account}] " if item.account else ""
+            return NOTIFY_TITLE, f"{prefix}{item.message}"
+        lines = [f"- [{item.account}] {item.message}" if item.account else f"- {item.message}" for item in batch]
+        return f"{NOTIFY_TITLE} ({len(batch)} 条)", "\n".join(lines)
+
+    async def _send_with_retry(self, title: str, message: str):
+        for attempt in range(self.max_retries + 1):
+            try:
+                result = await asyncio.to_thread(legod.send_notification, self.sendkey, message, title)
+                if not isinstance(result, dict) or result.get("code", 0) == 0:
+                    self.stats["sent"] += 1
+                    return
+                logger.warning(f"通知发送失败 (第 {attempt + 1} 次): {result}")
+            except Exception as e:
+                logger.warning(f"通知发送异常 (第 {attempt + 1} 次): {e}")
+            if attempt < self.max_retries:
+                delay = self.retry_base_seconds * (2 ** attempt)
+                await asyncio.sleep(delay + random.uniform(0, delay / 2))
+        self.stats["failed"] += 1
+        logger.error(f"通知发送失败，已放弃: {title}")
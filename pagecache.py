@@ -0,0 +1,75 @@
+"""
+首页渲染结果的缓存: 以 AppState 的版本号为键, 版本不变时直接返回已渲染的内容, 不再执行模板
+压缩后的内容 (gzip, 安装了 brotli 时还有 br) 在某个版本第一次被需要时生成一次, 之后同样直接返回
+"""
+import gzip
+import os
+from typing import Callable, Dict, Optional, Tuple
+
+try:
+    import brotli
+except ImportError:  # 可选依赖
+    brotli = None
+
+# 同一版本号在不同进程 (重启后或多进程部署时) 对应的内容不同, ETag 中加入进程标识
+_PROCESS_TAG = f"{os.getpid():x}"
+
+
+def parse_accept_encoding(header: str) -> Dict[str, float]:
+    """
+    解析 Accept-Encoding 为 {编码: q 值}
+    """
+    encodings = {}
+    for item in header.split(","):
+        name, _, params = item.strip().partition(";")
+        if not name:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        encodings[name.strip().lower()] = q
+    return encodings
+
+
+class PageCache(object):
+
+    def __init__(self):
+        self.version: Optional[int] = None
+        self.body = b""
+        self.etag = ""
+        self._encoded: Dict[str, bytes] = {}
+        self.stats = {"hits": 0, "renders": 0}
+
+    def get(self, version: int, render: Callable[[], str]) -> "PageCache":
+        """
+        返回 version 对应的缓存, 版本变化时调用 render 重新渲染
+        """
+        if version != self.version:
+            self.body = render().encode("utf-8")
+            self.version = version
+            self.etag = f'"{_PROCESS_TAG}-{version}"'
+            self._encoded = {}
+            self.stats["renders"] += 1
+        else:
+            self.stats["hits"] += 1
+        return self
+
+    def encoded(self, accept_encoding: str) -> Tuple[bytes, Optional[str]]:
+        """
+        按客户端支持的编码返回 (内容, Content-Encoding), 优先 br, 其次 gzip, 都不支持时返回原文
+        """
+        accepted = parse_accept_encoding(accept_encoding)
+        for encoding in ("br", "gzip"):
+            if accepted.get(encoding, accepted.get("*", 0)) <= 0 or (encoding == "br" and brotli is None):
+                continue
+            body = self._encoded.get(encoding)
+            if body is None:
+                body = brotli.compress(self.body) if encoding == "br" else gzip.compress(self.body, 6)
+                self._encoded[encoding] = body
+            return body, encoding
+        return self.body, None
@@ -0,0 +1,333 @@
+import functools
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+RECORD_TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def get_threshold_minutes(name: str, default: int = 1440) -> float:
+    """
+    读取阈值环境变量 (分钟), 无效时返回 inf 表示不触发
+    """
+    value_env = os.getenv(name)
+    try:
+        return int(value_env) if value_env is not None else default
+    except ValueError:
+        logger.warning(f"无效的 {name}值: {value_env}，将不触发对应操作。")
+        return float('inf')
+
+
+def get_thresholds() -> Tuple[float, float]:
+    """
+    返回 (警告阈值, 暂停阈值), 单位分钟, 默认均为 24 小时
+    """
+    return get_threshold_minutes("WARNING_THRESHOLD_MINUTES"), get_threshold_minutes("PAUSE_THRESHOLD_MINUTES")
+
+
+def get_check_interval_minutes() -> int:
+    """
+    兜底轮询间隔 (分钟)
+    """
+    interval_env = os.getenv("CHECK_INTERVAL_MINUTES", "60")
+    try:
+        interval = int(interval_env)
+        if interval <= 0:
+            interval = 60 # Default to 60 if non-positive
+            logger.warning(f"CHECK_INTERVAL_MINUTES 值 ({interval_env}) 无效，已重置为60分钟。")
+    except ValueError:
+        interval = 60 # Default to 60 if not a valid integer
+        logger.warning(f"CHECK_INTERVAL_MINUTES 值 ({interval_env}) 无效，已重置为60分钟。")
+    return interval
+
+
+def get_deadline_margin_seconds() -> float:
+    """
+    截止时间后多等待的秒数, 保证醒来时加速时长确实已超过阈值
+    """
+    try:
+        return max(0.0, float(os.getenv("DEADLINE_MARGIN_SECONDS", "5")))
+    except ValueError:
+        return 5.0
+
+
+def get_check_jitter_seconds() -> float:
+    """
+    定时检查唤醒时间的随机延后上限 (秒), 避免多个副本或重启后在同一时刻集中请求
+    """
+    try:
+        return max(0.0, float(os.getenv("CHECK_JITTER_SECONDS", "3")))
+    except ValueError:
+        return 3.0
+
+
+def get_pause_retry_seconds() -> float:
+    """
+    超过暂停阈值仍在加速 (自动暂停或检查失败) 时的重试间隔 (秒), 不等兜底轮询
+    """
+    try:
+        return max(1.0, float(os.getenv("PAUSE_RETRY_SECONDS", "60")))
+    except ValueError:
+        return 60.0
+
+
+def get_usage_refresh_minutes() -> float:
+    """
+    状态没有变化时请求使用记录的最长间隔 (分钟), 用于发现两次检查之间恢复过又已暂停的加速
+    """
+    try:
+        return max(0.0, float(os.getenv("USAGE_REFRESH_MINUTES", "360")))
+    except ValueError:
+        return 360.0
+
+
+class Settings(object):
+    """
+    阈值和检查间隔; 未指定时从环境变量读取, 模拟 (simulate.py) 时每个策略传入各自的取值
+    """
+
+    def __init__(self, warning_minutes: float, pause_minutes: float, interval_minutes: float, margin_seconds: float,
+                 refresh_minutes: float = 0.0, retry_seconds: float = 60.0):
+        self.warning_minutes = warning_minutes
+        self.pause_minutes = pause_minutes
+        self.interval_minutes = interval_minutes
+        self.margin_seconds = margin_seconds
+        # 状态没有变化时, 至少每隔多少分钟请求一次使用记录 (见 needs_usage), 0 为每次检查都请求
+        self.refresh_minutes = refresh_minutes
+        # 超过暂停阈值仍在加速时的重试间隔 (秒)
+        self.retry_seconds = retry_seconds
+
+    @classmethod
+    def from_env(cls) -> "Settings":
+        warning_minutes, pause_minutes = get_thresholds()
+        return cls(warning_minutes, pause_minutes, get_check_interval_minutes(), get_deadline_margin_seconds(),
+                   get_usage_refresh_minutes(), get_pause_retry_seconds())
+
+
+# 同一条记录的时间在每次检查时都会被解析, 缓存解析结果 (datetime 不可变, 可以共享)
+@functools.lru_cache(maxsize=4096)
+def parse_record_time(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, RECORD_TIME_FORMAT)
+    except ValueError:
+        return None
+
+
+def accelerating_since(full_data: Optional[dict]) -> Optional[datetime]:
+    """
+    根据最新一条使用记录返回本次加速开始时间, 已暂停或无法判断时返回 None
+    """
+    if not full_data or not full_data.get('list'):
+        return None
+    latest_record = full_data['list'][0]
+    pause_time = latest_record.get('pause_time')
+    recover_time = latest_record.get('recover_time')
+    if pause_time is not None and pause_time != recover_time:
+        return None
+    return parse_record_time(recover_time)
+
+
+def resumed_since(full_data: Optional[dict], since: float) -> Optional[str]:
+    """
+    since (时间戳) 之后开始的最近一次加速的 recover_time, 没有则返回 None
+    """
+    if not since or not full_data or not full_data.get("list"):
+        return None
+    since_dt = datetime.fromtimestamp(since)
+    for record in full_data["list"]:
+        recover_time = parse_record_time(record.get("recover_time"))
+        if recover_time is not None and recover_time > since_dt:
+            return record.get("recover_time")
+    return None
+
+
+def next_deadline(since: datetime, now: datetime, warning_minutes: float, pause_minutes: float) -> Optional[datetime]:
+    """
+    返回 now 之后最近的一个阈值截止时间 (警告或暂停), 都已过去时返回 None
+    """
+    for minutes in sorted((warning_minutes, pause_minutes)):
+        if minutes == float('inf'):
+            continue
+        deadline = since + timedelta(minutes=minutes)
+        if deadline > now:
+            return deadline
+    return None
+
+
+class AccountStatus(object):
+    """
+    一次检查解析出的账号状态
+    paused: True 暂停, False 加速中, None 无法判断
+    accelerating_since: 加速中时本次加速的开始时间, 未知时为 None; duration_minutes: 本次加速的时长
+    records: 最新的使用记录 (最新的在前), 只探测了状态 (/api/user/info) 时为 None
+    message: 用于页面展示的说明
+    """
+    __slots__ = ("paused", "accelerating_since", "duration_minutes", "message", "records")
+
+    def __init__(self, paused: Optional[bool], accelerating_since: Optional[datetime] = None, duration_minutes: float = 0.0,
+                 message: str = "", records: Optional[List[dict]] = None):
+        self.paused = paused
+        self.accelerating_since = accelerating_since
+        self.duration_minutes = duration_minutes
+        self.message = message
+        self.records = records
+
+    @property
+    def full_data(self) -> Optional[dict]:
+        return {"list": self.records} if self.records is not None else None
+
+
+def _accelerating_status(since: datetime, now: Optional[datetime], records: Optional[List[dict]] = None) -> AccountStatus:
+    duration_minutes = ((now or datetime.now()) - since).total_seconds() / 60
+    return AccountStatus(False, since, duration_minutes, f"当前账号处于未暂停状态，已持续 {duration_minutes:.2f} 分钟。", records)
+
+
+def status_from_records(records: Optional[List[dict]], now: Optional[datetime] = None) -> Optional[AccountStatus]:
+    """
+    根据使用记录 (最新的在前) 解析状态和加速时长, 没有记录时返回 None
+    最新一条没有暂停时间 (或暂停时间等于恢复时间) 为加速中
+    """
+    if not records:
+        return None
+    latest_record = records[0]
+    pause_time = latest_record.get('pause_time')
+    recover_time = latest_record.get('recover_time')
+    if pause_time is not None and pause_time != recover_time:
+        return AccountStatus(True, message="当前账号处于已暂停状态，无需操作。", records=records)
+    if not recover_time:
+        return AccountStatus(None, message="最新记录为恢复状态，但未找到恢复时间。", records=records)
+    since = parse_record_time(recover_time)
+    if since is None:
+        return AccountStatus(False, message="解析恢复时间失败，格式不正确。", records=records)
+    return _accelerating_status(since, now, records)
+
+
+def status_from_probe(paused: bool, since: Optional[datetime], now: Optional[datetime] = None) -> AccountStatus:
+    """
+    只探测了暂停状态时的结果, 加速中时沿用上次从使用记录得到的开始时间 since 计算时长
+    """
+    if paused:
+        return AccountStatus(True, message="当前账号处于已暂停状态，无需操作。")
+    if since is None:
+        return AccountStatus(False, message="当前账号处于未暂停状态。")
+    return _accelerating_status(since, now)
+
+
+def usage_due(previous_paused: Optional[bool], since: Optional[datetime], now: datetime, last_fetched_at: float,
+              settings: Optional[Settings] = None) -> bool:
+    """
+    即使状态没有变化, 本次检查是否也需要请求使用记录:
+    - 上次状态未知或从未请求过: 需要加速开始时间 (计算截止时间和通知去重键) 和最新的记录
+    - 加速中且开始时间未知, 或上次请求后已到阈值截止时间: 需要准确的加速时长,
+      同时确认期间没有暂停后又恢复 (开始时间变化), 避免按旧的开始时间误判
+    - 距上次请求 (last_fetched_at, 时间戳) 超过 refresh_minutes: 发现两次检查之间恢复过又已暂停的加速
+    返回 False 时先探测状态, 与 previous_paused 相同就不会有通知或自动暂停, 不需要请求使用记录
+    """
+    settings = settings or Settings.from_env()
+    if previous_paused is None or not last_fetched_at:
+        return True
+    fetched_at = datetime.fromtimestamp(last_fetched_at)
+    if previous_paused is False:
+        if since is None:
+            return True
+        duration_minutes = (now - since).total_seconds() / 60
+        # 超过暂停阈值时每次都请求 (包括上次自动暂停失败后的重试)
+        if duration_minutes > settings.pause_minutes:
+            return True
+        if duration_minutes > settings.warning_minutes and since + timedelta(minutes=settings.warning_minutes) > fetched_at:
+            return True
+    return (now - fetched_at).total_seconds() >= settings.refresh_minutes * 60
+
+
+def threshold_action(duration_minutes: float, settings: Optional[Settings] = None) -> Optional[str]:
+    """
+    加速时长对应的操作: 超过暂停阈值为 "auto_pause", 超过警告阈值为 "warning", 否则为 None
+    """
+    settings = settings or Settings.from_env()
+    if duration_minutes > settings.pause_minutes:
+        return "auto_pause"
+    if duration_minutes > settings.warning_minutes:
+        return "warning"
+    return None
+
+
+def next_check_time(since: Optional[datetime], now: datetime, allow_immediate: bool = False,
+                    settings: Optional[Settings] = None) -> datetime:
+    """
+    下次检查时间: 加速中 (since 为加速开始时间) 时为下一个阈值截止时间后几秒, 否则按 CHECK_INTERVAL_MINUTES 兜底轮询
+    已超过暂停阈值仍在加速 (自动暂停或检查失败) 时 PAUSE_RETRY_SECONDS 后重试
+    allow_immediate: 已超过警告或暂停阈值时立即检查
+    """
+    settings = settings or Settings.from_env()
+    next_check = now + timedelta(minutes=settings.interval_minutes)
+    if since is None:
+        return next_check
+    warning_minutes, pause_minutes = settings.warning_minutes, settings.pause_minutes
+    first_threshold = min(warning_minutes, pause_minutes)
+    if allow_immediate and first_threshold != float('inf') and since + timedelta(minutes=first_threshold) <= now:
+        return now
+    deadline = next_deadline(since, now, warning_minutes, pause_minutes)
+    if deadline is not None:
+        deadline += timedelta(seconds=settings.margin_seconds)
+        next_check = min(next_check, deadline)
+    if pause_minutes != float('inf') and since + timedelta(minutes=pause_minutes) <= now:
+        next_check = min(next_check, now + timedelta(seconds=settings.retry_seconds))
+    return next_check
+
+
+class Decision(object):
+    """
+    一次检查的判断结果, 由调用方执行: 依次发送 notifications, action 为 "auto_pause" 时暂停
+    网页服务、无界面模式和模拟 (simulate.py) 共用, 保证三者的判断一致
+    """
+
+    def __init__(self, paused: Optional[bool], session_key: str, notifications: List[Tuple[str, str, str]],
+                 action: Optional[str]):
+        # 当前是否暂停, None 为无法判断
+        self.paused = paused
+        # 本次加速的去重键 (加速开始时间)
+        self.session_key = session_key
+        # [(类型, 去重键, 内容)], 类型为 resumed / warning / auto_pause
+        self.notifications = notifications
+        # 加速中时的 threshold_action 结果, 否则为 None
+        self.action = action
+
+
+def decide(previous_paused: Optional[bool], last_checked_at: float, status: AccountStatus,
+           settings: Optional[Settings] = None, previous_since: Optional[datetime] = None) -> Decision:
+    """
+    根据上次已知的状态和本次从使用记录解析出的状态, 判断需要发送的通知和是否自动暂停
+    last_checked_at: 上次请求使用记录的时间戳, 用于发现两次检查之间恢复过又已暂停的加速
+    previous_since: 上次检查时在加速的开始时间, 与本次不同说明期间暂停后又恢复过加速
+    """
+    settings = settings or Settings.from_env()
+    paused = status.paused
+    # 同一次加速 (以开始时间区分) 的恢复/警告/自动暂停通知只发送一次
+    session_key = str(status.accelerating_since)
+    notifications = []
+    if previous_paused is True and paused is False:
+        notifications.append(("resumed", session_key, "检测到状态从暂停变为加速, 请确认是本人操作"))
+    elif previous_paused is True and paused is True:
+        # 上次检查后 (包括服务停止期间) 恢复过加速又已暂停, 当前状态没有变化但仍需提醒
+        resumed_at = resumed_since(status.full_data, last_checked_at)
+        if resumed_at:
+            notifications.append(("resumed", resumed_at, f"检测到账号在 {resumed_at} 曾恢复加速 (现已暂停), 请确认是本人操作"))
+    elif previous_paused is False and paused is not None:
+        # 上次检查时在加速: 期间暂停后又恢复过加速 (开始时间变化, 或上次检查后开始的加速记录)
+        resumed_at = resumed_since(status.full_data, last_checked_at)
+        if (not resumed_at and paused is False and previous_since is not None
+                and status.accelerating_since is not None and status.accelerating_since != previous_since):
+            resumed_at = session_key
+        if resumed_at:
+            notifications.append(("resumed", resumed_at, f"检测到账号在 {resumed_at} 暂停后又恢复加速{' (现已暂停)' if paused else ''}, 请确认是本人操作"))
+    action = threshold_action(status.duration_minutes, settings) if paused is False else None
+    if action == "auto_pause":
+        notifications.append(("auto_pause", session_key, f"账号已加速超过 {settings.pause_minutes} 分钟并尝试自动暂停: {status.message}"))
+    elif action == "warning":
+        notifications.append(("warning", session_key, f"账号已加速超过 {settings.warning_minutes} 分钟: {status.message}"))
+    return Decision(paused, session_key, notifications, action)
@@ -0,0 +1,224 @@
+"""
+请求雷神接口的客户端限流、退避与熔断, 所有账号共用
+"""
+import heapq
+import itertools
+import os
+import random
+import threading
+import time
+
+# 优先级, 数值越小越优先: 暂停请求不会排在页面刷新之后
+HIGH = 0
+NORMAL = 1
+# 后台回填历史记录, 排在检查和页面请求之后
+LOW = 2
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return max(0.0, float(os.getenv(name, default)))
+    except ValueError:
+        return default
+
+
+def get_max_retries() -> int:
+    """
+    单次调用在 403/5xx/超时/网络错误后最多重试的次数, 0 表示不重试
+    """
+    return int(_env_float("LEIGOD_MAX_RETRIES", 2))
+
+
+def backoff_delay(attempt: int, base: float = None, cap: float = None) -> float:
+    """
+    第 attempt 次重试前的等待秒数: 指数退避 + 全抖动
+    """
+    base = _env_float("LEIGOD_RETRY_BASE_SECONDS", 0.5) if base is None else base
+    cap = _env_float("LEIGOD_RETRY_MAX_SECONDS", 8) if cap is None else cap
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class TokenBucket(object):
+    """
+    令牌桶, 每秒补充 rate 个令牌, 最多积攒 burst 个; rate 为 0 时不限流
+    """
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    def take(self, now: float) -> float:
+        """
+        尝试取一个令牌, 成功返回 0, 否则返回还需等待的秒数
+        """
+        if self.rate <= 0:
+            return 0
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+
+class AsyncRateLimiter(object):
+    """
+    asyncio 版本限流器, 等待中的请求按 (优先级, 到达顺序) 取令牌
+    每个等待者只等待自己的 future, 由一个定时回调在令牌补充时按顺序唤醒, 不轮询
+    """
+
+    def __init__(self, rate: float, burst: float):
+        self.bucket = TokenBucket(rate, burst)
+        # [(优先级, 到达顺序, future)] 小顶堆
+        self._waiters = []
+        self._seq = itertools.count()
+        # 下一次补充令牌时唤醒等待者的定时回调
+        self._timer = None
+        self._timer_loop = None
+
+    @classmethod
+    def from_env(cls) -> "AsyncRateLimiter":
+        return cls(_env_float("LEIGOD_RATE_LIMIT", 10), _env_float("LEIGOD_RATE_BURST", 20))
+
+    async def acquire(self, priority: int = NORMAL):
+        # asyncio 只在异步版本中使用, 延迟导入, 无界面模式 (daemon.py) 不需要加载
+        import asyncio
+
+        if self.bucket.rate <= 0:
+            return
+        loop = asyncio.get_running_loop()
+        if not self._waiters and self.bucket.take(time.monotonic()) == 0:
+            return
+        future = loop.create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        if self._timer is None or self._timer_loop is not loop:
+            self._dispatch(loop)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # 已分配到令牌但调用者被取消, 归还令牌
+                self.bucket.tokens = min(self.bucket.burst, self.bucket.tokens + 1)
+            raise
+
+    def _dispatch(self, loop):
+        """
+        按顺序把令牌分给等待者, 令牌不足时只在补充所需的时间后再次执行
+        """
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = None
+        while self._waiters:
+            future = self._waiters[0][2]
+            if future.done() or future.get_loop() is not loop:
+                # 已取消, 或属于已结束的事件循环
+                heapq.heappop(self._waiters)
+                continue
+            wait = self.bucket.take(time.monotonic())
+            if wait > 0:
+                self._timer = loop.call_later(wait, self._dispatch, loop)
+                self._timer_loop = loop
+                return
+            heapq.heappop(self._waiters)
+            future.set_result(None)
+
+
+class RateLimiter(object):
+    """
+    线程版本限流器, 供同步的 legod 使用; 与异步版本相同, 等待中的线程按 (优先级, 到达顺序) 取令牌
+    只有排在最前面的线程按补充令牌所需的时间等待, 其他线程等到轮到自己时才被唤醒
+    """
+
+    def __init__(self, rate: float, burst: float):
+        self.bucket = TokenBucket(rate, burst)
+        self._cond = threading.Condition()
+        # [(优先级, 到达顺序)] 小顶堆
+        self._waiters = []
+        self._seq = itertools.count()
+
+    @classmethod
+    def from_env(cls) -> "RateLimiter":
+        return cls(_env_float("LEIGOD_RATE_LIMIT", 10), _env_float("LEIGOD_RATE_BURST", 20))
+
+    def acquire(self, priority: int = NORMAL):
+        if self.bucket.rate <= 0:
+            return
+        with self._cond:
+            entry = (priority, next(self._seq))
+            heapq.heappush(self._waiters, entry)
+            try:
+                while True:
+                    wait = None
+                    if self._waiters[0] == entry:
+                        wait = self.bucket.take(time.monotonic())
+                        if wait == 0:
+                            return
+                    self._cond.wait(wait)
+            finally:
+                # 取到令牌或等待被中断 (例如 KeyboardInterrupt) 时出队, 唤醒下一个等待者
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+                self._cond.notify_all()
+
+
+class CircuitBreaker(object):
+    """
+    熔断器: 连续 failure_threshold 次可重试的失败 (403/5xx/超时/网络错误) 后打开,
+    reset_seconds 内直接拒绝请求, 之后放行一个探测请求, 成功则恢复
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = 0.0
+        self.state = self.CLOSED
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "CircuitBreaker":
+        return cls(int(_env_float("LEIGOD_BREAKER_FAILURES", 5)), _env_float("LEIGOD_BREAKER_RESET_SECONDS", 60))
+
+    def allow(self, bypass: bool = False) -> bool:
+        """
+        是否允许发出请求; bypass 用于暂停等关键请求, 熔断时也放行
+        """
+        if self.failure_threshold <= 0 or bypass:
+            return True
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            now = time.monotonic()
+            expired = now - self.opened_at >= self.reset_seconds
+            if self.state == self.OPEN and expired:
+                self.state = self.HALF_OPEN
+                self._probing = False
+            # 探测请求被取消而没有结果时, 超时后允许再次探测
+            if self.state == self.HALF_OPEN and (not self._probing or expired):
+                self._probing = True
+                self.opened_at = now
+                return True
+            return False
+
+    def retry_after(self) -> float:
+        return max(0.0, self.reset_seconds - (time.monotonic() - self.opened_at))
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.state = self.CLOSED
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or (self.failure_threshold > 0 and self.failures >= self.failure_threshold):
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                self._probing = False
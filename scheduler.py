@@ -0,0 +1,85 @@
+"""
+定时检查调度器: 由 lifespan 启动的唯一一个长期运行的 asyncio 任务, 不为每次检查创建线程或定时器
+- 睡眠到最早的检查时间 (加随机抖动, 避免多个副本或多次重启在同一时刻集中请求), 可被 wake() 提前唤醒重新计算
+- 一轮检查结束后才计算下一次等待时间, 同一时间只有一轮检查在运行
+- stop() 取消调度任务 (包括进行中的一轮检查) 并等待其结束, 关闭顺序确定
+请求处理函数只修改检查时间并调用 wake(), 从不直接执行检查
+"""
+import asyncio
+import logging
+import random
+from typing import Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class CheckScheduler(object):
+
+    def __init__(self, run_due: Callable[[], Awaitable], next_delay: Callable[[], Optional[float]],
+                 jitter_seconds: float = 0.0, min_interval: float = 1.0):
+        # 执行一轮检查 (检查所有到期账号)
+        self.run_due = run_due
+        # 距下一次检查的秒数, None 表示暂时没有需要检查的账号, 等待 wake()
+        self.next_delay = next_delay
+        self.jitter_seconds = jitter_seconds
+        # 两轮检查之间的最短间隔, 避免检查时间未能推后时空转 (wake() 不受限制)
+        self.min_interval = min_interval
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        if self.running:
+            return
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.get_running_loop().create_task(self._loop(), name="check-scheduler")
+
+    def wake(self):
+        """
+        检查时间或可检查的账号有变化时调用, 调度任务立即重新计算等待时间; 不会直接执行检查
+        """
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def stop(self):
+        """
+        取消调度任务并等待结束
+        """
+        task, self._task = self._task, None
+        if task is None:
+            return
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    async def _sleep(self, delay: Optional[float]) -> bool:
+        """
+        睡眠 delay 秒 (None 为一直等待), 返回是否被 wake() 提前唤醒
+        """
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), delay)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def _loop(self):
+        cooldown = 0.0
+        while True:
+            self._wakeup.clear()
+            delay = self.next_delay()
+            if delay is not None and delay > 0:
+                delay += random.uniform(0, self.jitter_seconds)
+            if delay is None or delay > 0 or cooldown > 0:
+                if await self._sleep(None if delay is None else max(delay, cooldown)):
+                    cooldown = 0.0
+                    continue
+            try:
+                await self.run_due()
+            except Exception as e:
+                logger.error(f"定时检查异常: {e}")
+            cooldown = self.min_interval
@@ -0,0 +1,351 @@
+"""
+策略模拟: 用虚拟时钟回放真实或合成的加速时间线, 每次"检查"的请求方式和判断与网页服务的定时检查完全相同
+(policy.usage_due + policy.status_from_records + policy.decide + policy.next_check_time), 不访问接口,
+用于比较不同阈值、检查间隔和使用记录刷新间隔的效果
+
+用法:
+    python simulate.py --accounts 200 --days 90 --policy 1440:1440:60 --policy 720:1440:30
+    python simulate.py --replay leigod-usage-main.ndjson --policy 360:720:60   # 回放 /export 导出的记录 (csv 或 ndjson)
+    python simulate.py --db data/leigod.db --policy 360:720:60                 # 回放本地库中所有账号的记录
+    python simulate.py ... --error-rate 0.05 --output report.json            # 模拟 5% 的接口失败, 保存 JSON 报告
+
+策略格式为 "警告阈值:暂停阈值:检查间隔[:使用记录刷新间隔]", 单位分钟, 阈值为 inf 时不触发,
+刷新间隔省略时读取 USAGE_REFRESH_MINUTES; 未指定 --policy 时使用环境变量中的当前配置
+每个策略的报告:
+- api_calls: 请求接口次数, 其中 probes 为状态探测, usage_fetches 为请求使用明细, 另外每次自动暂停一次
+- pauses: 自动暂停次数; notifications: 各类通知条数 (已按去重键去重)
+- accelerated_hours: 自动暂停后的实际加速总时长
+- hours_over_warning / hours_over_pause: 超过警告/暂停阈值后仍在加速的总时长
+- max_overrun_minutes: 单次加速超过暂停阈值的最长时间
+回放真实记录时, 记录中的暂停时间视为用户的操作 (其中可能已包含当时自动暂停的结果);
+最后一条未暂停的记录视为一直加速到回放结束 (最后一条记录后 1 天)
+"""
+import argparse
+import bisect
+import csv
+import json
+import math
+import os
+import random
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+
+import policy
+
+DEFAULT_START = datetime(2025, 1, 1)
+RECENT_RECORD_COUNT = 5
+
+
+class Timeline(object):
+    """
+    一个账号的加速时间线: sessions 为按开始时间排序的 (开始, 结束), 结束为 None 表示一直未暂停
+    """
+
+    def __init__(self, name: str, sessions: List[Tuple[datetime, Optional[datetime]]]):
+        self.name = name
+        self.sessions = sessions
+
+
+def synthetic_timeline(name: str, start: datetime, days: float, rng: random.Random, forget_rate: float) -> Timeline:
+    """
+    合成时间线: 每次加速时长服从对数正态分布 (中位数 2 小时), 间隔平均 14 小时,
+    其中 forget_rate 比例的加速忘记暂停, 持续 12~72 小时
+    """
+    end = start + timedelta(days=days)
+    sessions = []
+    current = start + timedelta(minutes=rng.uniform(0, 24 * 60))
+    while current < end:
+        if rng.random() < forget_rate:
+            minutes = rng.uniform(12 * 60, 72 * 60)
+        else:
+            minutes = min(rng.lognormvariate(math.log(120), 0.8), 16 * 60)
+        current = current.replace(microsecond=0)
+        session_end = (current + timedelta(minutes=minutes)).replace(microsecond=0)
+        sessions.append((current, session_end))
+        current = session_end + timedelta(minutes=rng.expovariate(1 / (14 * 60)))
+    return Timeline(name, sessions)
+
+
+def timeline_from_records(name: str, records) -> Timeline:
+    """
+    由使用记录 (recover_time / pause_time) 生成时间线, 重叠的记录截断到下一次开始
+    """
+    sessions = []
+    for record in records:
+        started = policy.parse_record_time(record.get("recover_time"))
+        if started is None:
+            continue
+        ended = policy.parse_record_time(record.get("pause_time"))
+        if ended is not None and ended < started:
+            continue
+        sessions.append((started, ended))
+    sessions.sort(key=lambda session: session[0])
+    for index in range(len(sessions) - 1):
+        started, ended = sessions[index]
+        next_start = sessions[index + 1][0]
+        if ended is None or ended > next_start:
+            sessions[index] = (started, next_start)
+    return Timeline(name, sessions)
+
+
+def load_export(path: str) -> Timeline:
+    """
+    读取 /export 导出的 csv 或 ndjson 文件, 账号名为文件名 (去掉 leigod-usage- 前缀和扩展名)
+    """
+    name = os.path.splitext(os.path.basename(path))[0]
+    if name.startswith("leigod-usage-"):
+        name = name[len("leigod-usage-"):]
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        if path.endswith(".csv"):
+            records = [{key: value or None for key, value in row.items()} for row in csv.DictReader(f)]
+        else:
+            records = [json.loads(line) for line in f if line.strip()]
+    return timeline_from_records(name, records)
+
+
+def load_db(path: str) -> List[Timeline]:
+    import store as usage_store
+
+    db = usage_store.UsageStore(path)
+    try:
+        return [timeline_from_records(account, db.iter_records(account)) for account in db.accounts()]
+    finally:
+        db.close()
+
+
+def replay_window(timelines: List[Timeline]) -> Tuple[datetime, datetime]:
+    times = [moment for timeline in timelines for session in timeline.sessions for moment in session if moment is not None]
+    if not times:
+        raise SystemExit("没有可回放的使用记录")
+    return min(times), max(times) + timedelta(days=1)
+
+
+def parse_policy(text: str, margin_seconds: float) -> policy.Settings:
+    """
+    "警告阈值:暂停阈值:检查间隔[:使用记录刷新间隔]" (分钟), 阈值为 inf 时不触发
+    """
+    parts = text.split(":")
+    if len(parts) not in (3, 4):
+        raise SystemExit(f"策略格式应为 警告阈值:暂停阈值:检查间隔[:使用记录刷新间隔], 实际为: {text}")
+    try:
+        values = [float(part) for part in parts]
+    except ValueError:
+        raise SystemExit(f"策略中的数值无效: {text}")
+    warning, pause, interval = values[:3]
+    refresh = values[3] if len(values) == 4 else policy.get_usage_refresh_minutes()
+    if not 0 < interval < float('inf'):
+        raise SystemExit(f"检查间隔必须大于 0: {text}")
+    return policy.Settings(warning, pause, interval, margin_seconds, max(0.0, refresh), policy.get_pause_retry_seconds())
+
+
+def policy_label(settings: policy.Settings) -> str:
+    return f"{settings.warning_minutes:g}:{settings.pause_minutes:g}:{settings.interval_minutes:g}:{settings.refresh_minutes:g}"
+
+
+def _format(moment: Optional[datetime]) -> Optional[str]:
+    return moment.strftime(policy.RECORD_TIME_FORMAT) if moment is not None else None
+
+
+def simulate_account(timeline: Timeline, settings: policy.Settings, start: datetime, end: datetime,
+                     rng: random.Random, error_rate: float = 0.0) -> Tuple[Counter, float]:
+    """
+    在虚拟时钟上运行一个账号的检查, 返回 (计数, 单次加速超过暂停阈值的最长分钟数)
+    自动暂停会把当前这次加速截断在暂停时刻, 之后的加速仍按原时间线开始
+    """
+    starts = [session[0] for session in timeline.sessions]
+    ends = [session[1] for session in timeline.sessions]
+    recover_times = [_format(moment) for moment in starts]
+    totals = Counter()
+    paused: Optional[bool] = None
+    last_checked_at = 0.0
+    notified = set()
+
+    since: Optional[datetime] = None
+    now = start
+    while now < end:
+        totals["checks"] += 1
+        latest = bisect.bisect_right(starts, now) - 1
+        status = None
+        # 与 main.fetch_account_status 相同: 不需要使用记录时先探测状态, 状态不变就只用探测结果
+        if not policy.usage_due(paused, since, now, last_checked_at, settings):
+            totals["api_calls"] += 1
+            totals["probes"] += 1
+            if error_rate and rng.random() < error_rate:
+                totals["api_errors"] += 1
+            else:
+                probed = latest < 0 or (ends[latest] is not None and ends[latest] <= now)
+                if probed == paused:
+                    status = policy.status_from_probe(probed, since, now)
+        if status is None:
+            totals["api_calls"] += 1
+            totals["usage_fetches"] += 1
+            if error_rate and rng.random() < error_rate:
+                totals["api_errors"] += 1
+            else:
+                records = []
+                for index in range(latest, max(latest - RECENT_RECORD_COUNT, -1), -1):
+                    ended = ends[index] if ends[index] is not None and ends[index] <= now else None
+                    records.append({"recover_time": recover_times[index], "pause_time": _format(ended)})
+                status = policy.status_from_records(records, now)
+                if status is not None:
+                    decision = policy.decide(paused, last_checked_at, status, settings, previous_since=since)
+                    for kind, dedup_key, _ in decision.notifications:
+                        if (kind, dedup_key) not in notified:
+                            notified.add((kind, dedup_key))
+                            totals[f"notifications.{kind}"] += 1
+                    if decision.paused is not None:
+                        paused = decision.paused
+                    last_checked_at = now.timestamp()
+                    if decision.action == "auto_pause":
+                        totals["api_calls"] += 1
+                        if error_rate and rng.random() < error_rate:
+                            totals["api_errors"] += 1
+                        else:
+                            totals["pauses"] += 1
+                            ends[latest] = now
+                            paused = True
+                    since = status.accelerating_since if paused is False else None
+        # 请求或自动暂停失败时与网页服务相同: 沿用已知的加速开始时间, 超过暂停阈值时按 retry_seconds 重试
+        now = policy.next_check_time(since, now, settings=settings)
+
+    max_overrun = 0.0
+    for started, ended in zip(starts, ends):
+        if started >= end:
+            break
+        minutes = ((min(ended, end) if ended is not None else end) - started).total_seconds() / 60
+        totals["sessions"] += 1
+        totals["accelerated_minutes"] += minutes
+        totals["minutes_over_warning"] += max(0.0, minutes - settings.warning_minutes)
+        overrun = max(0.0, minutes - settings.pause_minutes)
+        totals["minutes_over_pause"] += overrun
+        max_overrun = max(max_overrun, overrun)
+    return totals, max_overrun
+
+
+def _run_chunk(task: tuple) -> Tuple[int, Counter, float]:
+    policy_index, settings, timelines, start, end, error_rate, seed = task
+    totals = Counter()
+    max_overrun = 0.0
+    for timeline in timelines:
+        # 每个账号单独的随机序列, 结果与分块方式和并行数无关
+        rng = random.Random(f"{seed}:{timeline.name}")
+        account_totals, account_overrun = simulate_account(timeline, settings, start, end, rng, error_rate)
+        totals.update(account_totals)
+        max_overrun = max(max_overrun, account_overrun)
+    return policy_index, totals, max_overrun
+
+
+def simulate(timelines: List[Timeline], policies: List[policy.Settings], start: datetime, end: datetime,
+             jobs: int = 1, error_rate: float = 0.0, seed: int = 0) -> List[dict]:
+    """
+    对每个策略运行所有账号, jobs > 1 时按 (策略, 账号分块) 在多个进程中并行
+    """
+    chunk_count = max(1, min(len(timelines), jobs * 4))
+    chunks = [timelines[index::chunk_count] for index in range(chunk_count)]
+    tasks = [(index, settings, chunk, start, end, error_rate, seed)
+             for index, settings in enumerate(policies) for chunk in chunks if chunk]
+    if jobs > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            results = list(executor.map(_run_chunk, tasks))
+    else:
+        results = [_run_chunk(task) for task in tasks]
+
+    merged = [(Counter(), 0.0) for _ in policies]
+    for policy_index, totals, max_overrun in results:
+        merged_totals, merged_overrun = merged[policy_index]
+        merged_totals.update(totals)
+        merged[policy_index] = (merged_totals, max(merged_overrun, max_overrun))
+
+    account_days = len(timelines) * (end - start).total_seconds() / 86400
+    report = []
+    for settings, (totals, max_overrun) in zip(policies, merged):
+        report.append({
+            "policy": policy_label(settings),
+            "accounts": len(timelines),
+            "days": round((end - start).total_seconds() / 86400, 2),
+            "sessions": totals["sessions"],
+            "checks": totals["checks"],
+            "api_calls": totals["api_calls"],
+            "api_calls_per_account_day": round(totals["api_calls"] / account_days, 2) if account_days else 0,
+            "probes": totals["probes"],
+            "usage_fetches": totals["usage_fetches"],
+            "api_errors": totals["api_errors"],
+            "pauses": totals["pauses"],
+            "notifications": {kind: totals[f"notifications.{kind}"] for kind in ("resumed", "warning", "auto_pause")},
+            "accelerated_hours": round(totals["accelerated_minutes"] / 60, 2),
+            "hours_over_warning": round(totals["minutes_over_warning"] / 60, 2),
+            "hours_over_pause": round(totals["minutes_over_pause"] / 60, 2),
+            "max_overrun_minutes": round(max_overrun, 2),
+        })
+    return report
+
+
+def format_report(report: List[dict]) -> str:
+    columns = [
+        ("策略", lambda row: row["policy"]),
+        ("接口调用", lambda row: row["api_calls"]),
+        ("每账号每天", lambda row: row["api_calls_per_account_day"]),
+        ("探测", lambda row: row["probes"]),
+        ("使用明细", lambda row: row["usage_fetches"]),
+        ("暂停", lambda row: row["pauses"]),
+        ("警告", lambda row: row["notifications"]["warning"]),
+        ("暂停通知", lambda row: row["notifications"]["auto_pause"]),
+        ("恢复通知", lambda row: row["notifications"]["resumed"]),
+        ("加速小时", lambda row: row["accelerated_hours"]),
+        ("超警告小时", lambda row: row["hours_over_warning"]),
+        ("超暂停小时", lambda row: row["hours_over_pause"]),
+        ("最长超时分钟", lambda row: row["max_overrun_minutes"]),
+    ]
+    rows = [[header for header, _ in columns]] + [[str(getter(row)) for _, getter in columns] for row in report]
+    widths = [max(len(row[index]) for row in rows) for index in range(len(columns))]
+    return "\n".join("  ".join(cell.rjust(width) for cell, width in zip(row, widths)) for row in rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="用虚拟时钟模拟不同阈值和检查间隔的效果")
+    parser.add_argument("--policy", action="append", default=[], help="警告阈值:暂停阈值:检查间隔[:使用记录刷新间隔] (分钟), 可重复")
+    parser.add_argument("--margin", type=float, default=None, help="截止时间后多等待的秒数, 默认读取 DEADLINE_MARGIN_SECONDS")
+    parser.add_argument("--replay", nargs="+", default=[], help="回放 /export 导出的 csv / ndjson 文件")
+    parser.add_argument("--db", help="回放本地库 (HISTORY_DB_PATH) 中所有账号的记录")
+    parser.add_argument("--accounts", type=int, default=100, help="合成时间线的账号数")
+    parser.add_argument("--days", type=float, default=30, help="合成时间线的天数")
+    parser.add_argument("--forget-rate", type=float, default=0.05, help="合成时间线中忘记暂停的加速比例")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="接口请求 (探测、使用记录、自动暂停) 失败的概率")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="并行进程数")
+    parser.add_argument("--output", help="保存 JSON 报告的路径")
+    args = parser.parse_args()
+
+    margin = policy.get_deadline_margin_seconds() if args.margin is None else max(0.0, args.margin)
+    if args.policy:
+        policies = [parse_policy(text, margin) for text in args.policy]
+    else:
+        settings = policy.Settings.from_env()
+        settings.margin_seconds = margin
+        policies = [settings]
+
+    if args.replay or args.db:
+        timelines = [load_export(path) for path in args.replay] + (load_db(args.db) if args.db else [])
+        start, end = replay_window(timelines)
+    else:
+        rng = random.Random(args.seed)
+        start, end = DEFAULT_START, DEFAULT_START + timedelta(days=args.days)
+        timelines = [synthetic_timeline(f"sim-{index}", start, args.days, rng, args.forget_rate) for index in range(args.accounts)]
+
+    started = time.perf_counter()
+    report = simulate(timelines, policies, start, end, jobs=max(1, args.jobs), error_rate=args.error_rate, seed=args.seed)
+    elapsed = time.perf_counter() - started
+    print(format_report(report))
+    print(f"\n{len(timelines)} 个账号 x {len(policies)} 个策略, "
+          f"{start.strftime('%Y-%m-%d')} ~ {end.strftime('%Y-%m-%d')}, 耗时 {elapsed:.2f} 秒", file=sys.stderr)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+import threading
+from collections import defaultdict
+from typing import TYPE_CHECKING, Any, Callable, Dict, Hashable, Tuple
+
+if TYPE_CHECKING:
+    import asyncio
+
+
+class _Call(object):
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class _Stats(object):
+    def __init__(self):
+        # {名称: {"calls": 实际发出的请求数, "deduplicated": 被合并的请求数}}
+        self.counters: Dict[str, Dict[str, int]] = defaultdict(lambda: {"calls": 0, "deduplicated": 0})
+
+    def snapshot(self) -> Dict[str, Dict[str, int]]:
+        return {name: dict(counter) for name, counter in self.counters.items()}
+
+
+class SingleFlight(_Stats):
+    """
+    合并相同 key 的并发调用 (线程版本): 同一时间只有第一个调用者真正执行, 其余调用者等待并共享结果
+    do 返回 (结果, 是否为真正执行的调用者)
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+
+    def do(self, name: str, key: Hashable, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.counters[name]["deduplicated"] += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self.counters[name]["calls"] += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, False
+
+        try:
+            call.result = fn()
+            return call.result, True
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+
+class _LeaderCancelled(Exception):
+    """
+    真正执行的调用者被取消, 等待者重新竞争执行, 不把取消传给没有被取消的等待者
+    """
+
+
+class AsyncSingleFlight(_Stats):
+    """
+    合并相同 key 的并发调用 (asyncio 版本), 用法同 SingleFlight
+    执行的调用者被取消时, 由仍在等待的调用者之一重新执行
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._calls: Dict[Hashable, "asyncio.Future"] = {}
+
+    async def do(self, name: str, key: Hashable, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        # asyncio 只在异步版本中使用, 延迟导入, 无界面模式 (daemon.py) 不需要加载
+        import asyncio
+
+        while True:
+            future = self._calls.get(key)
+            if future is None:
+                break
+            self.counters[name]["deduplicated"] += 1
+            try:
+                # shield: 等待者被取消时不影响正在执行的调用
+                return await asyncio.shield(future), False
+            except _LeaderCancelled:
+                continue
+
+        future = asyncio.get_running_loop().create_future()
+        # 没有等待者时也标记异常已读取, 避免 "exception was never retrieved" 警告
+        future.add_done_callback(lambda f: f.exception())
+        self._calls[key] = future
+        self.counters[name]["calls"] += 1
+        try:
+            result = await fn()
+            future.set_result(result)
+            return result, True
+        except asyncio.CancelledError:
+            future.set_exception(_LeaderCancelled())
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            del self._calls[key]
@@ -0,0 +1,344 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS usage_records (
+    account TEXT NOT NULL,
+    recover_time TEXT NOT NULL,
+    pause_time TEXT,
+    reduce_pause_time INTEGER,
+    raw TEXT NOT NULL,
+    PRIMARY KEY (account, recover_time)
+);
+CREATE TABLE IF NOT EXISTS account_state (
+    account TEXT PRIMARY KEY,
+    state TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sync_state (
+    account TEXT PRIMARY KEY,
+    backfill_complete INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS account_commands (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    account TEXT NOT NULL,
+    action TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS notification_log (
+    account TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    dedup_key TEXT NOT NULL,
+    sent_at REAL NOT NULL,
+    PRIMARY KEY (account, kind, dedup_key)
+);
+"""
+
+
+# 首次回填每页的记录数, 增量同步每页 5 条
+BACKFILL_PAGE_SIZE = 50
+
+
+def get_history_db_path() -> str:
+    return os.getenv("HISTORY_DB_PATH", os.path.join("data", "leigod.db"))
+
+
+class UsageStore(object):
+    """
+    本地 SQLite 使用记录库, 按账号保存 /api/user/time/log 的全部记录
+    主键 (account, recover_time) 同时作为按账号+时间范围查询的索引,
+    时间以 "%Y-%m-%d %H:%M:%S" 字符串保存, 字典序即时间顺序
+    同时保存账号状态和已入队通知的去重记录, 重启后恢复; 每次写入都是一个事务, 进程崩溃不会留下写了一半的状态
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path or get_history_db_path()
+        if self.path != ":memory:":
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        if self.path != ":memory:":
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        # 记录写入后的回调 (account, records), 在锁外调用, 用于维护统计汇总等派生数据
+        self.listeners: List[Callable[[str, List[dict]], None]] = []
+
+    @contextmanager
+    def transaction(self):
+        """
+        在锁内以事务方式使用连接, 供其他模块 (例如 analytics) 读写自己的表
+        """
+        with self._lock, self._conn:
+            yield self._conn
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def high_water_mark(self, account: str) -> Optional[str]:
+        """
+        已保存的最新一条记录的 recover_time
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT MAX(recover_time) FROM usage_records WHERE account = ?", (account,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def low_water_mark(self, account: str) -> Optional[str]:
+        """
+        已保存的最早一条记录的 recover_time
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT MIN(recover_time) FROM usage_records WHERE account = ?", (account,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def record_count(self, account: str) -> int:
+        with self._lock:
+            row = self._conn.execute("SELECT COUNT(*) FROM usage_records WHERE account = ?", (account,)).fetchone()
+        return row[0]
+
+    def backfill_complete(self, account: str) -> bool:
+        """
+        首次回填是否已翻到最后一页; 未完成时 (失败或达到页数上限) 下次同步继续回填更早的记录
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT backfill_complete FROM sync_state WHERE account = ?", (account,)).fetchone()
+        return bool(row and row[0])
+
+    def mark_backfill_complete(self, account: str):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO sync_state (account, backfill_complete) VALUES (?, 1) "
+                "ON CONFLICT (account) DO UPDATE SET backfill_complete = 1",
+                (account,),
+            )
+
+    def upsert_records(self, account: str, records: List[dict]) -> int:
+        """
+        写入记录, 已存在的记录 (例如加速中的记录之后补上了 pause_time) 会被更新
+        """
+        rows = [
+            (
+                account,
+                record["recover_time"],
+                record.get("pause_time"),
+                record.get("reduce_pause_time"),
+                json.dumps(record, ensure_ascii=False),
+            )
+            for record in records
+            if record.get("recover_time")
+        ]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO usage_records (account, recover_time, pause_time, reduce_pause_time, raw) "
+                "VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (account, recover_time) DO UPDATE SET "
+                "pause_time = excluded.pause_time, reduce_pause_time = excluded.reduce_pause_time, raw = excluded.raw",
+                rows,
+            )
+        if rows:
+            for listener in self.listeners:
+                listener(account, records)
+        return len(rows)
+
+    def recent_records(self, account: str, limit: int = 5) -> List[dict]:
+        """
+        最新的 limit 条记录 (最新的在前)
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT raw FROM usage_records WHERE account = ? ORDER BY recover_time DESC LIMIT ?",
+                (account, limit),
+            ).fetchall()
+        return [json.loads(row["raw"]) for row in rows]
+
+    def iter_records(self, account: str, start: str = None, end: str = None, batch_size: int = 500) -> Iterator[dict]:
+        """
+        按时间顺序分批读取 [start, end) 范围内的记录, 内存占用与总记录数无关
+        """
+        last = None
+        while True:
+            conditions = ["account = ?"]
+            params: list = [account]
+            if start:
+                conditions.append("recover_time >= ?")
+                params.append(start)
+            if end:
+                conditions.append("recover_time < ?")
+                params.append(end)
+            if last is not None:
+                conditions.append("recover_time > ?")
+                params.append(last)
+            params.append(batch_size)
+            with self._lock:
+                rows = self._conn.execute(
+                    f"SELECT recover_time, raw FROM usage_records WHERE {' AND '.join(conditions)} "
+                    "ORDER BY recover_time LIMIT ?",
+                    params,
+                ).fetchall()
+            for row in rows:
+                yield json.loads(row["raw"])
+            if len(rows) < batch_size:
+                return
+            last = rows[-1]["recover_time"]
+
+    def accounts(self) -> List[str]:
+        """
+        有使用记录的所有账号
+        """
+        with self._lock:
+            rows = self._conn.execute("SELECT DISTINCT account FROM usage_records ORDER BY account").fetchall()
+        return [row["account"] for row in rows]
+
+
+    def save_account_state(self, account: str, state: dict, updated_at: float):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO account_state (account, state, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (account) DO UPDATE SET state = excluded.state, updated_at = excluded.updated_at",
+                (account, json.dumps(state, ensure_ascii=False), updated_at),
+            )
+
+    def load_account_states(self, accounts: List[str] = None) -> Dict[str, tuple]:
+        """
+        {账号: (状态, 保存时间)}, accounts 为空时返回全部账号
+        """
+        with self._lock:
+            rows = self._conn.execute("SELECT account, state, updated_at FROM account_state ORDER BY rowid").fetchall()
+        return {
+            row["account"]: (json.loads(row["state"]), row["updated_at"])
+            for row in rows if accounts is None or row["account"] in accounts
+        }
+
+    def account_state_versions(self) -> Dict[str, float]:
+        """
+        {账号: 保存时间}, 用于多进程部署时发现其他进程保存的修改
+        """
+        with self._lock:
+            rows = self._conn.execute("SELECT account, updated_at FROM account_state").fetchall()
+        return {row["account"]: row["updated_at"] for row in rows}
+
+    def delete_account_state(self, account: str):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM account_state WHERE account = ?", (account,))
+            self._conn.execute("DELETE FROM notification_log WHERE account = ?", (account,))
+
+    def enqueue_command(self, account: str, action: str, payload: dict, created_at: float):
+        """
+        多进程部署时非主节点提交的操作 (更新 Token、暂停), 由主节点取出执行
+        """
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO account_commands (account, action, payload, created_at) VALUES (?, ?, ?, ?)",
+                (account, action, json.dumps(payload, ensure_ascii=False), created_at),
+            )
+
+    def take_commands(self) -> List[tuple]:
+        """
+        按提交顺序取出并删除所有待执行的操作 [(账号, 操作, 参数)]
+        """
+        with self._lock, self._conn:
+            rows = self._conn.execute("SELECT id, account, action, payload FROM account_commands ORDER BY id").fetchall()
+            if rows:
+                self._conn.execute("DELETE FROM account_commands WHERE id <= ?", (rows[-1]["id"],))
+        return [(row["account"], row["action"], json.loads(row["payload"])) for row in rows]
+
+    def record_notification(self, account: str, kind: str, dedup_key: str, sent_at: float):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO notification_log (account, kind, dedup_key, sent_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (account, kind, dedup_key) DO UPDATE SET sent_at = excluded.sent_at",
+                (account, kind, dedup_key, sent_at),
+            )
+
+    def recent_notifications(self, since: float) -> List[tuple]:
+        """
+        since 之后入队的通知 [(账号, 类型, dedup_key, 入队时间)], 同时清理更早的记录
+        """
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM notification_log WHERE sent_at < ?", (since,))
+            rows = self._conn.execute("SELECT account, kind, dedup_key, sent_at FROM notification_log").fetchall()
+        return [tuple(row) for row in rows]
+
+
+async def sync_recent_usage(store: UsageStore, client, account: str, max_pages: int = 100) -> tuple:
+    """
+    从高水位开始增量同步账号最新的使用记录, 检查和页面请求中调用:
+    从第一页往后翻, 直到遇到比库中最新记录更早的记录为止 (最新那条会重新写入以更新暂停时间), 通常只请求第一页
+    库中还没有记录时只请求第一页, 更早的记录由 backfill_usage_history 在后台回填
+    client 为 aiolegod 实例, 返回 (bool, message, 本次写入的记录数)
+    """
+    high_water_mark = store.high_water_mark(account)
+    # 回填完成后每页 5 条; 未完成时使用大页, 第一页同时作为回填的开始
+    size = 5 if high_water_mark is not None and store.backfill_complete(account) else BACKFILL_PAGE_SIZE
+    written = 0
+    for page in range(1, max_pages + 1):
+        success, message, records = await client.get_usage_page(page, size)
+        if not success:
+            return False, message, written
+        written += store.upsert_records(account, records)
+        if len(records) < size:
+            # 已翻到最后一页, 没有更早的记录
+            store.mark_backfill_complete(account)
+            break
+        if not high_water_mark or any((record.get("recover_time") or "") < high_water_mark for record in records):
+            break
+    return True, "", written
+
+
+async def backfill_usage_history(store: UsageStore, client, account: str, max_pages: int = 100,
+                                 background: bool = False, interval: float = 0.0) -> tuple:
+    """
+    回填更早的使用记录, 直到翻到最后一页; 中途失败或达到 max_pages 时, 下次从已保存的最早记录所在的页继续
+    background 为 True 时以低优先级请求 (不与检查、暂停和页面请求争抢限流配额), 每页之间等待 interval 秒
+    返回 (bool, message, 本次写入的记录数)
+    """
+    if store.backfill_complete(account):
+        return True, "", 0
+    # 库中的记录是最新的连续一段, 从其中最早一条所在的页 (多留一页余量) 继续往后翻
+    size = BACKFILL_PAGE_SIZE
+    low_water_mark = store.low_water_mark(account)
+    page = max(1, store.record_count(account) // size)
+    resumed = low_water_mark is not None
+    written = 0
+    for pages in range(max_pages):
+        if pages and interval:
+            await asyncio.sleep(interval)
+        success, message, records = await client.get_usage_page(page, size, background=background)
+        if not success:
+            return False, message, written
+        if resumed and page > 1 and records and (records[0].get("recover_time") or "") < low_water_mark:
+            # 与已保存的记录之间有缺口 (例如期间新增了多条记录), 往前退一页
+            page -= 1
+            continue
+        resumed = False
+        written += store.upsert_records(account, records)
+        if len(records) < size:
+            store.mark_backfill_complete(account)
+            break
+        page += 1
+    return True, "", written
+
+
+async def sync_usage_history(store: UsageStore, client, account: str, max_pages: int = 100) -> tuple:
+    """
+    增量同步最新的记录后, 在同一次调用中回填更早的记录 (合计最多 max_pages 页), 用于导出等需要完整记录的场景
+    返回 (bool, message, 本次写入的记录数)
+    """
+    success, message, written = await sync_recent_usage(store, client, account, max_pages)
+    if not success:
+        return False, message, written
+    success, message, backfilled = await backfill_usage_history(store, client, account, max_pages)
+    return success, message, written + backfilled
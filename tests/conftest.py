@@ -0,0 +1,126 @@
+"""
+测试共用的雷神接口模拟 (httpx.MockTransport), 不发出真实请求
+"""
+import asyncio
+import json
+import os
+import sys
+from collections import Counter
+from datetime import datetime, timedelta
+from urllib.parse import parse_qs
+
+import httpx
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import aiolegod
+import ratelimit
+import singleflight
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+class FakeLeigod(object):
+    """
+    按 token 保存账号状态的模拟接口, 记录每个接口被请求的次数
+    token 以 "expired" 开头时所有接口返回 400006; pause_code 不为 0 时暂停接口返回该错误码
+    """
+
+    def __init__(self, latency: float = 0.0, accelerating_minutes: float = 60, history_size: int = 3):
+        self.latency = latency
+        self.accelerating_minutes = accelerating_minutes
+        self.history_size = history_size
+        self.pause_code = 0
+        self.calls = Counter()
+        # 同时处理中的请求数及其最大值
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.accounts = {}
+
+    def records(self, token: str) -> list:
+        if token not in self.accounts:
+            started = datetime.now() - timedelta(minutes=self.accelerating_minutes)
+            records = [{"recover_time": started.strftime(TIME_FORMAT), "pause_time": None, "reduce_pause_time": 0}]
+            for index in range(1, self.history_size):
+                recover_time = started - timedelta(days=index)
+                pause_time = recover_time + timedelta(hours=1)
+                records.append({
+                    "recover_time": recover_time.strftime(TIME_FORMAT),
+                    "pause_time": pause_time.strftime(TIME_FORMAT),
+                    "reduce_pause_time": 3600,
+                })
+            self.accounts[token] = records
+        return self.accounts[token]
+
+    def paused(self, token: str) -> bool:
+        return self.records(token)[0]["pause_time"] is not None
+
+    async def handler(self, request: httpx.Request) -> httpx.Response:
+        endpoint = request.url.path.rsplit("/", 1)[-1]
+        self.calls[endpoint] += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            if self.latency:
+                await asyncio.sleep(self.latency)
+        finally:
+            self.in_flight -= 1
+        form = {key: values[0] for key, values in parse_qs(request.content.decode()).items()}
+        token = form.get("account_token", "")
+        if token.startswith("expired"):
+            return self.json({"code": 400006, "msg": "登录已失效"})
+        if endpoint == "info":
+            paused = self.paused(token)
+            return self.json({"code": 0, "msg": "ok", "data": {
+                "nickname": f"nick-{token[:4]}",
+                "pause_status_id": 1 if paused else 0,
+                "pause_status": "已暂停" if paused else "加速中",
+            }})
+        if endpoint == "pause":
+            if self.pause_code:
+                return self.json({"code": self.pause_code, "msg": "登录已失效"})
+            latest = self.records(token)[0]
+            if latest["pause_time"] is None:
+                latest["pause_time"] = datetime.now().strftime(TIME_FORMAT)
+            return self.json({"code": 0, "msg": "暂停成功"})
+        page, size = int(form.get("page", 1)), int(form.get("size", 5))
+        records = self.records(token)[(page - 1) * size:page * size]
+        return self.json({"code": 0, "msg": "ok", "data": {"list": [dict(record) for record in records]}})
+
+    @staticmethod
+    def json(payload: dict) -> httpx.Response:
+        return httpx.Response(200, text=json.dumps(payload, ensure_ascii=False))
+
+    def client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(transport=httpx.MockTransport(self.handler))
+
+
+@pytest.fixture
+def fake(monkeypatch) -> FakeLeigod:
+    """
+    模拟接口; 同时替换所有实例共用的限流器、熔断器和请求合并, 各测试之间互不影响
+    """
+    fake = FakeLeigod()
+    monkeypatch.setattr(aiolegod, "create_client", lambda pool_size=None: fake.client())
+    monkeypatch.setattr(aiolegod.aiolegod, "limiter", ratelimit.AsyncRateLimiter(0, 1))
+    monkeypatch.setattr(aiolegod.aiolegod, "breaker", ratelimit.CircuitBreaker(0, 60))
+    monkeypatch.setattr(aiolegod.aiolegod, "singleflight", singleflight.AsyncSingleFlight())
+    return fake
+
+
+@pytest.fixture
+def app_env(monkeypatch, tmp_path, fake):
+    """
+    网页服务的测试环境: 独立的本地库, 单个账号, 调度任务不加抖动, 租约时长缩短
+    """
+    monkeypatch.chdir(ROOT)
+    monkeypatch.setenv("HISTORY_DB_PATH", str(tmp_path / "leigod.db"))
+    monkeypatch.setenv("token", "token-default-0001")
+    monkeypatch.delenv("tokens", raising=False)
+    monkeypatch.setenv("CHECK_JITTER_SECONDS", "0")
+    # 协调循环每秒执行一次
+    monkeypatch.setenv("LEADER_LEASE_SECONDS", "3")
+    monkeypatch.setenv("serverchan_sendkey", "")
+    return fake
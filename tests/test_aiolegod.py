@@ -0,0 +1,92 @@
+import asyncio
+import time
+
+import httpx
+
+import aiolegod
+
+LATENCY = 0.3
+
+
+def test_parallel_requests_take_about_one_round_trip(fake):
+    """
+    N 个账号同时请求账号信息, 总耗时接近一次请求而不是 N 次, 且每个账号各请求一次
+    """
+    fake.latency = LATENCY
+    count = 10
+
+    async def run():
+        async with fake.client() as client:
+            clients = [aiolegod.aiolegod(token=f"token-{index}", session=client) for index in range(count)]
+            started = time.perf_counter()
+            results = await asyncio.gather(*(leigod_obj.get_account_info() for leigod_obj in clients))
+            return time.perf_counter() - started, results
+
+    elapsed, results = asyncio.run(run())
+    assert all(success for success, _ in results)
+    assert fake.calls["info"] == count
+    assert elapsed < LATENCY * 2
+
+
+def test_request_does_not_block_event_loop(fake):
+    """
+    等待上游响应期间事件循环可以处理其他任务
+    """
+    fake.latency = LATENCY
+
+    async def run():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        async with fake.client() as client:
+            task = asyncio.get_running_loop().create_task(ticker())
+            success, _, _, _ = await aiolegod.aiolegod(token="token-0", session=client).get_usage_details_and_full_data()
+            task.cancel()
+        return success, ticks
+
+    success, ticks = asyncio.run(run())
+    assert success
+    assert fake.calls["log"] == 1
+    assert ticks >= LATENCY / 0.01 / 2
+
+
+def test_identical_concurrent_requests_are_coalesced(fake):
+    """
+    同一账号的相同请求同时发出时只请求上游一次
+    """
+    fake.latency = 0.1
+
+    async def run():
+        async with fake.client() as client:
+            leigod_obj = aiolegod.aiolegod(token="token-0", session=client)
+            return await asyncio.gather(*(leigod_obj.get_account_info() for _ in range(5)))
+
+    results = asyncio.run(run())
+    assert all(success for success, _ in results)
+    assert fake.calls["info"] == 1
+
+
+def test_throttled_request_is_retried(fake, monkeypatch):
+    """
+    403 (请求频繁) 后按退避重试, 成功后返回结果
+    """
+    monkeypatch.setenv("LEIGOD_RETRY_BASE_SECONDS", "0.01")
+    statuses = [403, 403]
+
+    async def handler(request):
+        if statuses:
+            return httpx.Response(statuses.pop(0), text="forbidden")
+        return await fake.handler(request)
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            return await aiolegod.aiolegod(token="token-0", session=client).get_account_info()
+
+    success, info = asyncio.run(run())
+    assert success and info["nickname"] == "nick-toke"
+    assert statuses == []
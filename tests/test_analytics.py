@@ -0,0 +1,53 @@
+from datetime import datetime
+
+import analytics
+import policy
+import store
+
+NOW = datetime(2026, 1, 2, 12, 0, 0)
+
+
+def make_store() -> store.UsageStore:
+    usage_store = store.UsageStore(":memory:")
+    analytics.attach(usage_store)
+    return usage_store
+
+
+def test_pause_time_equal_to_recover_time_is_still_running():
+    """
+    暂停时间等于恢复时间的记录与 policy 的判断一致, 按进行中计算, 不计入已结束的加速
+    """
+    usage_store = make_store()
+    records = [
+        {"recover_time": "2026-01-02 10:00:00", "pause_time": "2026-01-02 10:00:00", "reduce_pause_time": 0},
+        {"recover_time": "2026-01-01 08:00:00", "pause_time": "2026-01-01 10:00:00", "reduce_pause_time": 7200},
+    ]
+    usage_store.upsert_records("default", records)
+    assert policy.status_from_records(records, NOW).paused is False
+
+    buckets = {bucket["bucket"]: bucket for bucket in analytics.query(usage_store, "default", "day", now=NOW)}
+    assert buckets["2026-01-01"]["sessions"] == 1
+    assert buckets["2026-01-01"]["accelerated_seconds"] == 7200
+    # 进行中的加速按 now 实时计算
+    assert buckets["2026-01-02"]["sessions"] == 1
+    assert buckets["2026-01-02"]["accelerated_seconds"] == 2 * 3600
+
+
+def test_outdated_rollups_are_rebuilt(tmp_path):
+    path = str(tmp_path / "leigod.db")
+    usage_store = store.UsageStore(path)
+    analytics.attach(usage_store)
+    usage_store.upsert_records("default", [
+        {"recover_time": "2026-01-02 10:00:00", "pause_time": "2026-01-02 10:00:00", "reduce_pause_time": 0},
+    ])
+    # 模拟旧版本: 该记录被计为已结束的加速, 且只有旧的索引
+    with usage_store.transaction() as conn:
+        conn.execute("INSERT INTO usage_rollups VALUES ('default', 'day', '2026-01-02', 1, 0, 0, 0)")
+        conn.execute("DROP INDEX usage_records_running")
+        conn.execute("CREATE INDEX usage_records_open ON usage_records (account) WHERE pause_time IS NULL")
+    usage_store.close()
+
+    usage_store = store.UsageStore(path)
+    analytics.attach(usage_store)
+    with usage_store.transaction() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM usage_rollups").fetchone()[0] == 0
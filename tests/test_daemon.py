@@ -0,0 +1,107 @@
+import os
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+
+import daemon
+from conftest import ROOT
+
+RUNNER = """
+import sys
+import daemon
+sys.argv = ["daemon.py", "--once", "--config", sys.argv[1]]
+daemon.main()
+import legod
+print("LIMITS", legod.legod.limiter.bucket.rate, legod.legod.breaker.failure_threshold)
+"""
+
+
+def test_config_file_applies_to_rate_limiter_and_breaker(tmp_path):
+    """
+    配置文件中的限流/熔断设置生效: legod 在载入配置文件之后才导入
+    """
+    config_path = tmp_path / "leigod.env"
+    config_path.write_text(
+        "token=token-daemon-0001\n"
+        "LEIGOD_RATE_LIMIT=0\n"
+        "LEIGOD_BREAKER_FAILURES=0\n"
+        "LEIGOD_MAX_RETRIES=0\n"
+        "LEIGOD_API_BASE_URL=http://127.0.0.1:9\n"
+    )
+    env = {key: value for key, value in os.environ.items() if not key.startswith("LEIGOD_") and key not in ("token", "tokens")}
+    output = subprocess.check_output([sys.executable, "-c", RUNNER, str(config_path)], cwd=ROOT, env=env, stderr=subprocess.DEVNULL)
+    assert "LIMITS 0.0 0" in output.decode()
+
+
+class FakeClient(object):
+    def notify(self, message: str):
+        pass
+
+
+def test_notification_dedup_is_bounded():
+    account = daemon.DaemonAccount("default", FakeClient())
+    for index in range(daemon.NOTIFIED_KEYS * 10):
+        account.notify("warning", f"session-{index}", "提醒")
+    assert len(account.notified) == daemon.NOTIFIED_KEYS
+    # 最近的加速仍然去重
+    latest = ("warning", f"session-{daemon.NOTIFIED_KEYS * 10 - 1}")
+    assert latest in account.notified
+
+
+class FailingClient(FakeClient):
+    token = "token-daemon-0001"
+
+    def get_usage_details_and_full_data(self):
+        return False, "请求失败", 0, None
+
+
+def test_failed_check_past_pause_threshold_is_retried_soon(monkeypatch):
+    monkeypatch.setenv("PAUSE_THRESHOLD_MINUTES", "120")
+    monkeypatch.setenv("PAUSE_RETRY_SECONDS", "30")
+    account = daemon.DaemonAccount("default", FailingClient())
+    account.accelerating_since = datetime.now() - timedelta(minutes=180)
+    daemon.check(account)
+    assert account.next_check_at - time.time() <= 30
+
+
+class PausedClient(FakeClient):
+    """
+    账号当前为暂停状态, 但在 last_checked_at 之后恢复过一次加速
+    """
+    token = "token-daemon-0001"
+
+    def __init__(self):
+        recover_time = datetime.now() - timedelta(seconds=30)
+        pause_time = recover_time + timedelta(seconds=10)
+        self.records = [{
+            "recover_time": recover_time.strftime("%Y-%m-%d %H:%M:%S"),
+            "pause_time": pause_time.strftime("%Y-%m-%d %H:%M:%S"),
+            "reduce_pause_time": 10,
+        }]
+        self.messages = []
+        self.probes = 0
+
+    def notify(self, message: str):
+        self.messages.append(message)
+
+    def probe_status(self):
+        self.probes += 1
+        return True, True
+
+    def get_usage_details_and_full_data(self):
+        return True, "ok", 0, {"list": self.records}
+
+
+def test_first_check_after_start_fetches_usage(monkeypatch):
+    """
+    启动后第一次检查不只探测状态: 探测结果与已知状态相同也要请求使用明细, 发现期间的恢复加速
+    """
+    monkeypatch.setenv("USAGE_REFRESH_MINUTES", "360")
+    account = daemon.DaemonAccount("default", PausedClient())
+    account.paused = True
+    account.last_checked_at = time.time() - 60
+    daemon.check(account)
+    assert account.client.probes == 0
+    assert any("曾恢复加速" in message for message in account.client.messages)
+    assert not account.force_usage
@@ -0,0 +1,46 @@
+import asyncio
+
+import events
+
+
+def drain(queue: asyncio.Queue) -> list:
+    frames = []
+    while not queue.empty():
+        frames.append(queue.get_nowait())
+    return frames
+
+
+def test_subscribers_share_encoded_frames():
+    async def run():
+        broker = events.EventBroker()
+        first, second = broker.subscribe(), broker.subscribe()
+        broker.publish("status", {"name": "default", "state": "paused"})
+        return drain(first), drain(second)
+
+    first, second = asyncio.run(run())
+    assert first == second == ['id: 1\nevent: status\ndata: {"name":"default","state":"paused"}\n\n']
+
+
+def test_reconnect_replays_events_after_last_event_id():
+    async def run():
+        broker = events.EventBroker()
+        for index in range(3):
+            broker.publish("status", {"index": index})
+        return drain(broker.subscribe(last_event_id="1")), drain(broker.subscribe(last_event_id="bad"))
+
+    replayed, invalid = asyncio.run(run())
+    assert [frame.split("\n")[0] for frame in replayed] == ["id: 2", "id: 3"]
+    assert invalid == []
+
+
+def test_slow_subscriber_is_disconnected():
+    async def run():
+        broker = events.EventBroker(queue_size=2)
+        slow = broker.subscribe()
+        for index in range(3):
+            broker.publish("status", {"index": index})
+        return broker.subscriber_count, drain(slow)
+
+    subscriber_count, frames = asyncio.run(run())
+    assert subscriber_count == 0
+    assert frames == [None]
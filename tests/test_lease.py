@@ -0,0 +1,34 @@
+import time
+
+import lease
+import store
+
+
+def make_lease(usage_store, holder: str) -> lease.LeaderLease:
+    leader_lease = lease.LeaderLease(usage_store, ttl=60)
+    leader_lease.holder = holder
+    return leader_lease
+
+
+def test_only_one_holder_until_release(tmp_path):
+    usage_store = store.UsageStore(str(tmp_path / "leigod.db"))
+    first, second = make_lease(usage_store, "host:1"), make_lease(usage_store, "host:2")
+    assert first.try_acquire() and first.is_held()
+    assert not second.try_acquire() and not second.is_held()
+    assert second.current_holder() == "host:1"
+
+    first.release()
+    assert not first.is_held()
+    assert second.try_acquire()
+
+
+def test_expired_lease_is_taken_over(tmp_path):
+    usage_store = store.UsageStore(str(tmp_path / "leigod.db"))
+    first, second = make_lease(usage_store, "host:1"), make_lease(usage_store, "host:2")
+    assert first.try_acquire()
+    with usage_store.transaction() as conn:
+        conn.execute("UPDATE leases SET expires_at = ?", (time.time() - 1,))
+    assert second.current_holder() == ""
+    assert second.try_acquire()
+    # 原持有者续约失败
+    assert not first.try_acquire()
@@ -0,0 +1,100 @@
+import json
+
+import requests
+import urllib3
+
+import legod
+import ratelimit
+
+
+class RecordingAdapter(requests.adapters.BaseAdapter):
+    """
+    记录请求参数并返回固定响应, 不发出真实请求
+    """
+
+    def __init__(self, payload: dict):
+        super().__init__()
+        self.payload = payload
+        self.sent = []
+
+    def send(self, request, **kwargs):
+        self.sent.append((request, kwargs))
+        response = requests.models.Response()
+        response.status_code = 200
+        response._content = json.dumps(self.payload).encode()
+        response.request = request
+        response.url = request.url
+        return response
+
+    def close(self):
+        pass
+
+
+def test_session_pool_size_and_timeouts_from_env(monkeypatch):
+    monkeypatch.setenv("LEIGOD_POOL_SIZE", "3")
+    monkeypatch.setenv("LEIGOD_CONNECT_TIMEOUT", "2")
+    monkeypatch.setenv("LEIGOD_READ_TIMEOUT", "7")
+    leigod_obj = legod.legod(token="token-0")
+    adapter = leigod_obj.session.get_adapter("https://webapi.leigod.com")
+    assert adapter._pool_maxsize == 3
+    assert adapter.max_retries.total == 0
+    assert leigod_obj.timeout == (2.0, 7.0)
+
+
+def test_invalid_env_falls_back_to_defaults(monkeypatch):
+    monkeypatch.setenv("LEIGOD_POOL_SIZE", "abc")
+    monkeypatch.setenv("LEIGOD_READ_TIMEOUT", "-1")
+    leigod_obj = legod.legod(token="token-0")
+    assert leigod_obj.session.get_adapter("https://webapi.leigod.com")._pool_maxsize == 10
+    assert leigod_obj.timeout[1] == 10
+
+
+def test_requests_reuse_the_shared_session_with_timeout():
+    """
+    多个实例共用同一个 Session, 每次请求都带超时
+    """
+    session = legod.create_session()
+    adapter = RecordingAdapter({"code": 0, "msg": "ok", "data": {"nickname": "nick", "pause_status_id": 0}})
+    session.mount("https://", adapter)
+    first, second = legod.legod(token="token-0", session=session), legod.legod(token="token-1", session=session)
+    assert first.get_account_info()[0] and second.get_account_info()[0]
+    assert len(adapter.sent) == 2
+    assert all(kwargs["timeout"] == first.timeout for _, kwargs in adapter.sent)
+
+
+class FailingAdapter(RecordingAdapter):
+    """
+    每次请求都抛出 error
+    """
+
+    def __init__(self, error: Exception):
+        super().__init__({})
+        self.error = error
+
+    def send(self, request, **kwargs):
+        self.sent.append((request, kwargs))
+        raise self.error
+
+
+def test_pause_is_retried_only_when_request_was_not_sent(monkeypatch):
+    """
+    暂停不是幂等操作: 只有连接超时和建立连接失败时重试, 连接建立后的错误 (可能已被处理) 不重试
+    """
+    monkeypatch.setenv("LEIGOD_MAX_RETRIES", "2")
+    monkeypatch.setenv("LEIGOD_RETRY_BASE_SECONDS", "0")
+    monkeypatch.setattr(legod.legod, "limiter", ratelimit.RateLimiter(0, 1))
+    monkeypatch.setattr(legod.legod, "breaker", ratelimit.CircuitBreaker(0, 60))
+    refused = urllib3.exceptions.MaxRetryError(None, "/api/user/pause", urllib3.exceptions.NewConnectionError(None, "refused"))
+    reset = urllib3.exceptions.ProtocolError("Connection aborted.", ConnectionResetError())
+    cases = [
+        (requests.exceptions.ConnectTimeout("connect timeout"), 3),
+        (requests.exceptions.ConnectionError(refused), 3),
+        (requests.exceptions.ConnectionError(reset), 1),
+        (requests.exceptions.ReadTimeout("read timeout"), 1),
+    ]
+    for error, expected in cases:
+        session = legod.create_session()
+        adapter = FailingAdapter(error)
+        session.mount("https://", adapter)
+        assert legod.legod(token="token-0", session=session).pause()[0] is False
+        assert len(adapter.sent) == expected, error
@@ -0,0 +1,43 @@
+import pytest
+
+import metrics
+
+
+@pytest.fixture
+def registered(monkeypatch):
+    """
+    测试中创建的指标不留在全局注册表中
+    """
+    monkeypatch.setattr(metrics, "REGISTRY", [])
+    return metrics.REGISTRY
+
+
+def test_counter_and_gauge_render_labels(registered):
+    counter = metrics.Counter("test_total", "计数", ["endpoint"])
+    counter.inc(endpoint="info")
+    counter.inc(2, endpoint="info")
+    gauge = metrics.Gauge("test_gauge", "当前值", ["account"])
+    gauge.set(1.5, account='a"b')
+    gauge.set(3, account="c")
+    gauge.remove(account="c")
+    assert metrics.render() == (
+        "# HELP test_total 计数\n"
+        "# TYPE test_total counter\n"
+        'test_total{endpoint="info"} 3\n'
+        "# HELP test_gauge 当前值\n"
+        "# TYPE test_gauge gauge\n"
+        'test_gauge{account="a\\"b"} 1.5\n'
+    )
+
+
+def test_histogram_buckets_are_cumulative(registered):
+    histogram = metrics.Histogram("test_seconds", "耗时", buckets=(0.1, 1))
+    for value in (0.05, 0.5, 0.7, 5):
+        histogram.observe(value)
+    assert histogram.render().splitlines()[2:] == [
+        'test_seconds_bucket{le="0.1"} 1',
+        'test_seconds_bucket{le="1"} 3',
+        'test_seconds_bucket{le="+Inf"} 4',
+        "test_seconds_sum 6.25",
+        "test_seconds_count 4",
+    ]
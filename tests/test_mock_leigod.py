@@ -0,0 +1,49 @@
+import asyncio
+
+import httpx
+
+import aiolegod
+from bench import mock_leigod
+
+
+def run_with_mock(config: mock_leigod.MockConfig, scenario):
+    """
+    通过 ASGI 直接请求模拟服务, 客户端与 LEIGOD_API_BASE_URL 指向模拟服务时的请求方式相同
+    """
+    async def main():
+        mock_app = mock_leigod.create_app(config)
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=mock_app)) as client:
+            return await scenario(mock_app, lambda token: aiolegod.aiolegod(token=token, session=client, base_url="http://mock"))
+
+    return asyncio.run(main())
+
+
+def test_pause_flow_against_mock_api():
+    async def scenario(mock_app, make_client):
+        leigod_obj = make_client("token-mock-0001")
+        success, info = await leigod_obj.get_account_info()
+        assert success and info["pause_status_id"] == 0
+        assert (await leigod_obj.pause())[0] is True
+        success, info = await leigod_obj.get_account_info()
+        assert info["pause_status_id"] == 1
+        success, message, _, full_data = await leigod_obj.get_usage_details_and_full_data()
+        assert success and "已暂停状态" in message
+        return mock_app.state.request_count
+
+    assert run_with_mock(mock_leigod.MockConfig(history_size=5), scenario) == 4
+
+
+def test_expired_token_and_paging():
+    async def scenario(mock_app, make_client):
+        expired = make_client("expired-0001")
+        success, message = await expired.get_account_info()
+        assert not success and expired.token == ""
+
+        leigod_obj = make_client("token-mock-0002")
+        first = await leigod_obj.get_usage_page(1, 5)
+        last = await leigod_obj.get_usage_page(3, 5)
+        return first, last
+
+    first, last = run_with_mock(mock_leigod.MockConfig(history_size=12), scenario)
+    assert first[0] and len(first[2]) == 5
+    assert last[0] and len(last[2]) == 2
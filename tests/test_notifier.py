@@ -0,0 +1,87 @@
+import asyncio
+
+import pytest
+
+import legod
+import notifier
+import store
+
+
+class SentList(list):
+    """
+    记录发送的通知; results 中的返回值依次使用, 用完后返回成功
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.results = []
+
+    def send(self, sendkey, message, title):
+        self.append((title, message))
+        return self.results.pop(0) if self.results else {"code": 0}
+
+
+@pytest.fixture
+def sent(monkeypatch) -> SentList:
+    sent = SentList()
+    monkeypatch.setattr(legod, "send_notification", sent.send)
+    monkeypatch.setenv("NOTIFY_BATCH_SECONDS", "0.05")
+    monkeypatch.setenv("NOTIFY_RETRY_BASE_SECONDS", "0.01")
+    return sent
+
+
+def run(dispatcher_calls):
+    async def main():
+        dispatcher = notifier.NotificationDispatcher(sendkey="key")
+        dispatcher.start()
+        result = dispatcher_calls(dispatcher)
+        await dispatcher.stop()
+        return dispatcher, result
+
+    return asyncio.run(main())
+
+
+def test_notifications_in_one_window_are_merged(sent):
+    dispatcher, _ = run(lambda dispatcher: [
+        dispatcher.submit("a", "warning", "第一条"),
+        dispatcher.submit("b", "warning", "第二条"),
+    ])
+    assert sent == [("雷神加速器 提示 (2 条)", "- [a] 第一条\n- [b] 第二条")]
+    assert dispatcher.stats["sent"] == 1
+
+
+def test_same_dedup_key_is_sent_once(sent):
+    dispatcher, submitted = run(lambda dispatcher: [
+        dispatcher.submit("a", "warning", "加速超过阈值", dedup_key="session-1"),
+        dispatcher.submit("a", "warning", "加速超过阈值", dedup_key="session-1"),
+        dispatcher.submit("a", "warning", "下一次加速超过阈值", dedup_key="session-2"),
+    ])
+    assert submitted == [True, False, True]
+    assert dispatcher.stats["deduplicated"] == 1
+    assert len(sent) == 1
+
+
+def test_failed_send_is_retried(sent):
+    sent.results.extend([{"code": 1, "message": "限流"}, {"code": 1, "message": "限流"}])
+    dispatcher, _ = run(lambda dispatcher: dispatcher.submit("a", "auto_pause", "已自动暂停"))
+    assert len(sent) == 3
+    assert dispatcher.stats == {"queued": 1, "deduplicated": 0, "sent": 1, "failed": 0}
+
+
+def test_disabled_without_sendkey():
+    async def main():
+        return notifier.NotificationDispatcher(sendkey="").submit("a", "warning", "提醒")
+
+    assert asyncio.run(main()) is False
+
+
+def test_dedup_survives_restart(sent, tmp_path):
+    usage_store = store.UsageStore(str(tmp_path / "leigod.db"))
+
+    async def main():
+        dispatcher = notifier.NotificationDispatcher(sendkey="key", store=usage_store)
+        return dispatcher.submit("a", "warning", "加速超过阈值", dedup_key="session-1")
+
+    assert asyncio.run(main()) is True
+    # 重启后从本地库恢复去重记录
+    assert asyncio.run(main()) is False
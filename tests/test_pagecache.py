@@ -0,0 +1,31 @@
+import gzip
+
+import pagecache
+
+
+def test_accept_encoding_q_values():
+    assert pagecache.parse_accept_encoding("gzip;q=0.5, br, identity;q=bad") == {"gzip": 0.5, "br": 1.0, "identity": 0.0}
+
+
+def test_page_is_rendered_once_per_version():
+    renders = []
+    cache = pagecache.PageCache()
+
+    def render():
+        renders.append(1)
+        return f"page {len(renders)}"
+
+    first = cache.get(1, render).etag
+    assert cache.get(1, render).body == b"page 1"
+    assert cache.get(2, render).body == b"page 2"
+    assert cache.etag != first
+    assert cache.stats == {"hits": 1, "renders": 2}
+
+
+def test_encoded_body_follows_accept_encoding(monkeypatch):
+    monkeypatch.setattr(pagecache, "brotli", None)
+    cache = pagecache.PageCache().get(1, lambda: "页面" * 100)
+    body, encoding = cache.encoded("gzip, br")
+    assert encoding == "gzip" and gzip.decompress(body) == cache.body
+    assert cache.encoded("gzip;q=0") == (cache.body, None)
+    assert cache.encoded("") == (cache.body, None)
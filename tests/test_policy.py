@@ -0,0 +1,132 @@
+from datetime import datetime, timedelta
+
+import policy
+
+NOW = datetime(2026, 1, 1, 12, 0, 0)
+SETTINGS = policy.Settings(warning_minutes=60, pause_minutes=120, interval_minutes=60, margin_seconds=5, retry_seconds=30)
+
+
+def test_accelerating_since_uses_latest_running_record():
+    full_data = {"list": [
+        {"recover_time": "2026-01-01 10:00:00", "pause_time": None},
+        {"recover_time": "2025-12-31 10:00:00", "pause_time": "2025-12-31 11:00:00"},
+    ]}
+    assert policy.accelerating_since(full_data) == datetime(2026, 1, 1, 10, 0, 0)
+
+
+def test_accelerating_since_is_none_when_paused():
+    full_data = {"list": [{"recover_time": "2026-01-01 10:00:00", "pause_time": "2026-01-01 11:00:00"}]}
+    assert policy.accelerating_since(full_data) is None
+    assert policy.accelerating_since({"list": []}) is None
+
+
+def test_resumed_since_finds_session_started_after_last_check():
+    full_data = {"list": [
+        {"recover_time": "2026-01-01 10:00:00", "pause_time": "2026-01-01 11:00:00"},
+        {"recover_time": "2025-12-31 10:00:00", "pause_time": "2025-12-31 11:00:00"},
+    ]}
+    assert policy.resumed_since(full_data, datetime(2026, 1, 1, 9, 0).timestamp()) == "2026-01-01 10:00:00"
+    assert policy.resumed_since(full_data, datetime(2026, 1, 1, 10, 30).timestamp()) is None
+    assert policy.resumed_since(full_data, 0) is None
+
+
+def test_next_deadline_is_the_nearest_future_threshold():
+    since = NOW - timedelta(minutes=30)
+    assert policy.next_deadline(since, NOW, 60, 120) == since + timedelta(minutes=60)
+    since = NOW - timedelta(minutes=90)
+    assert policy.next_deadline(since, NOW, 60, 120) == since + timedelta(minutes=120)
+    assert policy.next_deadline(since, NOW, 60, float("inf")) is None
+    since = NOW - timedelta(minutes=180)
+    assert policy.next_deadline(since, NOW, 60, 120) is None
+
+
+
+def test_next_check_time_waits_for_next_deadline():
+    since = NOW - timedelta(minutes=90)
+    assert policy.next_check_time(since, NOW, settings=SETTINGS) == since + timedelta(minutes=120, seconds=5)
+
+
+def test_next_check_time_polls_when_paused():
+    assert policy.next_check_time(None, NOW, settings=SETTINGS) == NOW + timedelta(minutes=60)
+
+
+def test_next_check_time_retries_soon_past_pause_threshold():
+    """
+    超过暂停阈值仍在加速 (自动暂停失败) 时按 retry_seconds 重试, 不等兜底轮询
+    """
+    since = NOW - timedelta(minutes=180)
+    assert policy.next_check_time(since, NOW, settings=SETTINGS) == NOW + timedelta(seconds=30)
+
+
+def test_next_check_time_retries_soon_when_warning_is_later_than_pause():
+    settings = policy.Settings(300, 120, 60, 5, retry_seconds=30)
+    since = NOW - timedelta(minutes=180)
+    assert policy.next_check_time(since, NOW, settings=settings) == NOW + timedelta(seconds=30)
+
+
+def test_next_check_time_never_pauses():
+    settings = policy.Settings(60, float("inf"), 60, 5, retry_seconds=30)
+    since = NOW - timedelta(minutes=180)
+    assert policy.next_check_time(since, NOW, settings=settings) == NOW + timedelta(minutes=60)
+
+
+def test_decide_notifies_resume_and_auto_pauses():
+    records = [{"recover_time": "2026-01-01 09:00:00", "pause_time": None}]
+    decision = policy.decide(True, 0, policy.status_from_records(records, NOW), SETTINGS)
+    assert decision.paused is False
+    assert decision.action == "auto_pause"
+    assert [kind for kind, _, _ in decision.notifications] == ["resumed", "auto_pause"]
+    assert decision.session_key == "2026-01-01 09:00:00"
+
+    decision = policy.decide(False, 0, policy.status_from_records(records, NOW - timedelta(minutes=90)), SETTINGS)
+    assert decision.action == "warning"
+    paused = [{"recover_time": "2026-01-01 09:00:00", "pause_time": "2026-01-01 10:00:00"}]
+    assert policy.decide(True, NOW.timestamp(), policy.status_from_records(paused, NOW), SETTINGS).notifications == []
+
+
+def test_decide_notifies_pause_and_resume_between_accelerating_checks():
+    checked = datetime(2026, 1, 1, 10, 30).timestamp()
+    previous_since = datetime(2026, 1, 1, 10, 0)
+    # 上次检查时在加速, 期间暂停后又恢复: 开始时间变化
+    records = [
+        {"recover_time": "2026-01-01 11:00:00", "pause_time": None},
+        {"recover_time": "2026-01-01 10:00:00", "pause_time": "2026-01-01 10:40:00"},
+    ]
+    decision = policy.decide(False, checked, policy.status_from_records(records, NOW), SETTINGS, previous_since=previous_since)
+    assert [(kind, key) for kind, key, _ in decision.notifications] == [("resumed", "2026-01-01 11:00:00")]
+    # 上次请求使用记录的时间未知时按开始时间判断
+    decision = policy.decide(False, 0, policy.status_from_records(records, NOW), SETTINGS, previous_since=previous_since)
+    assert [(kind, key) for kind, key, _ in decision.notifications] == [("resumed", "2026-01-01 11:00:00")]
+    # 暂停后恢复, 现已再次暂停
+    records[0]["pause_time"] = "2026-01-01 11:30:00"
+    decision = policy.decide(False, checked, policy.status_from_records(records, NOW), SETTINGS, previous_since=previous_since)
+    assert decision.paused is True
+    assert [(kind, key) for kind, key, _ in decision.notifications] == [("resumed", "2026-01-01 11:00:00")]
+    # 同一次加速仍在进行, 或只是正常暂停: 不提醒
+    running = [{"recover_time": "2026-01-01 10:00:00", "pause_time": None}]
+    for unchanged in (running, records[1:]):
+        decision = policy.decide(False, checked, policy.status_from_records(unchanged, NOW), SETTINGS, previous_since=previous_since)
+        assert "resumed" not in [kind for kind, _, _ in decision.notifications]
+
+
+def test_status_from_probe_keeps_known_start_time():
+    since = NOW - timedelta(minutes=30)
+    status = policy.status_from_probe(False, since, NOW)
+    assert (status.paused, status.accelerating_since, status.duration_minutes) == (False, since, 30)
+    assert status.records is None
+    assert policy.status_from_probe(True, since, NOW).paused is True
+
+
+def test_usage_is_due_only_when_needed():
+    settings = policy.Settings(60, 120, 60, 5, refresh_minutes=360, retry_seconds=30)
+    checked = (NOW - timedelta(minutes=10)).timestamp()
+    # 状态未知或从未请求过使用记录
+    assert policy.usage_due(None, None, NOW, checked, settings)
+    assert policy.usage_due(True, None, NOW, 0, settings)
+    # 暂停中且刚请求过: 只探测
+    assert not policy.usage_due(True, None, NOW, checked, settings)
+    # 加速中, 上次请求后已到警告阈值
+    assert policy.usage_due(False, NOW - timedelta(minutes=65), NOW, checked, settings)
+    assert not policy.usage_due(False, NOW - timedelta(minutes=30), NOW, checked, settings)
+    # 超过 refresh_minutes
+    assert policy.usage_due(True, None, NOW, (NOW - timedelta(minutes=400)).timestamp(), settings)
@@ -0,0 +1,109 @@
+import asyncio
+import threading
+import time
+
+import ratelimit
+
+
+def test_waiters_are_served_in_priority_then_arrival_order():
+    limiter = ratelimit.AsyncRateLimiter(rate=50, burst=1)
+    order = []
+
+    async def acquire(name: str, priority: int):
+        await limiter.acquire(priority)
+        order.append(name)
+
+    async def run():
+        await limiter.acquire()
+        tasks = [asyncio.ensure_future(acquire(f"normal-{index}", ratelimit.NORMAL)) for index in range(3)]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.ensure_future(acquire("pause", ratelimit.HIGH)))
+        await asyncio.gather(*tasks)
+
+    asyncio.run(run())
+    assert order == ["pause", "normal-0", "normal-1", "normal-2"]
+
+
+def test_thread_waiters_are_served_in_priority_then_arrival_order():
+    limiter = ratelimit.RateLimiter(rate=20, burst=1)
+    order = []
+
+    def acquire(name: str, priority: int):
+        limiter.acquire(priority)
+        order.append(name)
+
+    limiter.acquire()
+    threads = []
+    for name, priority in (("normal-0", ratelimit.NORMAL), ("normal-1", ratelimit.NORMAL), ("pause", ratelimit.HIGH)):
+        thread = threading.Thread(target=acquire, args=(name, priority))
+        thread.start()
+        threads.append(thread)
+        time.sleep(0.01)
+    for thread in threads:
+        thread.join(timeout=5)
+    assert order == ["pause", "normal-0", "normal-1"]
+    assert limiter._waiters == []
+
+
+def test_queued_waiters_do_not_poll():
+    """
+    大量排队的请求按令牌补充的节奏被唤醒, 唤醒次数与请求数同一量级, 不随等待时间增长
+    """
+    limiter = ratelimit.AsyncRateLimiter(rate=200, burst=1)
+    dispatches = 0
+    dispatch = limiter._dispatch
+
+    def counting_dispatch(loop):
+        nonlocal dispatches
+        dispatches += 1
+        dispatch(loop)
+
+    limiter._dispatch = counting_dispatch
+
+    async def run():
+        started = time.perf_counter()
+        await asyncio.gather(*(limiter.acquire() for _ in range(100)))
+        return time.perf_counter() - started
+
+    elapsed = asyncio.run(run())
+    assert 0.4 < elapsed < 1.5
+    assert dispatches <= 150
+
+
+def test_cancelled_waiter_does_not_block_queue():
+    limiter = ratelimit.AsyncRateLimiter(rate=50, burst=1)
+
+    async def run():
+        await limiter.acquire()
+        cancelled = asyncio.ensure_future(limiter.acquire())
+        waiter = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        await asyncio.wait_for(waiter, 1)
+
+    asyncio.run(run())
+
+
+def test_unlimited_rate_never_waits():
+    limiter = ratelimit.AsyncRateLimiter(rate=0, burst=1)
+
+    async def run():
+        await asyncio.gather(*(limiter.acquire() for _ in range(1000)))
+
+    asyncio.run(run())
+
+
+def test_breaker_opens_after_consecutive_failures_and_probes_once():
+    breaker = ratelimit.CircuitBreaker(failure_threshold=2, reset_seconds=0.05)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert not breaker.allow()
+    # 暂停请求熔断时也放行
+    assert breaker.allow(bypass=True)
+
+    time.sleep(0.06)
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == breaker.CLOSED and breaker.allow()
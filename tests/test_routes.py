@@ -0,0 +1,421 @@
+import json
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+import lease
+import main
+import store
+
+
+def wait_until(predicate, timeout: float = 5.0):
+    deadline = time.time() + timeout
+    while not predicate():
+        if time.time() > deadline:
+            raise AssertionError("等待超时")
+        time.sleep(0.02)
+
+
+@pytest.fixture
+def client(app_env):
+    with TestClient(main.app) as client:
+        wait_until(lambda: client.get("/readyz").status_code == 200)
+        app_env.calls.clear()
+        yield client
+
+
+def test_update_token_fetches_each_resource_once(client, app_env):
+    response = client.post("/update-token", data={"token": "token-second-0001", "account": "second"}, follow_redirects=False)
+    assert response.status_code == 303
+    assert dict(app_env.calls) == {"info": 1, "log": 1}
+    account = main.app.state.accounts["second"]
+    assert account.nickname == "nick-toke"
+    assert account.is_last_known_state_paused is False
+    assert "Token 更新成功" in account.status_message
+
+
+def test_pause_fetches_each_resource_once(client, app_env):
+    response = client.post("/pause", data={"account": "default"}, follow_redirects=False)
+    assert response.status_code == 303
+    assert dict(app_env.calls) == {"info": 1, "pause": 1, "log": 1}
+    account = main.app.state.accounts["default"]
+    assert account.is_last_known_state_paused is True
+    assert "已暂停状态" in account.status_message
+
+
+def test_read_routes_do_not_call_upstream(client, app_env):
+    for path in ("/", "/metrics", "/api/status", "/api/accounts/default", "/api/accounts/default/records", "/healthz", "/readyz"):
+        assert client.get(path).status_code == 200
+    assert sum(app_env.calls.values()) == 0
+
+
+def test_startup_does_not_wait_for_upstream(app_env):
+    """
+    服务启动后立即可用, 账号在后台预热, 预热完成前 /readyz 返回 503
+    """
+    app_env.latency = 0.5
+    started = time.perf_counter()
+    with TestClient(main.app) as client:
+        assert time.perf_counter() - started < 0.4
+        assert client.get("/healthz").status_code == 200
+        assert client.get("/readyz").status_code == 503
+        assert client.get("/api/accounts/default").json()["state"] == "warming_up"
+        wait_until(lambda: client.get("/readyz").status_code == 200)
+        assert client.get("/api/accounts/default").json()["state"] == "accelerating"
+
+
+def test_env_accounts_are_checked_with_bounded_concurrency(app_env, monkeypatch):
+    """
+    tokens 中的账号与默认账号一起管理, 同时请求雷神接口的账号数不超过 MAX_CONCURRENT_CHECKS
+    """
+    monkeypatch.setenv("tokens", ",".join(f"account-{index}:token-account-{index}" for index in range(5)))
+    monkeypatch.setenv("MAX_CONCURRENT_CHECKS", "2")
+    app_env.latency = 0.05
+    with TestClient(main.app):
+        accounts = main.app.state.accounts
+        assert sorted(accounts) == ["account-0", "account-1", "account-2", "account-3", "account-4", "default"]
+        wait_until(lambda: all(account.nickname for account in accounts.values()))
+    assert app_env.max_in_flight == 2
+
+
+def test_accounts_can_be_added_and_removed(app_env):
+    with TestClient(main.app) as client:
+        state = main.app.state
+        client.post("/update-token", data={"token": "token-second-0001", "account": "second"}, follow_redirects=False)
+        assert state.accounts["second"].nickname == "nick-toke"
+        assert "second" in client.get("/").text
+
+        client.post("/remove-account", data={"account": "second"}, follow_redirects=False)
+        client.post("/remove-account", data={"account": "default"}, follow_redirects=False)
+        # 移除最后一个账号后保留一个空的默认账号
+        assert list(state.accounts) == ["default"]
+        assert not state.accounts["default"].current_token
+
+
+def test_failed_auto_pause_is_retried_soon(app_env, monkeypatch):
+    """
+    超过暂停阈值后自动暂停失败, 按 PAUSE_RETRY_SECONDS 重试, 不等兜底轮询
+    """
+    monkeypatch.setenv("PAUSE_THRESHOLD_MINUTES", "30")
+    monkeypatch.setenv("PAUSE_RETRY_SECONDS", "120")
+    app_env.pause_code = 500
+    with TestClient(main.app):
+        account = main.app.state.accounts["default"]
+        wait_until(lambda: app_env.calls["pause"] >= 1 and account.next_check_at > 0)
+        assert account.is_last_known_state_paused is False
+        assert account.next_check_at - time.time() <= 120
+
+
+def test_dashboard_does_not_wait_for_upstream(app_env, monkeypatch):
+    """
+    页面使用缓存数据渲染; 数据过期时在后台刷新, 每个账号同时只有一个刷新任务
+    """
+    monkeypatch.setenv("DASHBOARD_CACHE_TTL_SECONDS", "0")
+    with TestClient(main.app) as client:
+        account = main.app.state.accounts["default"]
+        wait_until(lambda: account.next_check_at > 0)
+        app_env.calls.clear()
+        app_env.latency = 1
+        started = time.perf_counter()
+        for _ in range(3):
+            assert client.get("/").status_code == 200
+        assert time.perf_counter() - started < 0.5
+        assert app_env.calls["log"] == 1
+
+
+def test_usage_history_is_saved_to_local_store(app_env):
+    app_env.history_size = 8
+    with TestClient(main.app):
+        state = main.app.state
+        account = state.accounts["default"]
+        wait_until(lambda: account.next_check_at > 0)
+        assert state.store.record_count("default") == 8
+        assert len(account.usage_records) == 5
+
+
+def test_export_streams_full_history(app_env):
+    app_env.history_size = 8
+    with TestClient(main.app) as client:
+        response = client.get("/export", params={"account": "default", "format": "csv"})
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/csv")
+        lines = response.text.lstrip("﻿").splitlines()
+        assert lines[0] == "recover_time,pause_time,reduce_pause_time,duration"
+        recover_times = [line.split(",")[0] for line in lines[1:]]
+        assert len(recover_times) == 8
+        assert recover_times == sorted(recover_times)
+
+
+def test_export_ndjson_with_date_range(app_env):
+    app_env.history_size = 4
+    with TestClient(main.app) as client:
+        day = app_env.records("token-default-0001")[1]["recover_time"][:10]
+        response = client.get("/export", params={"format": "ndjson", "start": day, "end": day})
+        assert response.status_code == 200
+        rows = [json.loads(line) for line in response.text.splitlines()]
+        assert [row["recover_time"][:10] for row in rows] == [day]
+        assert rows[0]["duration"]
+
+        assert client.get("/export", params={"format": "xml"}).status_code == 400
+        assert client.get("/export", params={"start": "yesterday"}).status_code == 400
+        assert client.get("/export", params={"account": "missing"}).status_code == 404
+
+
+def test_metrics_endpoint_reports_upstream_and_checks(app_env):
+    with TestClient(main.app) as client:
+        account = main.app.state.accounts["default"]
+        wait_until(lambda: account.next_check_at > 0)
+        text = client.get("/metrics").text
+    assert 'leigod_upstream_request_duration_seconds_count{endpoint="info",code="0"}' in text
+    assert 'leigod_last_successful_check_timestamp_seconds{account="default"}' in text
+    assert 'leigod_acceleration_minutes{account="default"} 6' in text
+
+
+def test_status_api_supports_conditional_get(client, app_env):
+    response = client.get("/api/accounts/default")
+    assert response.status_code == 200
+    payload = response.json()
+    assert payload["state"] == "accelerating"
+    assert payload["acceleration_minutes"] >= 60
+    etag, last_modified = response.headers["etag"], response.headers["last-modified"]
+
+    assert client.get("/api/accounts/default", headers={"If-None-Match": etag}).status_code == 304
+    assert client.get("/api/accounts/default", headers={"If-Modified-Since": last_modified}).status_code == 304
+    assert client.get("/api/accounts/default", headers={"If-None-Match": '"other"'}).status_code == 200
+
+    client.post("/pause", data={"account": "default"}, follow_redirects=False)
+    response = client.get("/api/accounts/default", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["state"] == "paused"
+    assert client.get("/api/accounts/missing").status_code == 404
+
+
+def test_records_api_reads_local_store(client, app_env):
+    records = client.get("/api/accounts/default/records", params={"limit": 2}).json()["records"]
+    assert [record["recover_time"] for record in records] == [
+        record["recover_time"] for record in app_env.records("token-default-0001")[:2]
+    ]
+
+
+def test_pause_publishes_status_event(client, app_env):
+    client.post("/pause", data={"account": "default"}, follow_redirects=False)
+    frames = [frame for _, frame in main.app.state.events._history]
+    status_frames = [frame for frame in frames if "event: status" in frame]
+    assert status_frames and '"state":"paused"' in status_frames[-1]
+
+
+def test_account_state_is_restored_after_restart(app_env):
+    """
+    重启后恢复保存的账号状态, 不再冷启动预热; 页面上更新的 token 优先于未变化的环境变量
+    """
+    with TestClient(main.app) as client:
+        wait_until(lambda: client.get("/readyz").status_code == 200)
+        client.post("/update-token", data={"token": "token-updated-0001", "account": "default"}, follow_redirects=False)
+    app_env.calls.clear()
+    app_env.latency = 0.2
+    with TestClient(main.app) as client:
+        payload = client.get("/api/accounts/default").json()
+        assert payload["state"] == "accelerating"
+        assert main.app.state.accounts["default"].current_token == "token-updated-0001"
+        # 重启后只做一次增量检查 (一页使用记录)
+        wait_until(lambda: app_env.calls["log"] >= 1)
+    assert dict(app_env.calls) == {"log": 1}
+
+
+def test_resume_during_downtime_is_notified_after_restart(app_env, monkeypatch):
+    """
+    暂停状态且刚检查过的账号, 服务停止期间恢复加速后又暂停: 探测状态不变, 重启后第一次检查仍要请求使用记录
+    """
+    submitted = []
+    monkeypatch.setattr(main.notifier.NotificationDispatcher, "submit",
+                        lambda self, account, kind, message, dedup_key=None: submitted.append(kind))
+    with TestClient(main.app) as client:
+        wait_until(lambda: client.get("/readyz").status_code == 200)
+        client.post("/pause", data={"account": "default"}, follow_redirects=False)
+        account = main.app.state.accounts["default"]
+        client.portal.call(main.check_usage_details_task, account)
+        assert account.is_last_known_state_paused and account.last_checked_at
+    time.sleep(1.1)
+    recover_time = time.strftime("%Y-%m-%d %H:%M:%S")
+    pause_time = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(time.time() + 1))
+    app_env.records("token-default-0001").insert(0, {"recover_time": recover_time, "pause_time": pause_time, "reduce_pause_time": 1})
+    app_env.calls.clear()
+    with TestClient(main.app) as client:
+        wait_until(lambda: app_env.calls["log"] >= 1)
+        wait_until(lambda: "resumed" in submitted)
+        assert not main.app.state.accounts["default"].force_usage
+    assert app_env.calls["info"] == 0
+
+
+def test_history_is_backfilled_in_background(app_env, monkeypatch):
+    """
+    预热只同步第一页使用记录, 更早的记录由后台任务逐页回填, 关闭时取消
+    """
+    app_env.history_size = 300
+    monkeypatch.setenv("HISTORY_BACKFILL_INTERVAL_SECONDS", "3600")
+    with TestClient(main.app) as client:
+        wait_until(lambda: client.get("/readyz").status_code == 200)
+        account = main.app.state.accounts["default"]
+        # 后台回填请求一页后等待间隔
+        wait_until(lambda: app_env.calls["log"] >= 2)
+        time.sleep(0.1)
+        assert app_env.calls["log"] == 2
+        assert not main.app.state.store.backfill_complete("default")
+        assert not account.backfill_task.done()
+    assert account.backfill_task.cancelled()
+
+
+def test_analytics_api_reads_rollups(client, app_env):
+    payload = client.get("/api/accounts/default/analytics", params={"period": "day"}).json()
+    # 两次已结束的加速各 1 小时, 加上进行中的 1 小时
+    assert payload["totals"]["sessions"] == 3
+    assert payload["totals"]["accelerated_hours"] >= 3
+    assert client.get("/api/accounts/default/analytics", params={"period": "year"}).status_code == 400
+    assert sum(app_env.calls.values()) == 0
+
+
+@pytest.fixture
+def follower(app_env, tmp_path):
+    """
+    其他进程已持有主节点租约, 本进程为非主节点
+    """
+    usage_store = store.UsageStore(str(tmp_path / "leigod.db"))
+    other = lease.LeaderLease(usage_store)
+    other.holder = "other-host:1"
+    assert other.try_acquire()
+    with usage_store.transaction() as conn:
+        conn.execute("UPDATE leases SET expires_at = ?", (time.time() + 3600,))
+    with TestClient(main.app) as client:
+        wait_until(lambda: client.get("/readyz").status_code == 200)
+        assert client.get("/readyz").json()["role"] == "follower"
+        yield client
+    usage_store.close()
+
+
+def test_follower_submits_token_update_and_pause_to_leader(follower, app_env):
+    follower.post("/update-token", data={"token": "token-second-0001", "account": "second"}, follow_redirects=False)
+    follower.post("/pause", data={"account": "second"}, follow_redirects=False)
+    assert sum(app_env.calls.values()) == 0
+    assert main.app.state.store.take_commands() == [
+        ("second", "update_token", {"token": "token-second-0001"}),
+        ("second", "pause", {}),
+    ]
+
+
+def test_leader_runs_submitted_commands(client, app_env):
+    state = main.app.state
+    state.store.enqueue_command("second", "update_token", {"token": "token-second-0001"}, time.time())
+    state.store.enqueue_command("second", "pause", {}, time.time())
+    wait_until(lambda: state.accounts.get("second") is not None and state.accounts["second"].is_last_known_state_paused is True)
+    assert app_env.calls["pause"] == 1
+    assert state.store.take_commands() == []
+
+
+def test_admin_routes_require_token(client, monkeypatch):
+    assert client.get("/admin/slow").status_code == 404
+    monkeypatch.setenv("ADMIN_TOKEN", "secret")
+    assert client.get("/admin/slow", headers={"Authorization": "Bearer wrong"}).status_code == 403
+    response = client.get("/admin/slow", headers={"Authorization": "Bearer secret"})
+    assert response.status_code == 200
+    assert "operations" in response.json()
+
+
+def test_dashboard_is_cached_until_state_changes(client):
+    first = client.get("/", headers={"Accept-Encoding": "gzip"})
+    assert first.headers["content-encoding"] == "gzip"
+    etag = first.headers["etag"]
+    assert client.get("/", headers={"If-None-Match": etag}).status_code == 304
+
+    client.post("/pause", data={"account": "default"}, follow_redirects=False)
+    response = client.get("/", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+
+
+def test_warm_up_after_ready_invalidates_dashboard(client, monkeypatch):
+    """
+    已就绪后重新预热 (例如非主节点接管) 修改了账号时页面缓存失效, 即使初始化异常
+    """
+    etag = client.get("/").headers["etag"]
+    account = main.app.state.accounts["default"]
+    account.warming_up = True
+
+    async def failing_initialize(account):
+        raise RuntimeError("初始化异常")
+
+    monkeypatch.setattr(main, "initialize_account", failing_initialize)
+    client.portal.call(main.warm_up, main.app.state)
+    response = client.get("/", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert "启动时初始化失败" in response.text
+
+
+def test_unchanged_state_is_checked_with_a_probe(client, app_env):
+    """
+    状态没有变化且未到阈值截止时间时, 定时检查只请求账号信息接口
+    """
+    account = main.app.state.accounts["default"]
+    # 第一次检查请求使用记录, 得到加速开始时间
+    client.portal.call(main.check_usage_details_task, account)
+    app_env.calls.clear()
+    client.portal.call(main.check_usage_details_task, account)
+    assert dict(app_env.calls) == {"info": 1}
+    assert main.get_pause_state(account) == "accelerating"
+
+
+def test_auto_pause_with_expired_token_clears_and_saves_token(app_env, monkeypatch):
+    """
+    自动暂停返回 400006 (Token 失效) 时清空 Token, 更新状态信息并保存, 之后不再检查
+    """
+    monkeypatch.setenv("PAUSE_THRESHOLD_MINUTES", "30")
+    app_env.pause_code = 400006
+    with TestClient(main.app):
+        state = main.app.state
+        account = state.accounts["default"]
+        wait_until(lambda: app_env.calls["pause"] == 1 and not account.current_token)
+        assert account.status_message == "Token 已失效，请重新更新: 登录已失效"
+        wait_until(lambda: state.store.load_account_states(["default"])["default"][0]["token"] == "")
+        assert main.get_pause_state(account) == "no_token"
+
+
+def test_late_expired_response_does_not_clear_updated_token(client, app_env):
+    """
+    旧 Token 的检查还在进行时页面更新了 Token: 旧请求之后返回的 400006 不清空新 Token, 旧检查的结果被丢弃
+    """
+    account = main.app.state.accounts["default"]
+    account.current_token = "expired-old-0001"
+    account.leigod_obj._reset_token("expired-old-0001")
+    app_env.latency = 0.3
+    check = client.portal.start_task_soon(main.check_usage_details_task, account)
+    wait_until(lambda: app_env.in_flight == 1)
+    response = client.post("/update-token", data={"token": "token-new-0001", "account": "default"}, follow_redirects=False)
+    assert response.status_code == 303
+    check.result(timeout=5)
+    assert account.current_token == "token-new-0001"
+    assert account.leigod_obj.token == "token-new-0001"
+    assert main.get_pause_state(account) == "accelerating"
+
+
+def test_shutdown_cancels_page_refresh_before_closing_client(app_env, monkeypatch):
+    """
+    关闭服务时等待页面触发的刷新任务结束, 不会在连接池和本地库关闭后继续使用
+    """
+    monkeypatch.setenv("DASHBOARD_CACHE_TTL_SECONDS", "0")
+    with TestClient(main.app) as client:
+        wait_until(lambda: client.get("/readyz").status_code == 200)
+        app_env.latency = 5
+        client.get("/")
+        state = main.app.state
+        account = state.accounts["default"]
+        wait_until(lambda: account.refresh_task is not None and app_env.calls["log"] >= 2)
+        close_store = state.store.close
+        refresh_done_at_close = []
+
+        def close():
+            refresh_done_at_close.append(account.refresh_task.done())
+            close_store()
+
+        monkeypatch.setattr(state.store, "close", close)
+    assert refresh_done_at_close == [True]
+    assert account.refresh_task.cancelled()
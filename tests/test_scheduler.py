@@ -0,0 +1,64 @@
+import asyncio
+
+import scheduler
+
+
+def test_due_checks_run_once_per_cycle_with_cooldown():
+    async def run():
+        runs = []
+
+        async def run_due():
+            runs.append(asyncio.get_running_loop().time())
+
+        # 检查时间一直没有推后时, 两轮之间至少间隔 min_interval
+        checker = scheduler.CheckScheduler(run_due, lambda: 0, min_interval=0.05)
+        checker.start()
+        await asyncio.sleep(0.12)
+        await checker.stop()
+        return runs
+
+    runs = asyncio.run(run())
+    assert 2 <= len(runs) <= 3
+    assert all(later - earlier >= 0.045 for earlier, later in zip(runs, runs[1:]))
+
+
+def test_wake_recomputes_delay():
+    async def run():
+        runs = []
+        delays = [None]
+
+        async def run_due():
+            runs.append(1)
+            delays[0] = None
+
+        checker = scheduler.CheckScheduler(run_due, lambda: delays[0])
+        checker.start()
+        await asyncio.sleep(0.02)
+        assert runs == []
+        delays[0] = 0
+        checker.wake()
+        await asyncio.sleep(0.02)
+        await checker.stop()
+        return runs, checker.running
+
+    assert asyncio.run(run()) == ([1], False)
+
+
+def test_stop_cancels_running_cycle():
+    async def run():
+        cancelled = []
+
+        async def run_due():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+
+        checker = scheduler.CheckScheduler(run_due, lambda: 0)
+        checker.start()
+        await asyncio.sleep(0.01)
+        await checker.stop()
+        return cancelled
+
+    assert asyncio.run(run()) == [True]
@@ -0,0 +1,50 @@
+import random
+from datetime import timedelta
+
+import pytest
+
+import policy
+import simulate
+
+START = simulate.DEFAULT_START
+SETTINGS = policy.Settings(warning_minutes=60, pause_minutes=120, interval_minutes=60, margin_seconds=5, retry_seconds=30)
+
+
+def run(timeline: simulate.Timeline, error_rate: float = 0.0):
+    return simulate.simulate_account(timeline, SETTINGS, START, START + timedelta(days=2), random.Random(0), error_rate)
+
+
+def test_forgotten_session_is_paused_right_after_threshold():
+    timeline = simulate.Timeline("a", [(START + timedelta(hours=1), None)])
+    totals, max_overrun = run(timeline)
+    assert totals["pauses"] == 1
+    assert totals["notifications.warning"] == 1
+    assert totals["notifications.auto_pause"] == 1
+    # 到点后几秒检查, 加速时长按整分钟计算未到阈值时按 retry_seconds 再检查一次
+    assert max_overrun <= (SETTINGS.margin_seconds + SETTINGS.retry_seconds) / 60
+
+
+def test_failed_pause_is_retried_after_retry_seconds():
+    timeline = simulate.Timeline("a", [(START + timedelta(hours=1), None)])
+    totals, max_overrun = run(timeline, error_rate=0.5)
+    assert totals["pauses"] == 1
+    assert totals["api_errors"] > 0
+    # 每次失败后 30 秒重试, 不等 60 分钟的兜底轮询
+    assert max_overrun < 10
+
+
+def test_timeline_from_records_truncates_overlaps():
+    timeline = simulate.timeline_from_records("a", [
+        {"recover_time": "2025-01-01 12:00:00", "pause_time": None},
+        {"recover_time": "2025-01-01 08:00:00", "pause_time": None},
+        {"recover_time": "bad", "pause_time": None},
+    ])
+    assert [(started.hour, ended.hour if ended else None) for started, ended in timeline.sessions] == [(8, 12), (12, None)]
+
+
+def test_parse_policy():
+    settings = simulate.parse_policy("60:inf:30", margin_seconds=5)
+    assert (settings.warning_minutes, settings.pause_minutes, settings.interval_minutes) == (60, float("inf"), 30)
+    for text in ("60:120", "60:120:0", "a:b:c"):
+        with pytest.raises(SystemExit):
+            simulate.parse_policy(text, margin_seconds=5)
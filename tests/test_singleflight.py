@@ -0,0 +1,67 @@
+import asyncio
+
+import pytest
+
+import singleflight
+
+
+def test_concurrent_calls_share_one_result():
+    flight = singleflight.AsyncSingleFlight()
+    calls = 0
+
+    async def fetch():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return "result"
+
+    async def run():
+        return await asyncio.gather(*(flight.do("info", "key", fetch) for _ in range(5)))
+
+    results = asyncio.run(run())
+    assert [result for result, _ in results] == ["result"] * 5
+    assert sum(leader for _, leader in results) == 1
+    assert calls == 1
+    assert flight.snapshot() == {"info": {"calls": 1, "deduplicated": 4}}
+
+
+def test_cancelled_leader_hands_over_to_waiter():
+    """
+    执行的调用者被取消时, 没有被取消的等待者重新执行并得到结果, 而不是收到 CancelledError
+    """
+    flight = singleflight.AsyncSingleFlight()
+    calls = 0
+
+    async def fetch():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return calls
+
+    async def run():
+        leader = asyncio.ensure_future(flight.do("info", "key", fetch))
+        await asyncio.sleep(0)
+        waiters = [asyncio.ensure_future(flight.do("info", "key", fetch)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await asyncio.gather(*waiters)
+
+    results = asyncio.run(run())
+    assert [result for result, _ in results] == [2, 2, 2]
+    assert sum(leader for _, leader in results) == 1
+    assert calls == 2
+
+
+def test_leader_error_is_shared():
+    flight = singleflight.AsyncSingleFlight()
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError("upstream")
+
+    async def run():
+        return await asyncio.gather(*(flight.do("info", "key", fail) for _ in range(3)), return_exceptions=True)
+
+    assert all(isinstance(result, ValueError) for result in asyncio.run(run()))
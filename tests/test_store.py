@@ -0,0 +1,100 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import store
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+class PagedClient(object):
+    """
+    按页返回使用记录 (最新的在前), fail_pages 中的页请求失败一次
+    """
+
+    def __init__(self, count: int):
+        started = datetime(2026, 1, 1)
+        self.records = [
+            {"recover_time": (started - timedelta(hours=index)).strftime(TIME_FORMAT), "pause_time": None}
+            for index in range(count)
+        ]
+        self.fail_pages = set()
+        self.requests = []
+        self.background_requests = 0
+
+    def add_newest(self, count: int):
+        newest = datetime.strptime(self.records[0]["recover_time"], TIME_FORMAT)
+        for index in range(count, 0, -1):
+            self.records.insert(0, {"recover_time": (newest + timedelta(hours=index)).strftime(TIME_FORMAT), "pause_time": None})
+
+    async def get_usage_page(self, page: int, size: int, background: bool = False) -> tuple:
+        self.requests.append((page, size))
+        if background:
+            self.background_requests += 1
+        if page in self.fail_pages:
+            self.fail_pages.discard(page)
+            return False, "请求失败", []
+        return True, "", [dict(record) for record in self.records[(page - 1) * size:page * size]]
+
+
+def sync(usage_store, client, max_pages: int = 100) -> tuple:
+    return asyncio.run(store.sync_usage_history(usage_store, client, "default", max_pages))
+
+
+def test_backfill_resumes_after_failure():
+    usage_store = store.UsageStore(":memory:")
+    client = PagedClient(200)
+    client.fail_pages = {2}
+
+    assert sync(usage_store, client)[0] is False
+    assert usage_store.record_count("default") == 50
+    assert not usage_store.backfill_complete("default")
+
+    client.add_newest(3)
+    assert sync(usage_store, client)[0] is True
+    assert usage_store.record_count("default") == 203
+    assert usage_store.backfill_complete("default")
+
+    # 回填完成后只请求一页 5 条
+    client.requests.clear()
+    assert sync(usage_store, client)[0] is True
+    assert client.requests == [(1, 5)]
+
+
+def test_backfill_resumes_after_page_limit():
+    usage_store = store.UsageStore(":memory:")
+    client = PagedClient(230)
+
+    sync(usage_store, client, max_pages=2)
+    assert usage_store.record_count("default") == 100
+    assert not usage_store.backfill_complete("default")
+
+    # 中间新增了超过一页的记录, 从已保存的最早记录处继续而不是从头翻
+    client.add_newest(60)
+    client.requests.clear()
+    sync(usage_store, client)
+    assert usage_store.record_count("default") == 290
+    assert usage_store.backfill_complete("default")
+    assert len(client.requests) < 290 // 50 + 3
+
+
+def test_recent_sync_requests_one_page_and_backfill_continues_in_background():
+    """
+    检查和页面请求只同步第一页, 更早的记录由后台以低优先级回填
+    """
+    usage_store = store.UsageStore(":memory:")
+    client = PagedClient(5200)
+    assert asyncio.run(store.sync_recent_usage(usage_store, client, "default"))[0] is True
+    assert client.requests == [(1, store.BACKFILL_PAGE_SIZE)]
+    assert not usage_store.backfill_complete("default")
+
+    # 回填未完成时, 之后的同步仍然只请求一页
+    client.add_newest(2)
+    client.requests.clear()
+    asyncio.run(store.sync_recent_usage(usage_store, client, "default"))
+    assert client.requests == [(1, store.BACKFILL_PAGE_SIZE)]
+
+    client.requests.clear()
+    asyncio.run(store.backfill_usage_history(usage_store, client, "default", max_pages=200, background=True))
+    assert usage_store.record_count("default") == 5202
+    assert usage_store.backfill_complete("default")
+    assert client.background_requests == len(client.requests)
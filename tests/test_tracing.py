@@ -0,0 +1,61 @@
+import threading
+import time
+from collections import deque
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import tracing
+
+
+@pytest.fixture
+def enabled(monkeypatch):
+    """
+    开启追踪, 所有操作都算作慢操作
+    """
+    monkeypatch.setattr(tracing, "ENABLED", True)
+    monkeypatch.setattr(tracing, "SLOW_SECONDS", 0.0)
+    monkeypatch.setattr(tracing, "SLOW_OPERATIONS", deque(maxlen=100))
+    return tracing.SLOW_OPERATIONS
+
+
+def test_span_is_noop_when_disabled(monkeypatch):
+    monkeypatch.setattr(tracing, "ENABLED", False)
+    assert tracing.span("upstream", "info") is tracing.span("render", "index.html")
+
+
+def test_slow_request_log_lists_spans(enabled):
+    app = FastAPI()
+    app.add_middleware(tracing.TimingMiddleware)
+
+    @app.get("/items/{name}")
+    async def item(name: str):
+        with tracing.span("upstream", "info"):
+            pass
+        return {"name": name}
+
+    with TestClient(app) as client:
+        assert client.get("/items/a").status_code == 200
+    kinds = [(operation["kind"], operation["name"]) for operation in enabled]
+    assert kinds == [("upstream", "info"), ("http", "GET /items/{name}")]
+    assert enabled[-1]["detail"].startswith("upstream:info ")
+
+
+def test_profile_samples_other_threads():
+    stop = threading.Event()
+
+    def busy():
+        while not stop.is_set():
+            time.sleep(0.001)
+
+    worker = threading.Thread(target=busy, name="busy-worker")
+    worker.start()
+    try:
+        folded = tracing.profile(0.05, 0.005)
+    finally:
+        stop.set()
+        worker.join()
+    lines = folded.splitlines()
+    assert lines[0].startswith("# ")
+    assert any(line.startswith("busy-worker;") and "test_tracing.py:busy" in line for line in lines[1:])
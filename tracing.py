@@ -0,0 +1,170 @@
+"""
+性能追踪, TRACE_ENABLED=1 时开启:
+- 中间件记录每个路由的耗时, 慢请求的日志中列出请求内各区间 (上游接口、通知、页面渲染) 的耗时
+- span() 记录上游接口调用、通知发送和页面渲染的耗时
+- 超过 TRACE_SLOW_MS 的操作写入日志并保留最近 100 条
+- 定期检测事件循环被阻塞的时长
+关闭时不添加中间件, span() 直接返回同一个空上下文, 开销只有一次函数调用
+采样分析 (profile) 不受开关影响, 只在调用时运行
+"""
+import contextlib
+import contextvars
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from typing import List, Optional, Tuple
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.getenv("TRACE_ENABLED", "0").strip().lower() in ("1", "true", "yes", "on")
+
+
+def _env_seconds(name: str, default_ms: float) -> float:
+    try:
+        return max(0.0, float(os.getenv(name, default_ms))) / 1000
+    except ValueError:
+        return default_ms / 1000
+
+
+SLOW_SECONDS = _env_seconds("TRACE_SLOW_MS", 500)
+# 最近的慢操作, 供 /admin/slow 查看
+SLOW_OPERATIONS = deque(maxlen=100)
+# 当前请求内已结束的区间 [(类型, 名称, 秒)], 不在请求内时为 None
+_request_spans: contextvars.ContextVar[Optional[List[Tuple[str, str, float]]]] = contextvars.ContextVar("request_spans", default=None)
+_NOOP = contextlib.nullcontext()
+_profile_lock = threading.Lock()
+
+
+def record_slow(kind: str, name: str, elapsed: float, detail: str = ""):
+    SLOW_OPERATIONS.append({
+        "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "kind": kind,
+        "name": name,
+        "ms": round(elapsed * 1000, 1),
+        "detail": detail,
+    })
+    logger.warning(f"慢操作: {kind} {name} 耗时 {elapsed * 1000:.0f} ms{f' ({detail})' if detail else ''}")
+
+
+class _Span(object):
+    __slots__ = ("kind", "name", "started")
+
+    def __init__(self, kind: str, name: str):
+        self.kind = kind
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.started
+        metrics.SPAN_DURATION.observe(elapsed, kind=self.kind, name=self.name)
+        spans = _request_spans.get()
+        if spans is not None:
+            spans.append((self.kind, self.name, elapsed))
+        if elapsed >= SLOW_SECONDS:
+            record_slow(self.kind, self.name, elapsed)
+        return False
+
+
+def span(kind: str, name: str):
+    """
+    记录一段操作的耗时, kind 为 upstream / notify / render 等
+    """
+    if not ENABLED:
+        return _NOOP
+    return _Span(kind, name)
+
+
+class TimingMiddleware(object):
+    """
+    纯 ASGI 中间件, 按路由模板 (如 /api/accounts/{name}) 记录耗时, 不包装响应体; SSE 长连接不计入
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        spans: List[Tuple[str, str, float]] = []
+        token = _request_spans.set(spans)
+        response = {"status": 500, "streaming": False}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                response["streaming"] = any(
+                    name == b"content-type" and value.startswith(b"text/event-stream") for name, value in message.get("headers", [])
+                )
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _request_spans.reset(token)
+            if not response["streaming"]:
+                elapsed = time.perf_counter() - started
+                # 未匹配的路径统一记为 unmatched, 避免指标标签数量无限增长
+                route = getattr(scope.get("route"), "path", "unmatched")
+                metrics.HTTP_REQUEST_DURATION.observe(elapsed, method=scope["method"], route=route, status=str(response["status"]))
+                if elapsed >= SLOW_SECONDS:
+                    detail = ", ".join(f"{kind}:{name} {seconds * 1000:.0f} ms" for kind, name, seconds in spans)
+                    record_slow("http", f"{scope['method']} {route}", elapsed, detail)
+
+
+async def monitor_event_loop(interval: float = 0.5):
+    """
+    事件循环阻塞检测: 每次睡眠 interval 秒, 实际多睡的时间就是事件循环被阻塞的时长
+    """
+    # 无界面模式会导入本模块但不使用 asyncio, 延迟导入
+    import asyncio
+
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        lag = max(0.0, time.perf_counter() - started - interval)
+        metrics.EVENT_LOOP_LAG.set(lag)
+        if lag >= SLOW_SECONDS:
+            record_slow("event_loop", "blocked", lag)
+
+
+def profile(seconds: float, interval: float = 0.005) -> str:
+    """
+    采样分析: seconds 秒内每隔 interval 秒抓取一次所有线程的调用栈 (不含本线程)
+    返回折叠栈格式, 每行 "线程名;文件:函数;... 次数", 按次数降序, 可直接用于 flamegraph.pl / speedscope
+    同一时间只允许一个分析, 已有分析在进行时抛出 RuntimeError
+    """
+    if not _profile_lock.acquire(blocking=False):
+        raise RuntimeError("已有采样分析正在进行")
+    try:
+        own = threading.get_ident()
+        stacks: Counter = Counter()
+        samples = 0
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_name}")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                stacks[";".join(reversed(stack))] += 1
+            samples += 1
+            time.sleep(interval)
+    finally:
+        _profile_lock.release()
+    lines = [f"# {samples} samples, {seconds:g} s, interval {interval * 1000:g} ms"]
+    lines.extend(f"{stack} {count}" for stack, count in stacks.most_common())
+    return "\n".join(lines) + "\n"